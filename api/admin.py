@@ -5,7 +5,10 @@ from .models import (
     ProductDetailModel, 
     FormModel,
     ProductPositionModel,
-    TransactionModel
+    TransactionModel,
+    PaymentEventModel,
+    StockHoldModel,
+    UploadModel,
 )
 
 class ProductDetailsInline(admin.StackedInline):
@@ -18,4 +21,7 @@ class ProductModelAdmin(admin.ModelAdmin):
 admin.site.register(ProductImageModel)
 admin.site.register(FormModel)
 admin.site.register(ProductPositionModel)
-admin.site.register(TransactionModel)
\ No newline at end of file
+admin.site.register(TransactionModel)
+admin.site.register(PaymentEventModel)
+admin.site.register(StockHoldModel)
+admin.site.register(UploadModel)
\ No newline at end of file
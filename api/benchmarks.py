@@ -0,0 +1,223 @@
+import json
+import math
+import random
+import statistics
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Final, Iterator, List, Optional
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .cache import catalog_cache
+from .catalog import import_catalog
+from .models import FormModel, ProductModel, ProductPositionModel
+
+
+SEED_BATCH_SIZE: Final[int] = 5000
+BRANDS: Final[int] = 50
+CART_SIZE: Final[int] = 3
+# A median latency more than this share above the baseline is a regression.
+DEFAULT_TOLERANCE: Final[float] = 0.5
+# ...and at least this many seconds above it, so jitter on millisecond
+# endpoints does not fail the check.
+LATENCY_SLACK: Final[float] = 0.002
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    requests: int
+    errors: int
+    throughput: float
+    p50: float
+    p95: float
+    p99: float
+    queries: float
+
+
+def percentile(values: List[float], share: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not values:
+        return 0.0
+
+    return values[max(math.ceil(share * len(values)) - 1, 0)]
+
+
+def generate_products(count: int, rng: random.Random) -> Iterator[dict]:
+    for index in range(count):
+        yield {
+            'title': f'Product {index}',
+            'brand': f'Brand {index % BRANDS}',
+            'description': 'Synthetic benchmark product',
+            'price': str(rng.randint(50, 5000)),
+            'weight': '1',
+            'quantity': 10 ** 6,
+        }
+
+
+def seed_catalog(count: int, rng: random.Random) -> List[int]:
+    # Through the importer, so the search index and table versions are
+    # filled in exactly as for a real catalog.
+    import_catalog(generate_products(count, rng))
+    return list(ProductModel.objects.order_by('pk').values_list('pk', flat=True))
+
+
+def seed_forms(count: int, product_ids: List[int], rng: random.Random) -> List[int]:
+    form_ids = []
+    for start in range(0, count, SEED_BATCH_SIZE):
+        forms = FormModel.objects.bulk_create([
+            FormModel(
+                name=f'Buyer {index}',
+                email=f'buyer{index}@example.com',
+                phone_number='+70000000000',
+                city='City',
+                street='Street',
+                house='1',
+            )
+            for index in range(start, min(start + SEED_BATCH_SIZE, count))
+        ])
+        ProductPositionModel.objects.bulk_create([
+            ProductPositionModel(form=form, product_id=product_id, quantity=1)
+            for form in forms
+            for product_id in rng.sample(product_ids, CART_SIZE)
+        ])
+        form_ids.extend(form.pk for form in forms)
+
+    return form_ids
+
+
+def measure(name: str, send: Callable[[int], object], requests: int, cold_cache: bool,
+            warmup: int = 0) -> ScenarioResult:
+    """
+    Sends `requests` requests one after another, after `warmup` unrecorded
+    ones, and records wall time and database queries of each. With
+    `cold_cache` the catalog response cache is emptied before every request,
+    so reads measure the real query path.
+    """
+    for index in range(warmup):
+        send(requests + index)
+
+    latencies = []
+    queries = 0
+    errors = 0
+
+    started = time.perf_counter()
+    for index in range(requests):
+        if cold_cache:
+            catalog_cache.invalidate()
+
+        request_started = time.perf_counter()
+        with CaptureQueriesContext(connection) as context:
+            response = send(index)
+        latencies.append(time.perf_counter() - request_started)
+
+        queries += len(context.captured_queries)
+        if response.status_code >= 400 or 'error' in response.json():
+            errors += 1
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return ScenarioResult(
+        name=name,
+        requests=requests,
+        errors=errors,
+        throughput=requests / elapsed if elapsed else 0.0,
+        p50=statistics.median(latencies) if latencies else 0.0,
+        p95=percentile(latencies, 0.95),
+        p99=percentile(latencies, 0.99),
+        queries=queries / requests if requests else 0.0,
+    )
+
+
+def run_scenarios(product_ids: List[int], form_ids: List[int], requests: int, rng: random.Random,
+                  cold_cache: bool = True, warmup: int = 0) -> List[ScenarioResult]:
+    """
+    Drives the real endpoints in process through the test client. `pay/`
+    uses one seeded form per request and `payment/status/` then polls the
+    payments it created; the payment provider is whatever gateway is set
+    (the benchmark command installs FakePaymentGateway).
+    """
+    client = Client()
+    payment_ids = []
+
+    def pay(index):
+        response = client.post(
+            reverse('pay'),
+            {'form_id': form_ids[index % len(form_ids)], 'credentials': 'Benchmark'},
+            content_type='application/json',
+        )
+        payment_ids.append(response.json().get('payment_id'))
+        return response
+
+    scenarios = [
+        ('products', lambda index: client.get(reverse('products'), {'page_size': 20})),
+        ('products-filtered', lambda index: client.get(
+            reverse('products'), {'brand': f'Brand {rng.randrange(BRANDS)}', 'price_max': 1000, 'page_size': 20},
+        )),
+        ('product', lambda index: client.get(
+            reverse('products-with-pk', kwargs={'pk': rng.choice(product_ids)}),
+        )),
+        ('forms', lambda index: client.post(
+            reverse('forms'),
+            {
+                'name': 'Buyer', 'email': 'buyer@example.com', 'phone_number': '+70000000000',
+                'city': 'City', 'street': 'Street', 'house': '1',
+                'products': [
+                    {'product': product_id, 'quantity': 1} for product_id in rng.sample(product_ids, CART_SIZE)
+                ],
+            },
+            content_type='application/json',
+        )),
+        ('pay', pay),
+        ('payment-status', lambda index: client.get(
+            reverse('payment-status'), {'payment_id': payment_ids[index % len(payment_ids)]},
+        )),
+    ]
+
+    return [measure(name, send, requests, cold_cache, warmup) for name, send in scenarios]
+
+
+def find_regressions(results: List[ScenarioResult], baseline: dict,
+                     tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """
+    Compares against a saved baseline: more queries per request or errors
+    always regress, latency only beyond `tolerance`, since timings vary
+    between machines and runs. The median is compared rather than the tail,
+    which a single scheduler stall on a busy machine can move.
+    """
+    regressions = []
+    for result in results:
+        expected = baseline['scenarios'].get(result.name)
+        if expected is None:
+            continue
+
+        if result.errors > expected['errors']:
+            regressions.append(f"{result.name}: {result.errors} errors, baseline {expected['errors']}")
+        if result.queries > expected['queries']:
+            regressions.append(f"{result.name}: {result.queries:g} queries/request, baseline {expected['queries']:g}")
+        if result.p50 > expected['p50'] + max(expected['p50'] * tolerance, LATENCY_SLACK):
+            regressions.append(
+                f"{result.name}: p50 {result.p50 * 1000:.2f} ms, baseline {expected['p50'] * 1000:.2f} ms"
+            )
+
+    return regressions
+
+
+def dump_baseline(results: List[ScenarioResult], scale: dict) -> str:
+    return json.dumps({
+        'scale': scale,
+        'scenarios': {result.name: asdict(result) for result in results},
+    }, indent=2) + '\n'
+
+
+def load_baseline(path: str) -> Optional[dict]:
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
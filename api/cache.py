@@ -0,0 +1,230 @@
+import hashlib
+import json
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Final, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+DEFAULT_TIMEOUT: Final[int] = 300
+DEFAULT_MAX_ENTRIES: Final[int] = 1024
+
+
+class CacheBackend:
+    """
+    Minimal key/value interface the catalog cache relies on. It is a subset
+    of the Redis command set, so any redis-py compatible client fits behind
+    `RedisCacheBackend`.
+
+    `blocking` backends do network I/O and are called from a worker thread
+    by the async API; in-process ones are called directly on the loop.
+    """
+    evictions = 0
+    blocking = True
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, timeout: Optional[int] = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def incr(self, key: str) -> int:
+        raise NotImplementedError
+
+    def counter(self, key: str) -> int:
+        return self.get(key) or 0
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+class LRUCacheBackend(CacheBackend):
+    blocking = False
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= self.clock():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        expires_at = self.clock() + timeout if timeout else None
+
+        with self.lock:
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def incr(self, key):
+        with self.lock:
+            value, expires_at = self.entries.get(key, (0, None))
+            value += 1
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+            return value
+
+    def size(self):
+        return len(self.entries)
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Stores pickled values in Redis. `client` can be any object implementing
+    get/set(ex=)/delete/incr, which lets tests pass an in-process fake.
+    """
+
+    def __init__(self, client=None, url: str = None):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url)
+
+        self.client = client
+
+    def get(self, key):
+        value = self.client.get(key)
+        if value is None:
+            return None
+
+        return pickle.loads(value)
+
+    def set(self, key, value, timeout=None):
+        self.client.set(key, pickle.dumps(value), ex=timeout)
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def incr(self, key):
+        return int(self.client.incr(key))
+
+    def counter(self, key):
+        return int(self.client.get(key) or 0)
+
+
+class ResponseCache:
+    """
+    Read-through cache for serialized API responses.
+
+    Keys embed a generation number, so invalidating the whole namespace is a
+    single `incr` on any backend instead of a key scan.
+    """
+
+    def __init__(self, backend: CacheBackend, namespace: str, timeout: int = DEFAULT_TIMEOUT):
+        self.backend = backend
+        self.namespace = namespace
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @property
+    def generation_key(self) -> str:
+        return f'{self.namespace}:generation'
+
+    def make_key(self, *parts) -> str:
+        generation = self.backend.counter(self.generation_key)
+        digest = hashlib.sha1(json.dumps(parts, default=str, sort_keys=True).encode()).hexdigest()
+        return f'{self.namespace}:{generation}:{digest}'
+
+    def get_or_set(self, key_parts, compute: Callable[[], Any]):
+        key = self.make_key(*key_parts)
+        value = self.backend.get(key)
+
+        if value is not None:
+            self.count('hits')
+            return value
+
+        self.count('misses')
+        value = compute()
+        if value is not None:
+            self.backend.set(key, value, self.timeout)
+
+        return value
+
+    async def aget_or_set(self, key_parts, compute: Callable[[], Awaitable[Any]]):
+        """
+        Async twin of `get_or_set`; `compute` is a coroutine function.
+        """
+        key = await self.call_backend(self.make_key, *key_parts)
+        value = await self.call_backend(self.backend.get, key)
+
+        if value is not None:
+            self.count('hits')
+            return value
+
+        self.count('misses')
+        value = await compute()
+        if value is not None:
+            await self.call_backend(self.backend.set, key, value, self.timeout)
+
+        return value
+
+    async def call_backend(self, method, *args):
+        if self.backend.blocking:
+            return await sync_to_async(method, thread_sensitive=False)(*args)
+
+        return method(*args)
+
+    def invalidate(self) -> None:
+        self.backend.incr(self.generation_key)
+
+    def count(self, counter: str) -> None:
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> dict:
+        return {
+            'namespace': self.namespace,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.backend.evictions,
+            'size': self.backend.size(),
+        }
+
+    def reset_stats(self) -> None:
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+
+
+def build_cache(namespace: str, config: dict) -> ResponseCache:
+    backend_class = import_string(config.get('BACKEND', 'api.cache.LRUCacheBackend'))
+    backend = backend_class(**config.get('OPTIONS', {}))
+    return ResponseCache(backend, namespace, timeout=config.get('TIMEOUT', DEFAULT_TIMEOUT))
+
+
+catalog_cache = build_cache('catalog', getattr(settings, 'CATALOG_CACHE', {}))
+
+
+def invalidate_catalog() -> None:
+    catalog_cache.invalidate()
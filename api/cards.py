@@ -0,0 +1,92 @@
+import json
+from typing import Final, Iterable, List
+
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .models import ProductCardModel, ProductDetailModel, ProductModel
+from .serializers import ProductDetailSerializer, ProductImageSerializer, ProductSerializer
+
+
+CARD_BATCH_SIZE: Final[int] = 500
+DETAIL_FIELDS: Final[List[str]] = [
+    'description', 'compound', 'expiration_date', 'quantity', 'number_of_servings', 'serving_weight',
+]
+
+
+def get_detail(product: ProductModel):
+    try:
+        return product.productdetailmodel
+    except ProductDetailModel.DoesNotExist:
+        return None
+
+
+def build_card(product: ProductModel) -> dict:
+    """
+    Card document for a product whose images and detail are loaded. It is
+    rendered through the API serializers, so every field reads exactly as
+    on the regular endpoints; image URLs are relative to the site.
+    """
+    data = ProductSerializer(product).data
+    del data['images'], data['quantity']
+
+    data['images'] = ProductImageSerializer(product.images.all(), many=True).data
+    detail = get_detail(product)
+    data['detail'] = (
+        {name: value for name, value in ProductDetailSerializer(detail).data.items() if name in DETAIL_FIELDS}
+        if detail is not None else None
+    )
+
+    # Round trip through the renderer so decimals and dates are stored as
+    # the JSON the API returns.
+    return json.loads(JSONRenderer().render(data))
+
+
+def refresh_cards(product_ids: Iterable[int]) -> None:
+    """
+    Rebuilds the cards of the given products, CARD_BATCH_SIZE at a time,
+    and drops cards whose product no longer exists.
+    """
+    product_ids = sorted(set(product_ids))
+
+    for start in range(0, len(product_ids), CARD_BATCH_SIZE):
+        batch = product_ids[start:start + CARD_BATCH_SIZE]
+        products = list(
+            ProductModel.objects
+            .filter(pk__in=batch)
+            .select_related('productdetailmodel')
+            .prefetch_related('images')
+        )
+
+        now = timezone.now()
+        ProductCardModel.objects.bulk_create(
+            [
+                ProductCardModel(product=product, title=product.title, data=build_card(product), updated_at=now)
+                for product in products
+            ],
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=['title', 'data', 'updated_at'],
+        )
+
+        missing = set(batch) - {product.pk for product in products}
+        if missing:
+            ProductCardModel.objects.filter(product_id__in=missing).delete()
+
+
+def rebuild_cards() -> int:
+    product_ids = list(ProductModel.objects.values_list('pk', flat=True))
+    refresh_cards(product_ids)
+    return len(product_ids)
+
+
+def get_cards():
+    """
+    Cards with live stock from ProductModel, one joined query per page.
+    """
+    return ProductCardModel.objects.annotate(quantity=F('product__quantity'))
+
+
+def card_data(card: ProductCardModel) -> dict:
+    return dict(card.data, quantity=card.quantity)
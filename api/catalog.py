@@ -0,0 +1,297 @@
+import csv
+import itertools
+import json
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Final, Iterable, Iterator, List, Optional
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from .cards import refresh_cards
+from .models import ProductDetailModel, ProductImageModel, ProductModel
+from .search import get_search_backend
+from .signals import mark_catalog_changed
+
+
+IMPORT_BATCH_SIZE: Final[int] = 1000
+EXPORT_CHUNK_SIZE: Final[int] = 2000
+
+PRODUCT_FIELDS: Final[List[str]] = [
+    'title', 'brand', 'description', 'price', 'price_currency', 'weight', 'quantity',
+]
+DETAIL_FIELDS: Final[List[str]] = [
+    'description', 'compound', 'expiration_date', 'quantity', 'number_of_servings', 'serving_weight',
+]
+# Flat row layout shared by CSV and JSONL; detail columns carry a prefix
+# and `images` lists ProductImageModel ids (';'-separated in CSV).
+CATALOG_FIELDS: Final[List[str]] = (
+    ['id'] + PRODUCT_FIELDS + ['images'] + [f'detail_{name}' for name in DETAIL_FIELDS]
+)
+FORMATS: Final[List[str]] = ['csv', 'jsonl']
+
+
+class CatalogFormatError(ValueError):
+    def __init__(self, line: int, message: str):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+
+
+@dataclass
+class ImportStats:
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    skipped_images: int = 0
+
+
+def guess_format(path: str) -> str:
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_rows(file, fmt: str) -> Iterator[dict]:
+    if fmt == 'csv':
+        for row in csv.DictReader(file):
+            row['images'] = [image for image in (row.get('images') or '').split(';') if image]
+            yield row
+        return
+
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+class RowWriter:
+    def __init__(self, file, fmt: str):
+        self.file = file
+        self.fmt = fmt
+        if fmt == 'csv':
+            self.writer = csv.DictWriter(file, fieldnames=CATALOG_FIELDS)
+            self.writer.writeheader()
+
+    def write(self, row: dict) -> None:
+        if self.fmt == 'csv':
+            self.writer.writerow(dict(row, images=';'.join(map(str, row['images']))))
+        else:
+            self.file.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+
+def optional(value):
+    return None if value in ('', None) else value
+
+
+def parse_decimal(value, name):
+    try:
+        number = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"{name} must be a number")
+
+    if not number.is_finite():
+        raise ValueError(f"{name} must be a number")
+
+    return number
+
+
+def parse_int(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an integer")
+
+
+def build_product(row: dict) -> ProductModel:
+    product_id = optional(row.get('id'))
+    return ProductModel(
+        id=parse_int(product_id, 'id') if product_id is not None else None,
+        title=row['title'],
+        brand=optional(row.get('brand')),
+        description=row.get('description') or '',
+        price=parse_decimal(row['price'], 'price'),
+        price_currency=optional(row.get('price_currency')) or 'RUB',
+        weight=parse_decimal(row['weight'], 'weight'),
+        quantity=parse_int(row['quantity'], 'quantity'),
+    )
+
+
+def build_detail(row: dict) -> Optional[ProductDetailModel]:
+    values = {name: optional(row.get(f'detail_{name}')) for name in DETAIL_FIELDS}
+    if all(value is None for value in values.values()):
+        return None
+
+    for name in ('expiration_date', 'quantity', 'number_of_servings', 'serving_weight'):
+        if values[name] is not None:
+            values[name] = parse_int(values[name], f'detail_{name}')
+
+    return ProductDetailModel(
+        description=values['description'] or '',
+        compound=values['compound'] or '',
+        expiration_date=values['expiration_date'] or 0,
+        quantity=values['quantity'] or 0,
+        number_of_servings=values['number_of_servings'],
+        serving_weight=values['serving_weight'],
+    )
+
+
+def import_batch(rows: List[dict], first_line: int, stats: ImportStats) -> List[int]:
+    """
+    Upserts one batch: products by id (rows without an id are inserted),
+    details by product and image links replaced for rows that list them.
+    """
+    products, details, images = [], [], []
+    for line, row in enumerate(rows, first_line):
+        try:
+            products.append(build_product(row))
+            details.append(build_detail(row))
+            images.append([parse_int(image, 'images') for image in row.get('images') or []])
+        except (KeyError, ValueError) as ex:
+            message = f"missing column {ex}" if isinstance(ex, KeyError) else str(ex)
+            raise CatalogFormatError(line, message)
+
+    with transaction.atomic():
+        existing = [product for product in products if product.id is not None]
+        new = [product for product in products if product.id is None]
+
+        if existing:
+            known = set(
+                ProductModel.objects.filter(pk__in=[product.id for product in existing]).values_list('pk', flat=True)
+            )
+            stats.updated += len(known)
+            stats.created += len(existing) - len(known)
+            ProductModel.objects.bulk_create(
+                existing,
+                update_conflicts=True,
+                unique_fields=['id'],
+                update_fields=PRODUCT_FIELDS,
+            )
+            if len(known) < len(existing):
+                reset_product_sequence()
+        if new:
+            ProductModel.objects.bulk_create(new)
+            stats.created += len(new)
+
+        for product, detail in zip(products, details):
+            if detail is not None:
+                detail.product_id = product.pk
+
+        ProductDetailModel.objects.bulk_create(
+            [detail for detail in details if detail is not None],
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=DETAIL_FIELDS,
+        )
+
+        stats.skipped_images += link_images(products, images)
+
+    return [product.pk for product in products]
+
+
+def reset_product_sequence():
+    """
+    Moves the product id sequence past ids inserted explicitly, so products
+    created later without an id do not collide with them. A no-op on
+    backends without sequences, such as SQLite.
+    """
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [ProductModel]):
+            cursor.execute(sql)
+
+
+def link_images(products: List[ProductModel], images: List[List[int]]) -> int:
+    through = ProductModel.images.through
+    requested = {image for product_images in images for image in product_images}
+    known = set(ProductImageModel.objects.filter(pk__in=requested).values_list('pk', flat=True))
+
+    linked = [product.pk for product, product_images in zip(products, images) if product_images]
+    through.objects.filter(productmodel_id__in=linked).delete()
+    through.objects.bulk_create(
+        [
+            through(productmodel_id=product.pk, productimagemodel_id=image)
+            for product, product_images in zip(products, images)
+            for image in product_images
+            if image in known
+        ],
+        ignore_conflicts=True,
+    )
+
+    return sum(1 for product_images in images for image in product_images if image not in known)
+
+
+def import_catalog(rows: Iterable[dict], batch_size: int = IMPORT_BATCH_SIZE, first_line: int = 1,
+                   progress=None) -> ImportStats:
+    """
+    Imports rows `batch_size` at a time, so memory stays bounded by one
+    batch. Each batch commits on its own; bulk writes bypass model signals,
+    so the search index and product cards are refreshed per batch and the
+    catalog cache once.
+    `first_line` is the source line of the first row, for error messages.
+    """
+    stats = ImportStats()
+    rows = iter(rows)
+    search = get_search_backend()
+
+    line = first_line
+    while batch := list(itertools.islice(rows, batch_size)):
+        product_ids = import_batch(batch, line, stats)
+        search.index(product_ids)
+        refresh_cards(product_ids)
+
+        line += len(batch)
+        stats.rows += len(batch)
+        if progress is not None:
+            progress(stats)
+
+    if stats.rows:
+        mark_catalog_changed(ProductModel)
+
+    return stats
+
+
+def export_rows(chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[dict]:
+    """
+    Streams the catalog in primary key order. `iterator()` reads through a
+    server-side cursor where the database has one; image ids are fetched
+    per chunk rather than per product.
+    """
+    columns = ['id'] + PRODUCT_FIELDS + [f'productdetailmodel__{name}' for name in DETAIL_FIELDS]
+    products = (
+        ProductModel.objects
+        .order_by('pk')
+        .values_list(*columns)
+        .iterator(chunk_size=chunk_size)
+    )
+
+    while chunk := list(itertools.islice(products, chunk_size)):
+        images = get_image_ids([values[0] for values in chunk])
+
+        for values in chunk:
+            row = dict(zip(CATALOG_FIELDS[:len(PRODUCT_FIELDS) + 1], values))
+            row['price'] = str(row['price'])
+            row['weight'] = str(row['weight'])
+            row['images'] = images.get(row['id'], [])
+            row.update(zip([f'detail_{name}' for name in DETAIL_FIELDS], values[len(PRODUCT_FIELDS) + 1:]))
+            yield row
+
+
+def get_image_links(product_ids: List[int]):
+    return (
+        ProductModel.images.through.objects
+        .filter(productmodel_id__in=product_ids)
+        .order_by('productmodel_id', 'productimagemodel_id')
+        .values_list('productmodel_id', 'productimagemodel_id')
+    )
+
+
+def get_image_ids(product_ids: List[int]) -> Dict[int, List[int]]:
+    images: Dict[int, List[int]] = {}
+    for product_id, image_id in get_image_links(product_ids):
+        images.setdefault(product_id, []).append(image_id)
+
+    return images
+
+
+async def aget_image_ids(product_ids: List[int]) -> Dict[int, List[int]]:
+    images: Dict[int, List[int]] = {}
+    async for product_id, image_id in get_image_links(product_ids):
+        images.setdefault(product_id, []).append(image_id)
+
+    return images
@@ -0,0 +1,92 @@
+import hashlib
+from functools import wraps
+
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
+
+from .models import TableVersionModel
+
+
+def get_table_version(request, model) -> TableVersionModel:
+    versions = request.__dict__.setdefault('_table_versions', {})
+    if model not in versions:
+        versions[model] = TableVersionModel.get_for_model(model)
+
+    return versions[model]
+
+
+async def aget_table_version(request, model) -> TableVersionModel:
+    versions = request.__dict__.setdefault('_table_versions', {})
+    if model not in versions:
+        versions[model] = await TableVersionModel.aget_for_model(model)
+
+    return versions[model]
+
+
+def format_etag(request, version: TableVersionModel) -> str:
+    digest = hashlib.sha1(request.build_absolute_uri().encode()).hexdigest()[:16]
+    return f'{version.table}-{version.version}-{digest}'
+
+
+def table_etag(model):
+    def etag_func(request, *args, **kwargs):
+        return format_etag(request, get_table_version(request, model))
+
+    return etag_func
+
+
+def table_last_modified(model):
+    def last_modified_func(request, *args, **kwargs):
+        return get_table_version(request, model).updated_at
+
+    return last_modified_func
+
+
+def table_condition(model):
+    """
+    Conditional GET for views whose output depends only on `model`'s table.
+
+    ETags come from the table's version stamp and the request URL, so a
+    matching `If-None-Match` is answered with 304 before anything is
+    queried or serialized. The stamp is read once per request; a view that
+    caches its body keys it on that same `get_table_version`, so a body is
+    never sent under the ETag of a version it does not belong to.
+    """
+    return method_decorator(condition(
+        etag_func=table_etag(model),
+        last_modified_func=table_last_modified(model),
+    ))
+
+
+def async_table_condition(model):
+    """
+    `table_condition` for async function views. Django's `condition` calls
+    its ETag function synchronously, which cannot query the database from
+    the event loop, so the version stamp is read with the async ORM here.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await view(request, *args, **kwargs)
+
+            version = await aget_table_version(request, model)
+            etag = quote_etag(format_etag(request, version))
+            last_modified = int(version.updated_at.timestamp()) if version.updated_at else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+
+            if response.status_code == 200:
+                if last_modified and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(last_modified)
+                response.headers.setdefault('ETag', etag)
+
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,124 @@
+import csv
+import io
+import json
+from typing import AsyncIterator, Dict, Final, Iterator, List, Optional
+
+from asgiref.sync import sync_to_async
+
+from .filters import filter_transactions
+from .models import ProductPositionModel, TransactionModel
+
+
+ORDER_CHUNK_SIZE: Final[int] = 2000
+
+TRANSACTION_COLUMNS: Final[Dict[str, str]] = {
+    'transaction_id': 'pk',
+    'timestamp': 'timestamp',
+    'status': 'transaction_status',
+    'payment_id': 'payment_id',
+    'amount': 'amount',
+    'amount_currency': 'amount_currency',
+    'reverted': 'reverted',
+    'form_id': 'form_id',
+    'name': 'form__name',
+    'email': 'form__email',
+    'phone_number': 'form__phone_number',
+    'city': 'form__city',
+    'street': 'form__street',
+    'house': 'form__house',
+    'comment': 'form__comment',
+}
+# One row per transaction with its order joined in; `items` lists the
+# order's positions ("product:quantity;..." in CSV).
+ORDER_FIELDS: Final[List[str]] = list(TRANSACTION_COLUMNS) + ['items']
+CONTENT_TYPES: Final[Dict[str, str]] = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def get_export_queryset(params):
+    """
+    Transactions matching the `status`, `form_id`, `date_from` and
+    `date_to` filters of the transaction list. Filters are parsed here, so
+    invalid ones fail before anything is streamed.
+    """
+    return filter_transactions(TransactionModel.objects.all(), params).values_list(*TRANSACTION_COLUMNS.values())
+
+
+def get_cart_items(form_ids: List[int]) -> Dict[int, List[dict]]:
+    """
+    {form id: its positions as FormSerializer renders them}, in one query.
+    """
+    items: Dict[int, List[dict]] = {}
+    positions = (
+        ProductPositionModel.objects
+        .filter(form_id__in=form_ids)
+        .order_by('form_id', 'pk')
+        .values_list('form_id', 'product_id', 'quantity')
+    )
+    for form_id, product_id, quantity in positions:
+        items.setdefault(form_id, []).append({'product': product_id, 'quantity': quantity})
+
+    return items
+
+
+def fetch_chunk(queryset, after: Optional[int], chunk_size: int) -> List[dict]:
+    """
+    The next `chunk_size` transactions after the `after` watermark. Each
+    chunk is its own keyset query on the primary key rather than a read
+    from one long cursor: it needs no open transaction, works behind
+    pgbouncer (where server-side cursors are disabled and `iterator()`
+    would buffer the whole result), and any chunk can be resumed from.
+    """
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after)
+
+    rows = [dict(zip(TRANSACTION_COLUMNS, values)) for values in queryset.order_by('pk')[:chunk_size]]
+    items = get_cart_items(list({row['form_id'] for row in rows}))
+
+    for row in rows:
+        row['timestamp'] = row['timestamp'].isoformat()
+        row['amount'] = None if row['amount'] is None else str(row['amount'])
+        row['items'] = items.get(row['form_id'], [])
+
+    return rows
+
+
+def export_orders(queryset, after: Optional[int] = None,
+                  chunk_size: int = ORDER_CHUNK_SIZE) -> Iterator[List[dict]]:
+    """
+    Yields the export in chunks of rows in transaction id order; the last
+    row's `transaction_id` is the watermark to resume after.
+    """
+    while chunk := fetch_chunk(queryset, after, chunk_size):
+        yield chunk
+        after = chunk[-1]['transaction_id']
+
+
+async def aexport_orders(queryset, after: Optional[int] = None,
+                         chunk_size: int = ORDER_CHUNK_SIZE) -> AsyncIterator[List[dict]]:
+    while chunk := await sync_to_async(fetch_chunk)(queryset, after, chunk_size):
+        yield chunk
+        after = chunk[-1]['transaction_id']
+
+
+def encode_header(fmt: str) -> str:
+    if fmt != 'csv':
+        return ''
+
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(ORDER_FIELDS)
+    return buffer.getvalue()
+
+
+def encode_rows(rows: List[dict], fmt: str) -> str:
+    if fmt != 'csv':
+        return ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=ORDER_FIELDS)
+    for row in rows:
+        writer.writerow(dict(row, items=';'.join(f"{item['product']}:{item['quantity']}" for item in row['items'])))
+
+    return buffer.getvalue()
@@ -0,0 +1,42 @@
+import hashlib
+from typing import Final
+
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+
+CHECKSUM_CHUNK_SIZE: Final[int] = 64 * 1024
+
+
+def file_checksum(file) -> str:
+    """
+    SHA-256 of a Django `File`, read in chunks so large uploads never sit
+    in memory whole.
+    """
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks(CHECKSUM_CHUNK_SIZE):
+        digest.update(chunk)
+
+    file.seek(0)
+    return digest.hexdigest()
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """
+    Spools every multipart file straight to a temporary file, whatever its
+    size, and hashes it while the chunks arrive; the result is left on the
+    uploaded file as `checksum`.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.checksum = self.digest.hexdigest()
+        return file
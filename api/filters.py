@@ -0,0 +1,101 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+def parse_decimal(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValidationError({name: "must be a number"})
+
+
+def parse_id(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: "must be an integer id"})
+
+
+def parse_moment(params, name, next_day=False):
+    """
+    Parses an ISO date or datetime into an aware datetime. A bare date
+    means its midnight, or the following midnight when `next_day` is set,
+    so ranges stay plain comparisons on the indexed column.
+    """
+    value = params.get(name)
+    if not value:
+        return None
+
+    try:
+        day = parse_date(value)
+        moment = None if day else parse_datetime(value)
+    except ValueError:
+        day = moment = None
+
+    if day is not None:
+        moment = datetime.combine(day + timedelta(days=1) if next_day else day, time.min)
+    elif moment is None:
+        raise ValidationError({name: "must be an ISO 8601 date or datetime"})
+
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+
+    return moment
+
+
+def filter_products(queryset, params):
+    """
+    Applies `brand`, `price_min`, `price_max` and `in_stock`; each has a
+    matching index on ProductModel.
+    """
+    brand = params.get('brand')
+    price_min = parse_decimal(params, 'price_min')
+    price_max = parse_decimal(params, 'price_max')
+
+    if brand:
+        queryset = queryset.filter(brand=brand)
+    if price_min is not None:
+        queryset = queryset.filter(price__gte=price_min)
+    if price_max is not None:
+        queryset = queryset.filter(price__lte=price_max)
+    if params.get('in_stock', '').lower() in TRUE_VALUES:
+        queryset = queryset.filter(quantity__gt=0)
+
+    return queryset
+
+
+def filter_transactions(queryset, params):
+    """
+    Applies `status`, `form_id`, `date_from` and `date_to`; dates without a
+    time cover the whole day.
+    """
+    transaction_status = params.get('status')
+    form_id = parse_id(params, 'form_id')
+    date_from = parse_moment(params, 'date_from')
+    date_to = parse_moment(params, 'date_to', next_day=True)
+
+    if transaction_status:
+        queryset = queryset.filter(transaction_status=transaction_status)
+    if form_id is not None:
+        queryset = queryset.filter(form_id=form_id)
+    if date_from is not None:
+        queryset = queryset.filter(timestamp__gte=date_from)
+    if date_to is not None:
+        queryset = queryset.filter(timestamp__lt=date_to)
+
+    return queryset
@@ -0,0 +1,140 @@
+import logging
+import traceback
+from datetime import timedelta
+from typing import Callable, Dict, Final, List
+
+from django.db.models import Avg, Count, F, Min
+from django.utils import timezone
+
+from .models import JobModel
+
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_BASE: Final[int] = 5  # seconds
+BACKOFF_MAX: Final[int] = 3600
+STALE_AFTER: Final[int] = 600
+STATS_WINDOW: Final[int] = 3600
+
+JOB_HANDLERS: Dict[str, Callable[..., None]] = {}
+
+
+def job(name: str):
+    """
+    Registers a job handler. Handlers receive the job payload as keyword
+    arguments and signal a retryable failure by raising.
+    """
+    def decorator(handler):
+        JOB_HANDLERS[name] = handler
+        return handler
+
+    return decorator
+
+
+def enqueue(name: str, payload: dict = None, delay: int = 0, max_attempts: int = 5) -> JobModel:
+    """
+    Inserts the job in the caller's transaction, so it becomes visible to
+    workers only together with the change that produced it.
+    """
+    if name not in JOB_HANDLERS:
+        raise KeyError(f"unknown job {name}")
+
+    return JobModel.objects.create(
+        name=name,
+        payload=payload or {},
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts,
+    )
+
+
+def get_backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX))
+
+
+def claim_jobs(limit: int) -> List[JobModel]:
+    """
+    Claims due jobs with a conditional UPDATE per candidate, which is safe
+    with several workers on both SQLite and Postgres without row locks.
+    """
+    now = timezone.now()
+    candidates = (
+        JobModel.objects
+        .filter(status='queued', run_at__lte=now)
+        .order_by('run_at', 'pk')
+        .values_list('pk', flat=True)[:limit]
+    )
+
+    claimed = []
+    for job_id in candidates:
+        updated = JobModel.objects.filter(pk=job_id, status='queued').update(
+            status='running',
+            started_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if updated:
+            claimed.append(job_id)
+
+    return list(JobModel.objects.filter(pk__in=claimed).order_by('run_at', 'pk'))
+
+
+def run_job(job: JobModel) -> bool:
+    try:
+        JOB_HANDLERS[job.name](**job.payload)
+    except Exception as ex:
+        job.last_error = ''.join(traceback.format_exception(ex))
+        job.finished_at = timezone.now()
+
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_at = job.finished_at + get_backoff(job.attempts)
+            logger.warning("%s failed, retrying at %s: %s", job, job.run_at, ex)
+        else:
+            job.status = 'failed'
+            logger.error("%s failed permanently: %s", job, ex)
+
+        job.save(update_fields=['status', 'run_at', 'last_error', 'finished_at'])
+        return False
+
+    job.status = 'done'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'finished_at'])
+    return True
+
+
+def requeue_stale_jobs(stale_after: int = STALE_AFTER) -> int:
+    """
+    Puts back jobs whose worker died mid-run.
+    """
+    deadline = timezone.now() - timedelta(seconds=stale_after)
+    return JobModel.objects.filter(status='running', started_at__lt=deadline).update(status='queued')
+
+
+def run_pending_jobs(limit: int = 100) -> int:
+    jobs = claim_jobs(limit)
+    for claimed_job in jobs:
+        run_job(claimed_job)
+
+    return len(jobs)
+
+
+def queue_stats() -> dict:
+    now = timezone.now()
+    depth = dict(JobModel.objects.values_list('status').annotate(count=Count('pk')).order_by())
+    oldest = JobModel.objects.filter(status='queued', run_at__lte=now).aggregate(oldest=Min('run_at'))['oldest']
+    latency = JobModel.objects.filter(
+        status='done',
+        finished_at__gte=now - timedelta(seconds=STATS_WINDOW),
+    ).aggregate(
+        wait=Avg(F('started_at') - F('run_at')),
+        run=Avg(F('finished_at') - F('started_at')),
+    )
+
+    return {
+        'queued': depth.get('queued', 0),
+        'running': depth.get('running', 0),
+        'done': depth.get('done', 0),
+        'failed': depth.get('failed', 0),
+        'oldest_queued_seconds': (now - oldest).total_seconds() if oldest else 0,
+        'avg_wait_seconds': latency['wait'].total_seconds() if latency['wait'] else 0,
+        'avg_run_seconds': latency['run'].total_seconds() if latency['run'] else 0,
+    }
@@ -0,0 +1,93 @@
+import random
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+from api.benchmarks import (
+    DEFAULT_TOLERANCE,
+    dump_baseline,
+    find_regressions,
+    load_baseline,
+    run_scenarios,
+    seed_catalog,
+    seed_forms,
+)
+from api.payments import FakePaymentGateway, set_payment_gateway
+
+
+DEFAULT_BASELINE = settings.BASE_DIR / 'benchmarks' / 'api_baseline.json'
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a throwaway test database with a synthetic catalog and orders, drives the API "
+        "in process with a fake payment provider and checks the results against a baseline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--forms', type=int, default=10000)
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--payment-latency', type=float, default=0.0)
+        parser.add_argument('--warm-cache', action='store_true',
+                            help="keep the catalog response cache between requests")
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+        parser.add_argument('--save-baseline', action='store_true')
+        parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+
+    def handle(self, *args, **options):
+        scale = {
+            'products': options['products'],
+            'forms': options['forms'],
+            'requests': options['requests'],
+            'seed': options['seed'],
+            'warm_cache': options['warm_cache'],
+        }
+        rng = random.Random(options['seed'])
+
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        set_payment_gateway(FakePaymentGateway(latency=options['payment_latency']))
+        try:
+            with override_settings(DEBUG=False, DATABASE_REPLICAS=[], ALLOWED_HOSTS=['testserver']):
+                self.stdout.write(f"Seeding {options['products']} products and {options['forms']} forms")
+                product_ids = seed_catalog(options['products'], rng)
+                form_ids = seed_forms(options['forms'], product_ids, rng)
+
+                results = run_scenarios(
+                    product_ids, form_ids, options['requests'], rng,
+                    cold_cache=not options['warm_cache'], warmup=options['warmup'],
+                )
+        finally:
+            set_payment_gateway(None)
+            teardown_databases(old_config, verbosity=0)
+
+        self.stdout.write(
+            f"{'scenario':<20} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'errors':>7}"
+        )
+        for result in results:
+            self.stdout.write(
+                f"{result.name:<20} {result.throughput:>8.0f} {result.p50 * 1000:>8.2f} "
+                f"{result.p95 * 1000:>8.2f} {result.p99 * 1000:>8.2f} {result.queries:>8.1f} {result.errors:>7}"
+            )
+
+        if options['save_baseline']:
+            with open(options['baseline'], 'w') as file:
+                file.write(dump_baseline(results, scale))
+            self.stdout.write(f"Saved baseline to {options['baseline']}")
+            return
+
+        baseline = load_baseline(options['baseline'])
+        if baseline is None:
+            self.stdout.write(f"No baseline at {options['baseline']}; run with --save-baseline to create one")
+            return
+        if baseline['scale'] != scale:
+            raise CommandError(f"baseline was recorded at {baseline['scale']}, not {scale}")
+
+        regressions = find_regressions(results, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError("regressions against baseline:\n" + '\n'.join(regressions))
+
+        self.stdout.write(self.style.SUCCESS("No regressions against baseline"))
@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from api.models import ProductModel
+from api.serializers import FormSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Measures queries and wall time of order creation versus cart size"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 50, 100])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'cart size':>10} {'queries':>8} {'ms/order':>10}")
+
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    queries, elapsed = self.measure(size, options['repeat'])
+                    raise Rollback()
+            except Rollback:
+                pass
+
+            self.stdout.write(f"{size:>10} {queries:>8} {elapsed * 1000:>10.2f}")
+
+    def measure(self, size, repeat):
+        products = ProductModel.objects.bulk_create([
+            ProductModel(
+                title=f'Benchmark {i}',
+                description='Benchmark product',
+                price=100,
+                weight=1,
+                quantity=1000,
+            )
+            for i in range(size)
+        ])
+        data = {
+            'name': 'Benchmark',
+            'email': 'benchmark@example.com',
+            'phone_number': '+70000000000',
+            'city': 'City',
+            'street': 'Street',
+            'house': '1',
+            'products': [{'product': product.pk, 'quantity': 1} for product in products],
+        }
+
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as context:
+            for _ in range(repeat):
+                serializer = FormSerializer(data=data)
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+
+        elapsed = (time.perf_counter() - started) / repeat
+        return len(context.captured_queries) // repeat, elapsed
@@ -0,0 +1,88 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+from django.test.utils import setup_databases, teardown_databases
+from rest_framework.renderers import JSONRenderer
+
+from api.benchmarks import seed_catalog, seed_forms
+from api.catalog import get_image_ids
+from api.exports import get_cart_items
+from api.models import FormModel, ProductImageModel, ProductModel, ProductPositionModel
+from api.serializers import FormSerializer, ProductSerializer
+from api.views import FormView, ProductView
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares rows per second of the DRF serializers and the values() fast path "
+        "(api.fastjson) on product and order lists, and checks that both produce the same bytes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--forms', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            product_ids = seed_catalog(options['products'], rng)
+            seed_forms(options['forms'], product_ids, rng)
+            results = [
+                ('products', options['products'], *self.compare(
+                    self.render_products, self.encode_products, options['repeat'],
+                )),
+                ('forms', options['forms'], *self.compare(
+                    self.render_forms, self.encode_forms, options['repeat'],
+                )),
+            ]
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        self.stdout.write(f"{'list':<10} {'rows':>8} {'serializer rows/s':>18} {'fast rows/s':>12} {'speedup':>8}")
+        for name, rows, slow, fast in results:
+            self.stdout.write(f"{name:<10} {rows:>8} {rows / slow:>18.0f} {rows / fast:>12.0f} {slow / fast:>7.1f}x")
+
+    def compare(self, render, encode, repeat):
+        """
+        Best of `repeat` runs of each path, both including their queries.
+        """
+        expected, actual = render(), encode()
+        if expected != actual:
+            raise CommandError("fast serialization output differs from the serializers")
+
+        return self.best_time(render, repeat), self.best_time(encode, repeat)
+
+    def best_time(self, run, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - started)
+
+        return min(timings)
+
+    def render_products(self):
+        products = ProductModel.objects.prefetch_related(
+            Prefetch('images', queryset=ProductImageModel.objects.order_by('pk')),
+        )
+        return JSONRenderer().render(ProductSerializer(products, many=True).data)
+
+    def render_forms(self):
+        forms = FormModel.objects.prefetch_related(
+            Prefetch('productpositionmodel_set', queryset=ProductPositionModel.objects.order_by('pk')),
+        )
+        return JSONRenderer().render(FormSerializer(forms, many=True).data)
+
+    def encode_products(self):
+        rows = list(ProductModel.objects.values(*ProductView.fast_serializer.columns))
+        return ProductView.fast_serializer.encode(rows, {'images': get_image_ids([row['id'] for row in rows])})
+
+    def encode_forms(self):
+        rows = list(FormModel.objects.values(*FormView.fast_serializer.columns))
+        return FormView.fast_serializer.encode(rows, {'products': get_cart_items([row['id'] for row in rows])})
@@ -0,0 +1,58 @@
+import asyncio
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+
+DEFAULT_PATHS = ['/api/products/', '/api/products/?page_size=20', '/api/product-images/']
+
+
+class Command(BaseCommand):
+    help = "Measures throughput and latency of a running server (compare runserver with serve)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--warmup', type=int, default=50)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'path':<32} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+
+        for path in options['paths']:
+            rate, latencies, errors = asyncio.run(self.measure(path, options))
+            latencies.sort()
+            self.stdout.write(
+                f"{path:<32} {rate:>8.0f} {statistics.median(latencies) * 1000:>8.2f} "
+                f"{latencies[int(len(latencies) * 0.95) - 1] * 1000:>8.2f} {errors:>7}"
+            )
+
+    async def measure(self, path, options):
+        import httpx
+
+        limits = httpx.Limits(max_connections=options['concurrency'])
+        async with httpx.AsyncClient(base_url=options['base_url'], limits=limits, timeout=30) as client:
+            for _ in range(options['warmup']):
+                await client.get(path)
+
+            remaining = options['requests']
+            latencies = []
+            errors = 0
+
+            async def worker():
+                nonlocal remaining, errors
+                while remaining > 0:
+                    remaining -= 1
+                    started = time.perf_counter()
+                    response = await client.get(path)
+                    latencies.append(time.perf_counter() - started)
+                    if response.status_code != 200:
+                        errors += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*[worker() for _ in range(options['concurrency'])])
+            elapsed = time.perf_counter() - started
+
+        return len(latencies) / elapsed, latencies, errors
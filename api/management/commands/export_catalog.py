@@ -0,0 +1,34 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.catalog import EXPORT_CHUNK_SIZE, FORMATS, RowWriter, export_rows, guess_format
+
+
+class Command(BaseCommand):
+    help = "Streams products, details and image links to a CSV or JSONL file ('-' for stdout)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the file extension")
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or guess_format(path)
+        started = time.perf_counter()
+
+        file = sys.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+        try:
+            writer = RowWriter(file, fmt)
+            rows = 0
+            for row in export_rows(options['chunk_size']):
+                writer.write(row)
+                rows += 1
+        finally:
+            if file is not sys.stdout:
+                file.close()
+
+        elapsed = time.perf_counter() - started
+        self.stderr.write(f"Exported {rows} rows in {elapsed:.2f}s, {rows / max(elapsed, 1e-9):.0f} rows/s")
@@ -0,0 +1,47 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.catalog import FORMATS, IMPORT_BATCH_SIZE, CatalogFormatError, guess_format, import_catalog, read_rows
+
+
+class Command(BaseCommand):
+    help = "Upserts products, details and image links from a CSV or JSONL file ('-' for stdin)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the file extension")
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or guess_format(path)
+        started = time.perf_counter()
+
+        def progress(stats):
+            if options['verbosity'] > 1:
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"{stats.rows} rows, {stats.rows / elapsed:.0f} rows/s")
+
+        file = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            stats = import_catalog(
+                read_rows(file, fmt),
+                batch_size=options['batch_size'],
+                first_line=2 if fmt == 'csv' else 1,
+                progress=progress,
+            )
+        except CatalogFormatError as ex:
+            raise CommandError(f"{path}, {ex}")
+        finally:
+            if file is not sys.stdin:
+                file.close()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Imported {stats.rows} rows ({stats.created} created, {stats.updated} updated) "
+            f"in {elapsed:.2f}s, {stats.rows / max(elapsed, 1e-9):.0f} rows/s"
+        )
+        if stats.skipped_images:
+            self.stderr.write(f"Skipped {stats.skipped_images} links to unknown images")
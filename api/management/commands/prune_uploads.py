@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.uploads import prune_uploads
+
+
+class Command(BaseCommand):
+    help = "Deletes resumable image uploads that stopped receiving chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--expire-after', type=int, help="Idle seconds before an upload is dropped")
+
+    def handle(self, *args, **options):
+        pruned = prune_uploads(options['expire_after'])
+        self.stdout.write(f"Pruned {pruned} uploads")
@@ -0,0 +1,15 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.cards import rebuild_cards
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the precomputed product card of every product"
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = rebuild_cards()
+
+        self.stdout.write(f"Rebuilt {count} product cards in {time.perf_counter() - started:.2f}s")
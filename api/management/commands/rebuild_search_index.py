@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Creates the product search index if needed and re-indexes every product"
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        started = time.perf_counter()
+
+        backend.create_index()
+        backend.index()
+
+        self.stdout.write(f"Rebuilt {type(backend).__name__} index in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,77 @@
+import json
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.jobs import STALE_AFTER, claim_jobs, queue_stats, requeue_stale_jobs, run_job
+from api.stock import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = "Runs queued background jobs (order emails, stock settlement) and releases expired stock holds"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Number of worker threads")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds between polls of an idle queue")
+        parser.add_argument('--stale-after', type=int, default=STALE_AFTER, help="Seconds before a running job is considered abandoned")
+        parser.add_argument('--sweep-interval', type=float, default=30.0, help="Seconds between releases of expired stock holds")
+        parser.add_argument('--once', action='store_true', help="Run the currently due jobs and exit")
+        parser.add_argument('--stats', action='store_true', help="Print queue depth and latency and exit")
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(json.dumps(queue_stats(), indent=2))
+            return
+
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        workers = options['workers']
+        requeue_stale_jobs(options['stale_after'])
+
+        next_sweep = 0.0
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            in_flight = set()
+
+            while self.running:
+                if time.monotonic() >= next_sweep:
+                    self.sweep_holds()
+                    next_sweep = time.monotonic() + options['sweep_interval']
+
+                free = workers - len(in_flight)
+                jobs = claim_jobs(free) if free else []
+
+                for job in jobs:
+                    in_flight.add(executor.submit(self.run_in_thread, job))
+
+                if options['once'] and not jobs and not in_flight:
+                    break
+
+                if in_flight:
+                    _, in_flight = wait(in_flight, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                elif not jobs:
+                    close_old_connections()
+                    time.sleep(options['poll_interval'])
+
+            wait(in_flight)
+
+    def run_in_thread(self, job):
+        try:
+            ok = run_job(job)
+        finally:
+            close_old_connections()
+
+        self.stdout.write(f"{job} {'done' if ok else 'failed'} in attempt {job.attempts}")
+
+    def sweep_holds(self):
+        released = release_expired_holds()
+        if released:
+            self.stdout.write(f"Released {released} expired stock holds")
+
+    def stop(self, *args):
+        self.running = False
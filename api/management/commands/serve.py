@@ -0,0 +1,46 @@
+import os
+import shutil
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Runs the ASGI application under gunicorn with uvicorn workers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind', default=os.environ.get('BIND', '0.0.0.0:8000'))
+        parser.add_argument(
+            '--workers', type=int, default=int(os.environ.get('WEB_CONCURRENCY', 0)),
+            help="Worker processes; defaults to one per CPU, as each runs an event loop",
+        )
+        parser.add_argument('--timeout', type=int, default=30)
+        parser.add_argument('--max-requests', type=int, default=10000,
+                            help="Recycle a worker after this many requests")
+
+    def handle(self, *args, **options):
+        gunicorn = shutil.which('gunicorn')
+        if gunicorn is None:
+            raise CommandError("gunicorn is not installed")
+
+        workers = options['workers'] or os.cpu_count() or 1
+
+        # Django runs sync code of each ASGI request on its own thread, so
+        # persistent connections are never reused there; see
+        # backend/settings_production.py.
+        os.environ.setdefault('CONN_MAX_AGE', '0')
+
+        command = [
+            gunicorn, 'backend.asgi:application',
+            '--worker-class', 'uvicorn.workers.UvicornWorker',
+            '--bind', options['bind'],
+            '--workers', str(workers),
+            '--timeout', str(options['timeout']),
+            '--graceful-timeout', str(options['timeout']),
+            '--keep-alive', '5',
+            '--max-requests', str(options['max_requests']),
+            '--max-requests-jitter', str(options['max_requests'] // 10),
+        ]
+
+        self.stdout.write(f"Starting {workers} ASGI workers on {options['bind']}")
+        self.stdout.flush()
+        os.execv(gunicorn, command)
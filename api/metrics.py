@@ -0,0 +1,311 @@
+import bisect
+import hmac
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, Final, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework.permissions import BasePermission
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import ListSerializer
+
+from .fastjson import RawJSON
+
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS: Final[Tuple[float, ...]] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS: Final[Tuple[float, ...]] = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS: Final[Tuple[float, ...]] = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+# Upper bound of statements kept per request for the slow request log.
+MAX_LOGGED_QUERIES: Final[int] = 50
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def format_labels(labels: Tuple[Tuple[str, str], ...], **extra) -> str:
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def format_number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    In-process counters and histograms rendered in the Prometheus text
+    format. Every worker process keeps its own registry, so with several
+    gunicorn workers each scrape sees the worker that answered it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[str, Dict[tuple, float]] = {}
+        self.histograms: Dict[str, Dict[tuple, Histogram]] = {}
+        self.help: Dict[str, str] = {}
+
+    def inc(self, name: str, labels: dict, amount: float = 1, help: str = '') -> None:
+        key = tuple(labels.items())
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+            self.help.setdefault(name, help)
+
+    def observe(self, name: str, labels: dict, value: float, buckets: Tuple[float, ...],
+                help: str = '') -> None:
+        key = tuple(labels.items())
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+            self.help.setdefault(name, help)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f'# HELP {name} {self.help[name]}')
+                lines.append(f'# TYPE {name} counter')
+                for labels, value in series.items():
+                    lines.append(f'{name}{format_labels(labels)} {format_number(value)}')
+
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f'# HELP {name} {self.help[name]}')
+                lines.append(f'# TYPE {name} histogram')
+                for labels, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{format_labels(labels, le=format_number(bound))} {cumulative}')
+
+                    lines.append(f'{name}_bucket{format_labels(labels, le="+Inf")} {histogram.count}')
+                    lines.append(f'{name}_sum{format_labels(labels)} {format_number(histogram.sum)}')
+                    lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+@dataclass
+class RequestMetrics:
+    queries: int = 0
+    query_time: float = 0.0
+    serialization_time: float = 0.0
+    serializing: bool = False
+    log_sql: bool = False
+    sql: List[Tuple[float, str]] = field(default_factory=list)
+
+
+# Set only for sampled requests; asgiref copies it into sync_to_async
+# threads, so queries made by async views are counted too.
+current_request: ContextVar[Optional[RequestMetrics]] = ContextVar('current_request', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current_request.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        metrics.queries += 1
+        metrics.query_time += duration
+        if metrics.log_sql and len(metrics.sql) < MAX_LOGGED_QUERIES:
+            metrics.sql.append((duration, sql))
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def track_serialization():
+    metrics = current_request.get()
+    # Serializers nested in a timed one are part of its time.
+    if metrics is None or metrics.serializing:
+        yield
+        return
+
+    start = time.perf_counter()
+    metrics.serializing = True
+    try:
+        yield
+    finally:
+        metrics.serializing = False
+        metrics.serialization_time += time.perf_counter() - start
+
+
+class TimedSerializerMixin:
+    """
+    Counts building a serializer's `data`, where DRF does most of its work,
+    as serialization time. Serializers using it set TimedListSerializer as
+    their Meta.list_serializer_class, so lists are timed as well.
+    """
+
+    @property
+    def data(self):
+        with track_serialization():
+            return super().data
+
+
+class TimedListSerializer(TimedSerializerMixin, ListSerializer):
+    pass
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """
+    Times rendering, and sends RawJSON from the fast serialization path as
+    it is unless indented output was asked for.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with track_serialization():
+            if isinstance(data, RawJSON):
+                if not self.get_indent(accepted_media_type, renderer_context or {}):
+                    return data.content
+
+                data = json.loads(data.content)
+
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+@contextmanager
+def track_call(service: str, operation: str):
+    """
+    Times an outbound call, e.g. to the payment provider, labelled with its
+    outcome. Calls are rare next to requests, so they are never sampled.
+    """
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        registry.observe(
+            'external_call_duration_seconds',
+            {'service': service, 'operation': operation, 'outcome': outcome},
+            time.perf_counter() - start,
+            LATENCY_BUCKETS,
+            help='Outbound call latency.',
+        )
+
+
+def can_read_metrics(request) -> bool:
+    """
+    Staff users, or a scraper sending METRICS['TOKEN'] as a bearer token.
+    """
+    token = settings.METRICS['TOKEN']
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_staff)
+
+
+class CanReadMetrics(BasePermission):
+    def has_permission(self, request, view):
+        return can_read_metrics(request)
+
+
+def get_route(request) -> str:
+    # The URL pattern rather than the path keeps label cardinality bounded.
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else 'unmatched'
+
+
+def get_response_size(response) -> Optional[int]:
+    if response.streaming:
+        length = response.get('Content-Length')
+        return int(length) if length else None
+
+    return len(response.content)
+
+
+def record_request(request, response, duration: float, metrics: Optional[RequestMetrics],
+                   slow_request_ms: float) -> None:
+    route = get_route(request)
+    labels = {'method': request.method, 'route': route}
+
+    registry.inc(
+        'http_requests_total', dict(labels, status=str(response.status_code)),
+        help='Requests by route, method and status.',
+    )
+    registry.observe(
+        'http_request_duration_seconds', labels, duration, LATENCY_BUCKETS,
+        help='Request latency by route.',
+    )
+
+    if metrics is not None:
+        registry.observe(
+            'http_request_db_queries', labels, metrics.queries, QUERY_BUCKETS,
+            help='Database queries per sampled request.',
+        )
+        registry.observe(
+            'http_request_db_duration_seconds', labels, metrics.query_time, LATENCY_BUCKETS,
+            help='Time spent in the database per sampled request.',
+        )
+        registry.observe(
+            'http_request_serialization_duration_seconds', labels, metrics.serialization_time, LATENCY_BUCKETS,
+            help='Time spent serializing and rendering responses per sampled request.',
+        )
+        size = get_response_size(response)
+        if size is not None:
+            registry.observe(
+                'http_response_size_bytes', labels, size, SIZE_BUCKETS,
+                help='Response body size per sampled request.',
+            )
+
+    if duration * 1000 >= slow_request_ms:
+        log_slow_request(request, route, duration, metrics)
+
+
+def log_slow_request(request, route: str, duration: float, metrics: Optional[RequestMetrics]) -> None:
+    if metrics is None:
+        logger.warning("Slow request %s %s (%s): %.0f ms", request.method, request.path, route, duration * 1000)
+        return
+
+    logger.warning(
+        "Slow request %s %s (%s): %.0f ms, %s queries in %.0f ms, serialization %.0f ms%s",
+        request.method, request.path, route, duration * 1000,
+        metrics.queries, metrics.query_time * 1000, metrics.serialization_time * 1000,
+        ''.join(f'\n  {query_time * 1000:.1f} ms: {sql}' for query_time, sql in metrics.sql),
+    )
@@ -0,0 +1,111 @@
+import random
+import time
+from typing import Final
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .metrics import RequestMetrics, current_request, record_request
+from .routers import request_routing
+
+
+STICKY_COOKIE: Final[str] = 'primary_db'
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Gives every request its own routing state and keeps a client on the
+    primary database for REPLICA_STICKY_SECONDS after a request that wrote,
+    e.g. a checkout, so its follow-up reads don't hit a lagging replica.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        with request_routing(pinned=STICKY_COOKIE in request.COOKIES) as state:
+            return self.process_response(self.get_response(request), state)
+
+    async def __acall__(self, request):
+        with request_routing(pinned=STICKY_COOKIE in request.COOKIES) as state:
+            return self.process_response(await self.get_response(request), state)
+
+    def process_response(self, response, state):
+        if state.wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                STICKY_COOKIE, '1',
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Records per-route request counts and latency for every request, and for
+    a METRICS['SAMPLE_RATE'] share of them also query counts and time,
+    serialization time and response size. Unsampled requests cost two clock
+    reads; requests slower than METRICS['SLOW_REQUEST_MS'] are logged, with
+    their SQL when sampled and METRICS['LOG_SQL'] is set.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS['ENABLED']:
+            raise MiddlewareNotUsed()
+
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        metrics, token = self.start()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            self.finish(token)
+
+        self.record(request, response, time.perf_counter() - start, metrics)
+        return response
+
+    async def __acall__(self, request):
+        metrics, token = self.start()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.finish(token)
+
+        self.record(request, response, time.perf_counter() - start, metrics)
+        return response
+
+    def start(self):
+        if random.random() >= settings.METRICS['SAMPLE_RATE']:
+            return None, None
+
+        metrics = RequestMetrics(log_sql=settings.METRICS['LOG_SQL'])
+        return metrics, current_request.set(metrics)
+
+    def finish(self, token):
+        if token is not None:
+            current_request.reset(token)
+
+    def record(self, request, response, duration, metrics):
+        record_request(request, response, duration, metrics, settings.METRICS['SLOW_REQUEST_MS'])
@@ -1,12 +1,13 @@
-from datetime import timezone
+from django.utils import timezone
 import uuid
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from typing import Final
 from django.core.validators import MinValueValidator
 from djmoney.models.fields import MoneyField
-from django.db import transaction
 from django.shortcuts import get_object_or_404
 
+from .files import file_checksum
+
 
 MAX_LENGTH: Final[int] = 255 
 
@@ -22,12 +23,43 @@ class ProductImageModel(models.Model):
         verbose_name='Фотография',
     )
 
+    checksum = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        db_index=True,
+        verbose_name='Контрольная сумма',
+    )
+
     class Meta:
         verbose_name_plural = "Фотографии товара"
+        indexes = [
+            models.Index(fields=["title", "id"]),
+        ]
 
     def __str__(self) -> str:
         return f"Фотография: {self.title}"
 
+    def save(self, *args, **kwargs):
+        # Thumbnails are cached under the source checksum, so it has to
+        # follow every new upload; older rows get it on first thumbnail.
+        # Streamed uploads arrive with the checksum already computed.
+        if self.image and not self.image._committed:
+            self.checksum = getattr(self.image.file, 'checksum', None) or file_checksum(self.image)
+
+            # Identical photos share one stored file instead of a copy each.
+            duplicate = (
+                ProductImageModel.objects
+                .filter(checksum=self.checksum)
+                .exclude(pk=self.pk)
+                .values_list('image', flat=True)
+                .first()
+            )
+            if duplicate:
+                self.image = duplicate
+
+        super().save(*args, **kwargs)
+
 
 class ProductModel(models.Model):
     title = models.CharField(
@@ -67,6 +99,16 @@ class ProductModel(models.Model):
     class Meta:
         ordering = ["title"]
         verbose_name_plural = "Товары"
+        indexes = [
+            models.Index(fields=["title", "id"]),
+            models.Index(fields=["brand", "price"]),
+            models.Index(fields=["price"]),
+            models.Index(
+                fields=["title", "id"],
+                condition=models.Q(quantity__gt=0),
+                name="product_in_stock_title_idx",
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"Товар: {self.title}"
@@ -110,6 +152,34 @@ class ProductDetailModel(models.Model):
     )
 
 
+class ProductCardModel(models.Model):
+    """
+    Precomputed product card: product fields with its images (URLs and
+    thumbnail variants) and details, kept in sync by api.cards. Stock is
+    not stored here; it changes on every checkout and is joined in from
+    ProductModel when cards are read.
+    """
+    product = models.OneToOneField(
+        ProductModel,
+        verbose_name="Продукт",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='card',
+    )
+    title = models.CharField(max_length=MAX_LENGTH, verbose_name="Название")
+    data = models.JSONField()
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name_plural = "Карточки товаров"
+        indexes = [
+            models.Index(fields=["title", "product"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"Карточка: {self.title}"
+
+
 class FormModel(models.Model):
     PHONE_NUMBER_LENGTH: Final = 20
  
@@ -169,12 +239,15 @@ class ProductPositionModel(models.Model):
 
 class TransactionModel(models.Model):
     form = models.ForeignKey(to=FormModel, on_delete=models.CASCADE)
-    payment_id = models.CharField(max_length=50, db_index=True)  # API ID
-    payment_url = models.CharField(max_length=120, db_index=True) # API URL
+    payment_id = models.CharField(max_length=50, db_index=True, blank=True)  # API ID
+    payment_url = models.CharField(max_length=120, db_index=True, blank=True) # API URL
     secret_key = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    idempotency_key = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    amount = MoneyField(max_digits=14, decimal_places=2, default_currency='RUB', null=True, blank=True)
 
     timestamp = models.DateTimeField(default=timezone.now)
     reverted = models.BooleanField(default=False)
+    stock_settled = models.BooleanField(default=False)
 
     TRANSACTION_STATUS_CHOICES = [
         ('pending', 'Ожидание оплаты'),
@@ -191,46 +264,172 @@ class TransactionModel(models.Model):
 
     class Meta:
         verbose_name_plural = "Оплаты"
+        indexes = [
+            models.Index(fields=["transaction_status", "timestamp"]),
+            models.Index(fields=["timestamp"]),
+        ]
+        constraints = [
+            # At most one open checkout per form, so concurrent /api/pay/
+            # calls cannot each start their own payment and stock hold.
+            models.UniqueConstraint(
+                fields=["form"],
+                condition=models.Q(transaction_status="pending"),
+                name="transaction_pending_form_unique",
+            ),
+        ]
 
     def __str__(self):
         return f"Transaction for Payment {self.form} with ID {self.payment_id} ({self.transaction_status})"
     
     @staticmethod
-    def reduce_quantity(transaction_id: TransactionModel):
-        try:
-            with transaction.atomic():
-                my_transaction = get_object_or_404(TransactionModel, transaction_id)
-                form = my_transaction.form
-
-                product_positions = ProductPositionModel.objects.filter(form=form)
-                for product_position in product_positions:
-                    product = ProductModel.objects.select_for_update().get(pk=product_position.product)
-                    
-                    if product.quantity >= product_position.quantity:
-                        product.quantity -= product_position.quantity
-                        product.save(update_fields=['quantity'])
-                    else:
-                        return False
-                    
-                return True
-        except Exception:
-            return False
+    def get_product_positions(transaction_id):
+        if isinstance(transaction_id, TransactionModel):
+            form_id = transaction_id.form_id
+        else:
+            form_id = get_object_or_404(TransactionModel, pk=transaction_id).form_id
+
+        return ProductPositionModel.objects.filter(form_id=form_id).only('id', 'product_id', 'quantity')
+
+
+class StockHoldModel(models.Model):
+    """
+    Stock taken off ProductModel.quantity at checkout. The hold is committed
+    when the payment succeeds and released, putting the stock back, when it
+    fails or `expires_at` passes first.
+    """
+    STATUS_CHOICES = [
+        ('held', 'Зарезервировано'),
+        ('committed', 'Списано'),
+        ('released', 'Освобождено'),
+    ]
 
+    transaction = models.OneToOneField(TransactionModel, on_delete=models.CASCADE, related_name='stock_hold')
+    # Product id (as a string key) -> held quantity.
+    items = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='held')
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
 
-    @staticmethod
-    def revert_quantity(transaction_id):
-        try:
-            with transaction.atomic():
-                my_transaction = get_object_or_404(TransactionModel, transaction_id)
-                form = my_transaction.form
+    class Meta:
+        verbose_name_plural = "Резервы товаров"
+        indexes = [
+            models.Index(
+                fields=["expires_at"],
+                condition=models.Q(status="held"),
+                name="stock_hold_expiry_idx",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Hold for {self.transaction_id} ({self.status})"
 
-                product_positions = ProductPositionModel.objects.filter(form=form)
-                for product_position in product_positions:
-                    product = ProductModel.objects.select_for_update().get(pk=product_position.product)
-                    product.quantity += product_position.quantity
-                    product.save(update_fields=['quantity'])
 
-                return True    
+class PaymentEventModel(models.Model):
+    """
+    Payment provider notification, stored once per `event_id` so redelivered
+    webhooks are acknowledged without being applied again.
+    """
+    event_id = models.CharField(max_length=MAX_LENGTH, unique=True)
+    event = models.CharField(max_length=50)
+    payment_id = models.CharField(max_length=50, db_index=True)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(default=timezone.now)
 
-        except Exception:
-            return False
+    class Meta:
+        verbose_name_plural = "Уведомления об оплате"
+
+    def __str__(self) -> str:
+        return f"{self.event} for Payment {self.payment_id}"
+
+
+class UploadModel(models.Model):
+    """
+    Resumable image upload in progress; chunks are appended to a partial
+    file under RESUMABLE_UPLOADS['ROOT'] until `offset` reaches `size`.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(max_length=MAX_LENGTH)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name_plural = "Загрузки фотографий"
+
+    def __str__(self) -> str:
+        return f"Upload {self.filename} ({self.offset}/{self.size})"
+
+
+class JobModel(models.Model):
+    """
+    Background job, picked up by `manage.py run_jobs`.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Выполнено'),
+        ('failed', 'Ошибка'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(default=timezone.now)
+    run_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "Фоновые задачи"
+        indexes = [
+            models.Index(fields=["status", "run_at"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"Job {self.name} #{self.pk} ({self.status})"
+
+
+class TableVersionModel(models.Model):
+    """
+    Monotonic change counter per table, bumped whenever rows of the table
+    change. Reading it is a single unique-key lookup, which makes it a cheap
+    source for ETag and Last-Modified values.
+    """
+    table = models.CharField(max_length=MAX_LENGTH, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name_plural = "Версии таблиц"
+
+    def __str__(self) -> str:
+        return f"{self.table}: {self.version}"
+
+    @classmethod
+    def bump(cls, model) -> None:
+        table = model._meta.db_table
+        values = {'version': models.F('version') + 1, 'updated_at': timezone.now()}
+
+        if cls.objects.filter(table=table).update(**values):
+            return
+
+        try:
+            with transaction.atomic():
+                cls.objects.create(table=table, version=1)
+        except IntegrityError:
+            cls.objects.filter(table=table).update(**values)
+
+    @classmethod
+    def get_for_model(cls, model) -> "TableVersionModel":
+        table = model._meta.db_table
+        return cls.objects.filter(table=table).first() or cls(table=table, updated_at=None)
+
+    @classmethod
+    async def aget_for_model(cls, model) -> "TableVersionModel":
+        table = model._meta.db_table
+        return await cls.objects.filter(table=table).afirst() or cls(table=table, updated_at=None)
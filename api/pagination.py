@@ -0,0 +1,189 @@
+import base64
+import json
+from functools import reduce
+from operator import or_
+from typing import Final
+
+from django.conf import settings
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .fastjson import dumps
+
+
+MAX_PAGE_SIZE: Final[int] = 500
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over the view's `cursor_ordering` fields.
+
+    The last ordering field must be unique (normally `id`), so every row has
+    a distinct position and a page is fetched with a single indexed range
+    query no matter how deep into the list the client is. Pagination is
+    opt-in: it only kicks in when the request carries `cursor` or
+    `page_size`, otherwise the view keeps returning the plain list.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = getattr(settings, 'PAGINATION_PAGE_SIZE', 50)
+    max_page_size = MAX_PAGE_SIZE
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+
+        return self.set_page(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+
+        return self.set_page([row async for row in page_queryset])
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """
+        Returns the query for the requested page plus one look-ahead row, or
+        None when the request is not paginated.
+        """
+        if not isinstance(queryset, QuerySet):
+            return None
+
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+
+        self.request = request
+        self.ordering = tuple(getattr(view, 'cursor_ordering', ('id',)))
+        self.page_size = self.get_page_size(request)
+
+        self.position, self.reverse = self.decode_cursor(request)
+        queryset = queryset.order_by(*self.get_order_by(self.reverse))
+        if self.position is not None:
+            queryset = queryset.filter(self.get_seek_filter(self.position, self.reverse))
+
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        position, reverse = self.position, self.reverse
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if reverse:
+            rows.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_content(self, content: bytes) -> bytes:
+        """
+        `get_paginated_response` for a page whose results are already
+        encoded, as the fast serialization path produces them.
+        """
+        return b''.join([
+            b'{"next":', dumps(self.get_next_link()),
+            b',"previous":', dumps(self.get_previous_link()),
+            b',"results":', content, b'}',
+        ])
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+
+        if page_size <= 0:
+            return self.page_size
+
+        return min(page_size, self.max_page_size)
+
+    def get_order_by(self, reverse):
+        prefix = '-' if reverse else ''
+        return [prefix + field for field in self.ordering]
+
+    def get_seek_filter(self, position, reverse):
+        lookup = 'lt' if reverse else 'gt'
+        conditions = []
+
+        for index, field in enumerate(self.ordering):
+            equal = {name: value for name, value in zip(self.ordering[:index], position[:index])}
+            conditions.append(Q(**equal, **{f'{field}__{lookup}': position[index]}))
+
+        return reduce(or_, conditions)
+
+    def get_position(self, instance):
+        if isinstance(instance, dict):
+            return [instance[field] for field in self.ordering]
+
+        return [getattr(instance, field) for field in self.ordering]
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+
+        return self.encode_cursor(self.get_position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+
+        return self.encode_cursor(self.get_position(self.page[0]), reverse=True)
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'p': position, 'r': int(reverse)}, default=str, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.page_size_query_param, self.page_size)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            position = payload['p']
+            reverse = bool(payload['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        return position, reverse
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'schema': {'type': 'integer'},
+            },
+        ]
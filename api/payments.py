@@ -0,0 +1,260 @@
+import asyncio
+import itertools
+import logging
+import uuid
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import AsyncGenerator, Dict, Final, Optional
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+YOOKASSA_ENDPOINT: Final[str] = 'https://api.yookassa.ru/v3'
+DEFAULT_TIMEOUT: Final[float] = 10.0
+DEFAULT_RETRIES: Final[int] = 2
+DEFAULT_BACKOFF: Final[float] = 0.2
+DEFAULT_MAX_CONNECTIONS: Final[int] = 20
+
+
+class PaymentGatewayError(Exception):
+    pass
+
+
+class RetryablePaymentError(PaymentGatewayError):
+    pass
+
+
+@dataclass
+class PaymentResult:
+    id: str
+    status: str
+    confirmation_url: Optional[str] = None
+
+
+class PaymentGateway:
+    """
+    Async payment provider interface.
+
+    Every call is bounded by `timeout` seconds and retried up to `retries`
+    times on timeouts and transient provider errors. Payment creation always
+    carries the caller's idempotency key, so a retried call can never charge
+    twice.
+    """
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES,
+                 backoff: float = DEFAULT_BACKOFF):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+    async def create_payment(self, amount: Decimal, currency: str, description: str,
+                             return_url: str, idempotency_key: str) -> PaymentResult:
+        return await self.call(
+            self.send_create_payment, amount, currency, description, return_url, idempotency_key
+        )
+
+    async def get_payment(self, payment_id: str) -> PaymentResult:
+        return await self.call(self.send_get_payment, payment_id)
+
+    async def call(self, method, *args):
+        for attempt in itertools.count():
+            try:
+                return await asyncio.wait_for(method(*args), self.timeout)
+            except (asyncio.TimeoutError, RetryablePaymentError) as ex:
+                if attempt >= self.retries:
+                    raise PaymentGatewayError(f"payment provider call failed: {ex!r}") from ex
+
+                logger.warning("Retrying %s after %r (attempt %s)", method.__name__, ex, attempt + 1)
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def send_create_payment(self, amount, currency, description, return_url, idempotency_key):
+        raise NotImplementedError
+
+    async def send_get_payment(self, payment_id):
+        raise NotImplementedError
+
+    async def aclose(self) -> None:
+        pass
+
+
+class YookassaGateway(PaymentGateway):
+    """
+    YooKassa REST client on top of a pooled `httpx.AsyncClient`.
+
+    A client is kept per event loop, since pooled connections cannot be
+    shared between loops (each sync-to-async bridge under WSGI runs its own),
+    and is closed when its loop shuts down.
+    """
+
+    def __init__(self, account_id, secret_key, endpoint: str = YOOKASSA_ENDPOINT,
+                 max_connections: int = DEFAULT_MAX_CONNECTIONS, **kwargs):
+        super().__init__(**kwargs)
+        self.account_id = str(account_id)
+        self.secret_key = secret_key
+        self.endpoint = endpoint
+        self.max_connections = max_connections
+        self.clients: Dict[asyncio.AbstractEventLoop, object] = {}
+        self.closers: Dict[asyncio.AbstractEventLoop, AsyncGenerator] = {}
+
+    async def get_client(self):
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        client = self.clients.get(loop)
+
+        if client is None or client.is_closed:
+            # Loops closed without shutting down their async generators.
+            for stale_loop in [stale for stale in self.clients if stale.is_closed()]:
+                del self.clients[stale_loop]
+                del self.closers[stale_loop]
+
+            client = httpx.AsyncClient(
+                base_url=self.endpoint,
+                auth=(self.account_id, self.secret_key),
+                limits=httpx.Limits(max_connections=self.max_connections),
+                timeout=self.timeout,
+            )
+            closer = self.close_on_shutdown(loop, client)
+            await closer.__anext__()
+            self.clients[loop] = client
+            self.closers[loop] = closer
+
+        return client
+
+    async def close_on_shutdown(self, loop, client):
+        """
+        Parked until `loop` shuts down. asyncio.run, asgiref and uvicorn close
+        a loop's async generators before the loop itself, which closes the
+        client while its pooled connections can still be shut down; once the
+        loop is closed that is no longer possible.
+        """
+        try:
+            yield
+        finally:
+            if self.clients.get(loop) is client:
+                del self.clients[loop]
+                del self.closers[loop]
+
+            await client.aclose()
+
+    async def request(self, method, path, **kwargs) -> dict:
+        import httpx
+
+        try:
+            client = await self.get_client()
+            response = await client.request(method, path, **kwargs)
+        except httpx.TransportError as ex:
+            raise RetryablePaymentError(str(ex)) from ex
+
+        if response.status_code == 202 or response.status_code >= 500:
+            raise RetryablePaymentError(f"provider responded {response.status_code}")
+
+        if response.status_code != 200:
+            raise PaymentGatewayError(f"provider responded {response.status_code}: {response.text}")
+
+        return response.json()
+
+    @staticmethod
+    def to_result(data: dict) -> PaymentResult:
+        confirmation = data.get('confirmation') or {}
+        return PaymentResult(
+            id=data['id'],
+            status=data['status'],
+            confirmation_url=confirmation.get('confirmation_url'),
+        )
+
+    async def send_create_payment(self, amount, currency, description, return_url, idempotency_key):
+        data = await self.request(
+            'POST',
+            '/payments',
+            headers={'Idempotence-Key': str(idempotency_key)},
+            json={
+                "amount": {
+                    "value": str(amount),
+                    "currency": currency,
+                },
+                "confirmation": {
+                    "type": "redirect",
+                    "return_url": return_url,
+                },
+                "capture": True,
+                "description": description,
+            },
+        )
+        return self.to_result(data)
+
+    async def send_get_payment(self, payment_id):
+        return self.to_result(await self.request('GET', f'/payments/{payment_id}'))
+
+    async def aclose(self):
+        # Clients of other loops are closed as those loops shut down.
+        closer = self.closers.get(asyncio.get_running_loop())
+        if closer is not None:
+            await closer.aclose()
+
+
+class FakePaymentGateway(PaymentGateway):
+    """
+    In-process provider for tests and load benchmarks. `latency` simulates a
+    slow provider; call counters let tests assert how often it was hit.
+    """
+
+    def __init__(self, latency: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.payments: Dict[str, PaymentResult] = {}
+        self.idempotency_keys: Dict[str, str] = {}
+        self.calls = {'create': 0, 'get': 0}
+
+    async def send_create_payment(self, amount, currency, description, return_url, idempotency_key):
+        self.calls['create'] += 1
+        await asyncio.sleep(self.latency)
+
+        payment_id = self.idempotency_keys.get(str(idempotency_key))
+        if payment_id is None:
+            payment_id = str(uuid.uuid4())
+            self.idempotency_keys[str(idempotency_key)] = payment_id
+            self.payments[payment_id] = PaymentResult(
+                id=payment_id,
+                status='pending',
+                confirmation_url=f'https://payments.example.com/{payment_id}',
+            )
+
+        return self.payments[payment_id]
+
+    async def send_get_payment(self, payment_id):
+        self.calls['get'] += 1
+        await asyncio.sleep(self.latency)
+
+        if payment_id not in self.payments:
+            raise PaymentGatewayError(f"unknown payment {payment_id}")
+
+        return self.payments[payment_id]
+
+    def set_status(self, payment_id: str, status: str) -> None:
+        self.payments[payment_id].status = status
+
+
+_gateway: Optional[PaymentGateway] = None
+
+
+def build_gateway(config: dict) -> PaymentGateway:
+    gateway_class = import_string(config.get('BACKEND', 'api.payments.YookassaGateway'))
+    return gateway_class(**config.get('OPTIONS', {}))
+
+
+def get_payment_gateway() -> PaymentGateway:
+    global _gateway
+
+    if _gateway is None:
+        _gateway = build_gateway(settings.PAYMENT_GATEWAY)
+
+    return _gateway
+
+
+def set_payment_gateway(gateway: Optional[PaymentGateway]) -> None:
+    global _gateway
+    _gateway = gateway
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, Final, FrozenSet, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .cache import LRUCacheBackend
+from .metrics import track_call
+from .models import TransactionModel
+from .payments import PaymentGatewayError, get_payment_gateway
+from .utils import payment_status_handler
+
+
+logger = logging.getLogger(__name__)
+
+# Statuses a transaction never leaves through the provider, so polls for
+# them are answered from memory without asking anyone again.
+TERMINAL_STATUSES: Final[FrozenSet[str]] = frozenset({'paid', 'failed', 'refunded'})
+
+
+class PaymentStatusCache:
+    """
+    Answers `payment/status/` polls. Terminal statuses are remembered for
+    good. A pending payment is checked with the provider at most once per
+    `ttl` seconds, as a fallback for late or lost webhooks, and concurrent
+    polls for it wait on that one check instead of each calling the
+    provider. Every worker process keeps its own cache.
+    """
+
+    def __init__(self, ttl: int, max_entries: int, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.terminal = LRUCacheBackend(max_entries)
+        self.recent = LRUCacheBackend(max_entries, clock)
+        self.in_flight: Dict[str, asyncio.Task] = {}
+
+    async def aget_status(self, payment_id: str) -> str:
+        status = self.terminal.get(payment_id) or self.recent.get(payment_id)
+        if status is not None:
+            return status
+
+        task = self.in_flight.get(payment_id)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(self.refresh(payment_id))
+            self.in_flight[payment_id] = task
+            task.add_done_callback(lambda done: self.forget(payment_id, done))
+
+        # Shielded, so a poll whose client disconnects does not cancel the
+        # check the other polls are waiting on.
+        return await asyncio.shield(task)
+
+    def forget(self, payment_id: str, task: asyncio.Task) -> None:
+        if self.in_flight.get(payment_id) is task:
+            del self.in_flight[payment_id]
+
+    async def refresh(self, payment_id: str) -> str:
+        status = await TransactionModel.objects.values_list('transaction_status', flat=True).aget(
+            payment_id=payment_id,
+        )
+
+        if status not in TERMINAL_STATUSES:
+            try:
+                with track_call('payment_provider', 'get_payment'):
+                    payment = await get_payment_gateway().get_payment(payment_id)
+            except PaymentGatewayError as ex:
+                # The local status stands until the next check.
+                logger.warning("Could not check payment %s: %s", payment_id, ex)
+            else:
+                status = await sync_to_async(payment_status_handler)(payment_id, payment.status)
+
+        self.remember(payment_id, status)
+        return status
+
+    def remember(self, payment_id: str, status: str) -> None:
+        if status in TERMINAL_STATUSES:
+            self.terminal.set(payment_id, status)
+            self.recent.delete(payment_id)
+        elif self.ttl:
+            self.recent.set(payment_id, status, self.ttl)
+
+
+_status_cache: Optional[PaymentStatusCache] = None
+
+
+def get_status_cache() -> PaymentStatusCache:
+    global _status_cache
+    if _status_cache is None:
+        options = settings.PAYMENT_STATUS_CACHE
+        _status_cache = PaymentStatusCache(options['TTL'], options['MAX_ENTRIES'])
+
+    return _status_cache
+
+
+def set_status_cache(cache: Optional[PaymentStatusCache]) -> None:
+    global _status_cache
+    _status_cache = cache
@@ -0,0 +1,52 @@
+from decimal import Decimal
+from typing import Dict
+
+from django.db.models import DecimalField, F, Sum
+from djmoney.money import Money
+
+from .models import ProductPositionModel
+
+
+class MixedCurrencyError(Exception):
+    pass
+
+
+def subtotals_queryset(form):
+    """
+    One aggregated query: the order total per price currency.
+    """
+    return (
+        ProductPositionModel.objects
+        .filter(form=form)
+        .values('product__price_currency')
+        .annotate(total=Sum(
+            F('product__price') * F('quantity'),
+            output_field=DecimalField(max_digits=20, decimal_places=2),
+        ))
+        .order_by()
+        .values_list('product__price_currency', 'total')
+    )
+
+
+def get_subtotals(form) -> Dict[str, Decimal]:
+    return dict(subtotals_queryset(form))
+
+
+async def aget_subtotals(form) -> Dict[str, Decimal]:
+    return {currency: total async for currency, total in subtotals_queryset(form)}
+
+
+def get_total(subtotals: Dict[str, Decimal]) -> Money:
+    """
+    Collapses subtotals into a single payable amount; a payment can only be
+    made in one currency.
+    """
+    if len(subtotals) > 1:
+        raise MixedCurrencyError(f"order mixes currencies: {sorted(subtotals)}")
+
+    (currency, total), = subtotals.items()
+    return Money(total, currency)
+
+
+def get_order_total(form) -> Money:
+    return get_total(get_subtotals(form))
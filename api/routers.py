@@ -0,0 +1,79 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Final, Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# Models whose reads may be served by a lagging replica. Everything else,
+# transactions and stock locks in particular, stays on the primary.
+REPLICA_MODELS: Final[set] = {
+    'api.productmodel',
+    'api.productimagemodel',
+    'api.productdetailmodel',
+}
+
+
+@dataclass
+class RoutingState:
+    # Reads go to the primary for the rest of the request.
+    pinned: bool = False
+    # The request wrote to the primary; the middleware makes the client
+    # sticky so that its next requests read their own writes.
+    wrote: bool = False
+
+
+routing_state: ContextVar[Optional[RoutingState]] = ContextVar('routing_state', default=None)
+
+
+@contextmanager
+def request_routing(pinned: bool = False):
+    """
+    Scopes a routing state to one request, so that a write outside of any
+    request (a job, a management command) never pins later reads.
+    """
+    state = RoutingState(pinned=pinned)
+    token = routing_state.set(state)
+    try:
+        yield state
+    finally:
+        routing_state.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Sends catalog reads to a random DATABASE_REPLICAS alias and everything
+    else to the primary. Reads stay on the primary inside a transaction on
+    it (so `select_for_update` and read-modify-write code see committed
+    state) and after the current request has written anything.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or model._meta.label_lower not in REPLICA_MODELS:
+            return DEFAULT_DB_ALIAS
+
+        state = routing_state.get()
+        if state is not None and state.pinned:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = routing_state.get()
+        if state is not None:
+            state.wrote = True
+            state.pinned = True
+
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
@@ -0,0 +1,421 @@
+import re
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Dict, Final, List, Optional
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import ProductDetailModel, ProductModel
+
+
+SEARCH_TABLE: Final[str] = 'api_product_search'
+MAX_CORRECTIONS: Final[int] = 5
+BRAND_FACET_SIZE: Final[int] = 20
+PRICE_RANGES: Final = (
+    (None, Decimal('500')),
+    (Decimal('500'), Decimal('1000')),
+    (Decimal('1000'), Decimal('5000')),
+    (Decimal('5000'), None),
+)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+PRODUCT_TABLE = ProductModel._meta.db_table
+DETAIL_TABLE = ProductDetailModel._meta.db_table
+
+
+@dataclass
+class SearchFilters:
+    brand: Optional[str] = None
+    price_min: Optional[Decimal] = None
+    price_max: Optional[Decimal] = None
+    in_stock: bool = False
+
+    def to_sql(self, alias: str = 'p'):
+        conditions, params = [], []
+
+        if self.brand:
+            conditions.append(f'{alias}.brand = %s')
+            params.append(self.brand)
+        if self.price_min is not None:
+            conditions.append(f'{alias}.price >= %s')
+            params.append(self.price_min)
+        if self.price_max is not None:
+            conditions.append(f'{alias}.price <= %s')
+            params.append(self.price_max)
+        if self.in_stock:
+            conditions.append(f'{alias}.quantity > 0')
+
+        return ' AND '.join(conditions) or '1 = 1', params
+
+
+@dataclass
+class SearchResult:
+    ids: List[int]
+    count: int
+    facets: Dict = field(default_factory=dict)
+
+
+def tokenize(query: str) -> List[str]:
+    return [token.lower() for token in TOKEN_RE.findall(query or '')]
+
+
+def edit_distance(left: str, right: str, limit: int) -> int:
+    """
+    Levenshtein distance, giving up with `limit + 1` as soon as it is
+    certain to exceed `limit`.
+    """
+    if abs(len(left) - len(right)) > limit:
+        return limit + 1
+
+    previous = list(range(len(right) + 1))
+    for i, left_char in enumerate(left, 1):
+        current = [i]
+        for j, right_char in enumerate(right, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (left_char != right_char),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+
+    return previous[-1]
+
+
+def max_typos(token: str) -> int:
+    return 1 if len(token) <= 5 else 2
+
+
+class SearchBackend:
+    """
+    Inverted index over product title, brand, description and detail
+    compound. Backends only know how to keep the index in sync and how to
+    express a ranked match as SQL; filtering, paging and facets are shared.
+    """
+
+    def create_index(self) -> None:
+        raise NotImplementedError
+
+    def index(self, product_ids: List[int] = None) -> None:
+        """
+        Re-indexes the given products, or all of them when `product_ids`
+        is None, with one set-based statement.
+        """
+        raise NotImplementedError
+
+    def remove(self, product_ids: List[int]) -> None:
+        raise NotImplementedError
+
+    def prepare(self, tokens: List[str]):
+        """
+        Turns query tokens into the backend's query form (expanding prefixes
+        and typos), once per search.
+        """
+        return tokens
+
+    def match_sql(self, prepared, ranked: bool = True):
+        """
+        Returns `(sql, params)` selecting `product_id` (and `rank`, lower
+        being better, when `ranked`) for matching products.
+        """
+        raise NotImplementedError
+
+    def execute(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def search(self, query: str, filters: SearchFilters = None, limit: int = 20, offset: int = 0) -> SearchResult:
+        tokens = tokenize(query)
+        if not tokens:
+            return SearchResult(ids=[], count=0)
+
+        filters = filters or SearchFilters()
+        prepared = self.prepare(tokens)
+        filter_sql, filter_params = filters.to_sql()
+
+        ranked_sql, ranked_params = self.match_sql(prepared)
+        match_sql, match_params = self.match_sql(prepared, ranked=False)
+        matches = f'{PRODUCT_TABLE} p JOIN ({match_sql}) m ON m.product_id = p.id'
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT p.id FROM {PRODUCT_TABLE} p JOIN ({ranked_sql}) m ON m.product_id = p.id '
+                f'WHERE {filter_sql} ORDER BY m.rank, p.id LIMIT %s OFFSET %s',
+                [*ranked_params, *filter_params, limit, offset],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+
+            cursor.execute(
+                f'SELECT COUNT(*) FROM {matches} WHERE {filter_sql}',
+                [*match_params, *filter_params],
+            )
+            count = cursor.fetchone()[0]
+
+        return SearchResult(ids=ids, count=count, facets=self.facets(matches, match_params))
+
+    def facets(self, matches: str, params: List) -> Dict:
+        """
+        Facet counts over all text matches, ignoring the active filters, so
+        clients can offer the other brands and ranges as alternatives.
+        """
+        buckets = []
+        for low, high in PRICE_RANGES:
+            conditions = ['1 = 1']
+            if low is not None:
+                conditions.append(f'p.price >= {low}')
+            if high is not None:
+                conditions.append(f'p.price < {high}')
+            buckets.append(f"SUM(CASE WHEN {' AND '.join(conditions)} THEN 1 ELSE 0 END)")
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT p.brand, COUNT(*) FROM {matches} '
+                f"WHERE p.brand IS NOT NULL AND p.brand <> '' "
+                f'GROUP BY p.brand ORDER BY COUNT(*) DESC, p.brand LIMIT %s',
+                [*params, BRAND_FACET_SIZE],
+            )
+            brands = cursor.fetchall()
+
+            cursor.execute(
+                f'SELECT COUNT(*), SUM(CASE WHEN p.quantity > 0 THEN 1 ELSE 0 END), {", ".join(buckets)} '
+                f'FROM {matches}',
+                params,
+            )
+            total, in_stock, *price_counts = cursor.fetchone()
+
+        return {
+            'brand': [{'value': brand, 'count': count} for brand, count in brands],
+            'price': [
+                {'min': low, 'max': high, 'count': count or 0}
+                for (low, high), count in zip(PRICE_RANGES, price_counts)
+            ],
+            'in_stock': {'true': in_stock or 0, 'false': total - (in_stock or 0)},
+        }
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """
+    FTS5 table keyed by product id as rowid, ranked with bm25 weighted
+    towards title and brand. Tokens match as prefixes; a token that is not a
+    prefix of any indexed term is replaced by the closest terms from the
+    fts5vocab table.
+    """
+    vocab_table = f'{SEARCH_TABLE}_vocab'
+    weights = (10.0, 5.0, 1.0, 2.0)  # title, brand, description, compound
+
+    def create_index(self):
+        self.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} '
+            f"USING fts5(title, brand, description, compound, "
+            f"tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4')"
+        )
+        self.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.vocab_table} USING fts5vocab({SEARCH_TABLE}, 'row')"
+        )
+
+    def index(self, product_ids=None):
+        where, params = self.ids_condition(product_ids, 'p.id')
+        self.remove(product_ids)
+        self.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, title, brand, description, compound) '
+            f"SELECT p.id, p.title, COALESCE(p.brand, ''), p.description, COALESCE(d.compound, '') "
+            f'FROM {PRODUCT_TABLE} p LEFT JOIN {DETAIL_TABLE} d ON d.product_id = p.id '
+            f'WHERE {where}',
+            params,
+        )
+
+    def remove(self, product_ids):
+        if product_ids is None:
+            self.execute(f'DELETE FROM {SEARCH_TABLE}')
+            return
+
+        where, params = self.ids_condition(product_ids, 'rowid')
+        self.execute(f'DELETE FROM {SEARCH_TABLE} WHERE {where}', params)
+
+    @staticmethod
+    def ids_condition(product_ids, column):
+        if product_ids is None:
+            return '1 = 1', []
+
+        product_ids = list(product_ids)
+        if not product_ids:
+            return '1 = 0', []
+
+        return f"{column} IN ({', '.join(['%s'] * len(product_ids))})", product_ids
+
+    def prepare(self, tokens):
+        return ' AND '.join(self.token_expression(token) for token in tokens)
+
+    def match_sql(self, prepared, ranked=True):
+        weights = ', '.join(str(weight) for weight in self.weights)
+        rank = f', bm25({SEARCH_TABLE}, {weights}) AS rank' if ranked else ''
+        return (
+            f'SELECT rowid AS product_id{rank} FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s',
+            [prepared],
+        )
+
+    def token_expression(self, token):
+        if self.has_prefix(token):
+            return f'"{token}"*'
+
+        corrections = self.corrections(token)
+        if not corrections:
+            return f'"{token}"*'
+
+        return '(' + ' OR '.join(f'"{term}"' for term in corrections) + ')'
+
+    def has_prefix(self, token):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT 1 FROM {self.vocab_table} WHERE term >= %s AND term < %s LIMIT 1',
+                [token, token + '\uffff'],
+            )
+            return cursor.fetchone() is not None
+
+    def corrections(self, token):
+        """
+        Indexed terms within a small edit distance of `token`. Candidates
+        share its first two letters, which keeps the vocabulary scan short
+        at the cost of not correcting typos at the very start of a word.
+        """
+        typos = max_typos(token)
+        start = token[:2]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT term, doc FROM {self.vocab_table} '
+                f'WHERE term >= %s AND term < %s AND length(term) BETWEEN %s AND %s',
+                [start, start + '\uffff', len(token) - typos, len(token) + typos],
+            )
+            candidates = cursor.fetchall()
+
+        scored = []
+        for term, documents in candidates:
+            distance = edit_distance(token, term, typos)
+            if distance <= typos:
+                scored.append((distance, -documents, term))
+
+        return [term for _, _, term in sorted(scored)[:MAX_CORRECTIONS]]
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    Weighted tsvector table with a GIN index, ranked with ts_rank. Tokens
+    match as prefixes; when nothing matches, falls back to pg_trgm word
+    similarity on title and brand for typo tolerance.
+    """
+    config = 'simple'
+
+    def create_index(self):
+        self.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        self.execute(
+            f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ('
+            f'product_id bigint PRIMARY KEY REFERENCES {PRODUCT_TABLE} (id) ON DELETE CASCADE, '
+            f'document tsvector NOT NULL)'
+        )
+        self.execute(f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document ON {SEARCH_TABLE} USING gin (document)')
+        self.execute(
+            f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_trigram ON {PRODUCT_TABLE} '
+            f"USING gin ((title || ' ' || COALESCE(brand, '')) gin_trgm_ops)"
+        )
+
+    def index(self, product_ids=None):
+        where, params = ('1 = 1', []) if product_ids is None else ('p.id = ANY(%s)', [list(product_ids)])
+        self.execute(
+            f'INSERT INTO {SEARCH_TABLE} (product_id, document) '
+            f"SELECT p.id, "
+            f"setweight(to_tsvector('{self.config}', p.title), 'A') || "
+            f"setweight(to_tsvector('{self.config}', COALESCE(p.brand, '')), 'B') || "
+            f"setweight(to_tsvector('{self.config}', COALESCE(d.compound, '')), 'C') || "
+            f"setweight(to_tsvector('{self.config}', p.description), 'D') "
+            f'FROM {PRODUCT_TABLE} p LEFT JOIN {DETAIL_TABLE} d ON d.product_id = p.id '
+            f'WHERE {where} '
+            f'ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document',
+            params,
+        )
+
+    def remove(self, product_ids):
+        if product_ids is None:
+            self.execute(f'DELETE FROM {SEARCH_TABLE}')
+        else:
+            self.execute(f'DELETE FROM {SEARCH_TABLE} WHERE product_id = ANY(%s)', [list(product_ids)])
+
+    def prepare(self, tokens):
+        tsquery = ' & '.join(f'{token}:*' for token in tokens)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT 1 FROM {SEARCH_TABLE} WHERE document @@ to_tsquery('{self.config}', %s) LIMIT 1",
+                [tsquery],
+            )
+            if cursor.fetchone() is not None:
+                return 'fts', tsquery
+
+        return 'trigram', ' '.join(tokens)
+
+    def match_sql(self, prepared, ranked=True):
+        kind, query = prepared
+
+        if kind == 'fts':
+            rank = f", -ts_rank(document, to_tsquery('{self.config}', %s)) AS rank" if ranked else ''
+            return (
+                f"SELECT product_id{rank} "
+                f"FROM {SEARCH_TABLE} WHERE document @@ to_tsquery('{self.config}', %s)",
+                [query, query] if ranked else [query],
+            )
+
+        rank = ", -word_similarity(%s, title || ' ' || COALESCE(brand, '')) AS rank" if ranked else ''
+        return (
+            f"SELECT id AS product_id{rank} "
+            f"FROM {PRODUCT_TABLE} WHERE %s <%% (title || ' ' || COALESCE(brand, ''))",
+            [query, query] if ranked else [query],
+        )
+
+
+class SimpleSearchBackend(SearchBackend):
+    """
+    Index-less fallback for other databases: every token must occur in the
+    title, brand or description.
+    """
+
+    def create_index(self):
+        pass
+
+    def index(self, product_ids=None):
+        pass
+
+    def remove(self, product_ids):
+        pass
+
+    def match_sql(self, prepared, ranked=True):
+        queryset = ProductModel.objects.all()
+        for token in prepared:
+            queryset = queryset.filter(
+                Q(title__icontains=token) | Q(brand__icontains=token) | Q(description__icontains=token)
+            )
+
+        sql, params = queryset.order_by().values('id').query.sql_with_params()
+        rank = ', 0 AS rank' if ranked else ''
+        return f'SELECT id AS product_id{rank} FROM ({sql}) s', list(params)
+
+
+VENDOR_BACKENDS: Final = {
+    'sqlite': 'api.search.SQLiteSearchBackend',
+    'postgresql': 'api.search.PostgresSearchBackend',
+}
+
+_backend: Optional[SearchBackend] = None
+
+
+def get_search_backend() -> SearchBackend:
+    global _backend
+
+    if _backend is None:
+        default = VENDOR_BACKENDS.get(connection.vendor, 'api.search.SimpleSearchBackend')
+        _backend = import_string(getattr(settings, 'PRODUCT_SEARCH_BACKEND', None) or default)()
+
+    return _backend
@@ -1,16 +1,26 @@
-from rest_framework.serializers import ModelSerializer
+from collections import defaultdict
+
+from django.db import transaction
+from rest_framework.exceptions import APIException
+from rest_framework.serializers import IntegerField, ModelSerializer, SerializerMethodField, ValidationError
 from .models import (
     ProductImageModel,
     ProductModel,
     ProductPositionModel,
     FormModel,
-    ProductDetailModel
+    ProductDetailModel,
+    TransactionModel,
 )
+from .metrics import TimedListSerializer, TimedSerializerMixin
+from .thumbnails import variant_urls
+
 
+class ProductImageSerializer(TimedSerializerMixin, ModelSerializer):
+    variants = SerializerMethodField()
 
-class ProductImageSerializer(ModelSerializer):
     class Meta:
         model = ProductImageModel
+        list_serializer_class = TimedListSerializer
         fields = '__all__'
 
     def __init__(self, *args, **kwargs):
@@ -21,30 +31,47 @@ class ProductImageSerializer(ModelSerializer):
             for field_name in excluded_fields:
                 self.fields.pop(field_name)
 
+    def get_variants(self, instance):
+        return variant_urls(instance, self.context.get('request'))
 
-class ProductSerializer(ModelSerializer):
+
+class ProductSerializer(TimedSerializerMixin, ModelSerializer):
     class Meta:
         model = ProductModel
+        list_serializer_class = TimedListSerializer
         fields = '__all__'
 
 
-class ProductDetailSerializer(ModelSerializer):
+class ProductDetailSerializer(TimedSerializerMixin, ModelSerializer):
     class Meta:
         model = ProductDetailModel
+        list_serializer_class = TimedListSerializer
         fields = '__all__'
 
 
-class ProductPositionSerializer(ModelSerializer):
+class OutOfStock(APIException):
+    status_code = 409
+    default_detail = 'less product in stock than requested'
+    default_code = 'out_of_stock'
+
+
+class ProductPositionSerializer(TimedSerializerMixin, ModelSerializer):
+    # Plain id instead of a related field, so validating a cart does not
+    # fetch every product separately; FormSerializer checks them in bulk.
+    product = IntegerField(source='product_id', min_value=1)
+
     class Meta:
         model = ProductPositionModel
+        list_serializer_class = TimedListSerializer
         fields = ['product', 'quantity']
 
 
-class FormSerializer(ModelSerializer):
+class FormSerializer(TimedSerializerMixin, ModelSerializer):
     products = ProductPositionSerializer(many=True, required=False)
     
     class Meta:
         model = FormModel
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'name', 'email', 'phone_number', 'city', 'street', 'house', 'comment', 'products']
     
     def get_products(self, instance):
@@ -57,15 +84,39 @@ class FormSerializer(ModelSerializer):
         data['products'] = serialized_products
         return data
     
+    def validate_products(self, products_data):
+        requested = defaultdict(int)
+        for product_data in products_data:
+            requested[product_data['product_id']] += product_data['quantity']
+
+        stock = dict(
+            ProductModel.objects.filter(pk__in=requested).values_list('pk', 'quantity')
+        )
+
+        missing = sorted(set(requested) - set(stock))
+        if missing:
+            raise ValidationError(f"unknown products: {missing}")
+
+        if any(stock[product_id] < quantity for product_id, quantity in requested.items()):
+            raise OutOfStock()
+
+        return products_data
+
     def create(self, validated_data):
-        if 'products' in validated_data:
-            products_data = validated_data.pop('products')
+        products_data = validated_data.pop('products', [])
+
+        with transaction.atomic():
             form = FormModel.objects.create(**validated_data)
-            
-            for product_data in products_data:
-                ProductPositionModel.objects.create(form=form, **product_data)
+            ProductPositionModel.objects.bulk_create([
+                ProductPositionModel(form=form, **product_data)
+                for product_data in products_data
+            ])
+
+        return form
 
-            return form
 
-        return FormModel.objects.create(**validated_data)
-    
\ No newline at end of file
+class TransactionSerializer(TimedSerializerMixin, ModelSerializer):
+    class Meta:
+        model = TransactionModel
+        list_serializer_class = TimedListSerializer
+        exclude = ['secret_key', 'idempotency_key']
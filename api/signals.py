@@ -0,0 +1,128 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import invalidate_catalog
+from .cards import refresh_cards
+from .jobs import enqueue
+from .search import get_search_backend
+from .models import ProductDetailModel, ProductImageModel, ProductModel, TableVersionModel
+
+
+# Tables whose API representation changes when rows of the sender change.
+# Product responses list image ids, so image changes touch products too.
+CATALOG_TABLES = {
+    ProductModel: (ProductModel,),
+    ProductDetailModel: (ProductModel,),
+    ProductImageModel: (ProductImageModel, ProductModel),
+}
+
+
+def mark_catalog_changed(*models) -> None:
+    invalidate_catalog()
+
+    for model in models:
+        TableVersionModel.bump(model)
+
+
+# Invalidation waits for the commit: done inside the writer's transaction,
+# a concurrent reader could refill the cache with the old rows under the
+# new generation and serve them until the entry times out.
+
+@receiver(post_save)
+@receiver(post_delete)
+def catalog_changed(sender, **kwargs):
+    if sender in CATALOG_TABLES:
+        models = CATALOG_TABLES[sender]
+        transaction.on_commit(lambda: mark_catalog_changed(*models))
+
+
+@receiver(m2m_changed, sender=ProductModel.images.through)
+def product_images_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(lambda: mark_catalog_changed(ProductModel))
+
+
+@receiver(post_save, sender=ProductImageModel)
+def generate_image_variants(sender, instance, update_fields=None, **kwargs):
+    # A checksum back-fill happens while the variants are being rendered.
+    if update_fields == {'checksum'}:
+        return
+
+    if settings.THUMBNAILS['EAGER'] and instance.image:
+        transaction.on_commit(lambda: enqueue('generate_thumbnails', {'image_id': instance.pk}))
+
+
+@receiver(post_save, sender=ProductModel)
+def index_product(sender, instance, **kwargs):
+    get_search_backend().index([instance.pk])
+
+
+@receiver(post_delete, sender=ProductModel)
+def unindex_product(sender, instance, **kwargs):
+    get_search_backend().remove([instance.pk])
+
+
+@receiver(post_save, sender=ProductDetailModel)
+@receiver(post_delete, sender=ProductDetailModel)
+def index_product_detail(sender, instance, **kwargs):
+    if instance.product_id is not None:
+        get_search_backend().index([instance.product_id])
+
+
+# Product cards are rebuilt as soon as a source row is saved. Deletions
+# rebuild after commit: cascades delete related rows first, and a card
+# rebuilt midway would outlive its product.
+
+@receiver(post_save, sender=ProductModel)
+def refresh_product_card(sender, instance, update_fields=None, **kwargs):
+    # Cards read the quantity from the product, so stock updates leave them be.
+    if update_fields is not None and update_fields <= {'quantity'}:
+        return
+
+    refresh_cards([instance.pk])
+
+
+@receiver(post_save, sender=ProductDetailModel)
+def refresh_detail_card(sender, instance, **kwargs):
+    if instance.product_id is not None:
+        refresh_cards([instance.product_id])
+
+
+@receiver(post_delete, sender=ProductDetailModel)
+def refresh_deleted_detail_card(sender, instance, **kwargs):
+    if instance.product_id is not None:
+        product_id = instance.product_id
+        transaction.on_commit(lambda: refresh_cards([product_id]))
+
+
+@receiver(post_save, sender=ProductImageModel)
+def refresh_image_cards(sender, instance, created, **kwargs):
+    if not created:
+        refresh_cards(instance.productmodel_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=ProductImageModel)
+def refresh_deleted_image_cards(sender, instance, **kwargs):
+    product_ids = list(instance.productmodel_set.values_list('pk', flat=True))
+    if product_ids:
+        transaction.on_commit(lambda: refresh_cards(product_ids))
+
+
+@receiver(m2m_changed, sender=ProductModel.images.through)
+def refresh_linked_cards(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            refresh_cards([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        refresh_cards(pk_set)
+    elif action == 'pre_clear':
+        product_ids = list(instance.productmodel_set.values_list('pk', flat=True))
+        transaction.on_commit(lambda: refresh_cards(product_ids))
+
+
+@receiver(post_migrate)
+def create_search_index(sender, **kwargs):
+    if sender.name == 'api':
+        get_search_backend().create_index()
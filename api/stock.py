@@ -0,0 +1,236 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Dict, Final, Iterable, List
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from django.utils import timezone
+
+from .models import ProductModel, ProductPositionModel, StockHoldModel, TransactionModel
+from .signals import mark_catalog_changed
+
+
+STOCK_BATCH_SIZE: Final[int] = 500
+
+
+@dataclass
+class StockResult:
+    ok: bool
+    failed_positions: List[int] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return self.ok
+
+
+class StockConflict(Exception):
+    pass
+
+
+class HoldConflict(Exception):
+    def __init__(self, result: StockResult):
+        super().__init__(result.failed_positions)
+        self.result = result
+
+
+def group_positions(positions: Iterable[ProductPositionModel]):
+    """
+    Sums requested quantities per product, so a form listing the same product
+    twice is checked against its stock once.
+    """
+    requested: Dict[int, int] = defaultdict(int)
+    position_ids: Dict[int, List[int]] = defaultdict(list)
+
+    for position in positions:
+        requested[position.product_id] += position.quantity
+        position_ids[position.product_id].append(position.pk)
+
+    return dict(requested), dict(position_ids)
+
+
+def batches(product_ids: List[int], size: int = STOCK_BATCH_SIZE):
+    for start in range(0, len(product_ids), size):
+        yield product_ids[start:start + size]
+
+
+def lock_products(product_ids: List[int]) -> Dict[int, int]:
+    """
+    Locks products in ascending primary key order, so concurrent checkouts
+    always acquire row locks in the same order and cannot deadlock.
+    """
+    stock = {}
+    for batch in batches(product_ids):
+        rows = (
+            ProductModel.objects
+            .select_for_update()
+            .filter(pk__in=batch)
+            .order_by('pk')
+            .values_list('pk', 'quantity')
+        )
+        stock.update(rows)
+
+    return stock
+
+
+def quantity_case(requested: Dict[int, int], product_ids: List[int]):
+    return Case(
+        *[When(pk=product_id, then=Value(requested[product_id])) for product_id in product_ids],
+        output_field=PositiveIntegerField(),
+    )
+
+
+def find_failed_positions(requested, position_ids, stock) -> List[int]:
+    failed = []
+    for product_id, quantity in requested.items():
+        if stock.get(product_id, 0) < quantity:
+            failed.extend(position_ids[product_id])
+
+    return sorted(failed)
+
+
+def reserve_stock(positions: Iterable[ProductPositionModel]) -> StockResult:
+    """
+    Decrements stock for all positions or for none of them.
+
+    Each batch is applied with one conditional UPDATE that only touches rows
+    still holding enough quantity; failing positions are reported back.
+    """
+    return reserve_quantities(*group_positions(positions))
+
+
+def release_stock(positions: Iterable[ProductPositionModel]) -> StockResult:
+    return release_quantities(*group_positions(positions))
+
+
+def reserve_quantities(requested: Dict[int, int], position_ids: Dict[int, List[int]]) -> StockResult:
+    product_ids = sorted(requested)
+
+    with transaction.atomic():
+        stock = lock_products(product_ids)
+        failed = find_failed_positions(requested, position_ids, stock)
+        if failed:
+            return StockResult(ok=False, failed_positions=failed)
+
+        try:
+            with transaction.atomic():
+                for batch in batches(product_ids):
+                    quantity = quantity_case(requested, batch)
+                    updated = (
+                        ProductModel.objects
+                        .filter(pk__in=batch, quantity__gte=quantity)
+                        .update(quantity=F('quantity') - quantity)
+                    )
+                    if updated != len(batch):
+                        raise StockConflict()
+        except StockConflict:
+            stock = lock_products(product_ids)
+            failed = find_failed_positions(requested, position_ids, stock)
+            return StockResult(ok=False, failed_positions=failed)
+
+        transaction.on_commit(lambda: mark_catalog_changed(ProductModel))
+
+    return StockResult(ok=True)
+
+
+def release_quantities(requested: Dict[int, int], position_ids: Dict[int, List[int]]) -> StockResult:
+    product_ids = sorted(requested)
+
+    with transaction.atomic():
+        stock = lock_products(product_ids)
+        missing = [product_id for product_id in product_ids if product_id not in stock]
+        if missing:
+            failed = [pk for product_id in missing for pk in position_ids[product_id]]
+            return StockResult(ok=False, failed_positions=sorted(failed))
+
+        for batch in batches(product_ids):
+            ProductModel.objects.filter(pk__in=batch).update(
+                quantity=F('quantity') + quantity_case(requested, batch)
+            )
+
+        transaction.on_commit(lambda: mark_catalog_changed(ProductModel))
+
+    return StockResult(ok=True)
+
+
+def hold_stock(checkout: TransactionModel, ttl: int = None) -> StockResult:
+    """
+    Takes the quantities of the checkout's form off stock, all or nothing,
+    until the hold is committed, released or expires after `ttl` seconds.
+    An unsaved `checkout` is saved together with its hold. Holding again for
+    the same transaction, e.g. a retried checkout, only extends the expiry;
+    a released hold is taken anew and a committed one is left as it is.
+
+    The first statement is a write, so on SQLite the transaction takes the
+    write lock up front, waiting for it under contention, rather than
+    failing to upgrade a read lock later on.
+    """
+    expires_at = timezone.now() + timedelta(seconds=ttl or settings.STOCK_HOLD_TTL)
+    created = checkout.pk is None
+
+    try:
+        with transaction.atomic():
+            if created:
+                checkout.save()
+            elif StockHoldModel.objects.filter(transaction=checkout, status='held').update(expires_at=expires_at):
+                return StockResult(ok=True)
+            elif StockHoldModel.objects.filter(transaction=checkout, status='committed').exists():
+                return StockResult(ok=True)
+            else:
+                StockHoldModel.objects.filter(transaction=checkout, status='released').delete()
+
+            requested, position_ids = group_positions(TransactionModel.get_product_positions(checkout))
+            StockHoldModel.objects.create(
+                transaction=checkout,
+                items={str(product_id): quantity for product_id, quantity in requested.items()},
+                expires_at=expires_at,
+            )
+
+            result = reserve_quantities(requested, position_ids)
+            if not result:
+                raise HoldConflict(result)
+    except HoldConflict as ex:
+        if created:
+            checkout.pk = None
+            checkout._state.adding = True
+        return ex.result
+
+    return StockResult(ok=True)
+
+
+def commit_hold(checkout_id: int) -> bool:
+    """
+    Makes a hold permanent. False when there is none or it was released
+    already, in which case the caller has to take the stock again.
+    """
+    return bool(StockHoldModel.objects.filter(transaction_id=checkout_id, status='held').update(status='committed'))
+
+
+def release_hold(checkout_id: int) -> bool:
+    """
+    Puts held stock back, exactly once: the status change is conditional,
+    so a sweeper and a payment callback racing for the same hold cannot
+    both release it, nor release a committed one.
+    """
+    with transaction.atomic():
+        if not StockHoldModel.objects.filter(transaction_id=checkout_id, status='held').update(status='released'):
+            return False
+
+        hold = StockHoldModel.objects.get(transaction_id=checkout_id)
+        requested = {int(product_id): quantity for product_id, quantity in hold.items.items()}
+
+        # Products deleted since the checkout have no stock to return to.
+        stock = lock_products(sorted(requested))
+        release_quantities({product_id: requested[product_id] for product_id in stock}, {})
+
+    return True
+
+
+def release_expired_holds(limit: int = STOCK_BATCH_SIZE) -> int:
+    expired = (
+        StockHoldModel.objects
+        .filter(status='held', expires_at__lt=timezone.now())
+        .order_by('expires_at')
+        .values_list('transaction_id', flat=True)[:limit]
+    )
+    return sum(release_hold(checkout_id) for checkout_id in list(expired))
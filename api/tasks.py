@@ -0,0 +1,70 @@
+import logging
+
+from django.db import transaction
+
+from .jobs import job
+from .stock import commit_hold, hold_stock, release_hold
+from .models import ProductImageModel, TransactionModel
+from .thumbnails import generate_variants
+from .utils import send_email
+
+
+logger = logging.getLogger(__name__)
+
+
+class JobFailed(Exception):
+    pass
+
+
+@job('send_order_email')
+def send_order_email(transaction_id):
+    my_transaction = TransactionModel.objects.select_related('form').get(pk=transaction_id)
+
+    if not send_email(my_transaction.form.email):
+        raise JobFailed(f"could not send confirmation for transaction {transaction_id}")
+
+
+@job('settle_stock')
+def settle_stock(transaction_id):
+    """
+    Decrements stock for a paid transaction exactly once; `stock_settled`
+    guards against a retry after the decrement already committed. Stock
+    held at checkout is simply kept. If the hold expired before the payment
+    went through, it is taken again, all or nothing; when that is no longer
+    possible the transaction is left unsettled and logged.
+    """
+    with transaction.atomic():
+        my_transaction = TransactionModel.objects.select_for_update().get(pk=transaction_id)
+        if my_transaction.stock_settled:
+            return
+
+        if commit_hold(my_transaction.pk):
+            my_transaction.stock_settled = True
+            my_transaction.save(update_fields=['stock_settled'])
+            return
+
+        result = hold_stock(my_transaction)
+        if not result:
+            logger.error(
+                "Transaction %s is paid but positions %s are out of stock",
+                transaction_id, result.failed_positions,
+            )
+            return
+
+        if not commit_hold(my_transaction.pk):
+            raise JobFailed(f"could not settle stock for transaction {transaction_id}")
+
+        my_transaction.stock_settled = True
+        my_transaction.save(update_fields=['stock_settled'])
+
+
+@job('release_stock_hold')
+def release_stock_hold(transaction_id):
+    release_hold(transaction_id)
+
+
+@job('generate_thumbnails')
+def generate_thumbnails(image_id):
+    image = ProductImageModel.objects.filter(pk=image_id).first()
+    if image is not None and image.image:
+        generate_variants(image)
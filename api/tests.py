@@ -1,3 +1,1978 @@
-from django.test import TestCase
+import asyncio
+import base64
+import functools
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
 
-# Create your tests here.
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.http import QueryDict
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from djmoney.money import Money
+from PIL import Image
+from unittest import mock
+from django.urls import reverse
+from rest_framework.request import Request
+from django.utils import timezone
+
+from .benchmarks import (
+    ScenarioResult,
+    dump_baseline,
+    find_regressions,
+    percentile,
+    run_scenarios,
+    seed_catalog,
+    seed_forms,
+)
+from .fastjson import dumps
+from .files import file_checksum
+from .filters import filter_products, filter_transactions
+from .cache import LRUCacheBackend, RedisCacheBackend, ResponseCache, catalog_cache
+from .payments import (
+    FakePaymentGateway,
+    PaymentGatewayError,
+    PaymentResult,
+    RetryablePaymentError,
+    YookassaGateway,
+    set_payment_gateway,
+)
+from .models import (
+    FormModel,
+    JobModel,
+    ProductDetailModel,
+    PaymentEventModel,
+    ProductCardModel,
+    ProductImageModel,
+    ProductModel,
+    ProductPositionModel,
+    StockHoldModel,
+    TableVersionModel,
+    TransactionModel,
+    UploadModel,
+)
+from .metrics import RequestMetrics, current_request, registry, track_call
+from .middleware import STICKY_COOKIE
+from .pagination import MAX_PAGE_SIZE, KeysetPagination
+from .polling import PaymentStatusCache, set_status_cache
+from .search import SearchResult
+from .serializers import FormSerializer, ProductSerializer
+from .jobs import enqueue, queue_stats, run_pending_jobs
+from .views import ProductImageView, ProductView
+from .tasks import generate_thumbnails, settle_stock
+from .utils import payment_status_handler
+from .pricing import MixedCurrencyError, get_order_total, get_subtotals
+from .stock import hold_stock, release_expired_holds, release_stock, reserve_stock
+from .thumbnails import get_variant_file, render_variant
+from .uploads import get_partial_path, prune_uploads, start_upload
+from .webhooks import sign_payload
+
+
+def create_product(**kwargs):
+    defaults = {
+        'title': 'Product',
+        'description': 'Description',
+        'price': 100,
+        'weight': 1,
+        'quantity': 10,
+    }
+    defaults.update(kwargs)
+    return ProductModel.objects.create(**defaults)
+
+
+def create_form(**kwargs):
+    defaults = {
+        'name': 'Name',
+        'email': 'buyer@example.com',
+        'phone_number': '+70000000000',
+        'city': 'City',
+        'street': 'Street',
+        'house': '1',
+    }
+    defaults.update(kwargs)
+    return FormModel.objects.create(**defaults)
+
+
+class FormQueryCountTests(TestCase):
+    def setUp(self):
+        self.products = [create_product(title=f'Product {i}') for i in range(3)]
+
+    def create_forms(self, count):
+        for _ in range(count):
+            form = create_form()
+            for product in self.products:
+                ProductPositionModel.objects.create(form=form, product=product, quantity=1)
+
+    def test_form_list_query_count_does_not_grow_with_forms(self):
+        self.create_forms(2)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('forms'))
+        self.assertEqual(len(response.json()), 2)
+
+        self.create_forms(10)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('forms'))
+        self.assertEqual(len(response.json()), 12)
+        self.assertEqual(len(response.json()[0]['products']), 3)
+
+    def test_form_detail_prefetches_positions(self):
+        self.create_forms(1)
+        form = FormModel.objects.get()
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('forms-with-pk', kwargs={'pk': form.pk}))
+
+        self.assertEqual(
+            sorted(position['product'] for position in response.json()['products']),
+            sorted(product.pk for product in self.products),
+        )
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.form = create_form()
+        self.products = [create_product(title=f'Product {i}', quantity=5) for i in range(4)]
+        self.positions = [
+            ProductPositionModel.objects.create(form=self.form, product=product, quantity=2)
+            for product in self.products
+        ]
+        self.transaction = TransactionModel.objects.create(
+            form=self.form, payment_id='payment', payment_url='url'
+        )
+
+    def quantities(self):
+        return list(
+            ProductModel.objects.filter(pk__in=[p.pk for p in self.products])
+            .order_by('pk').values_list('quantity', flat=True)
+        )
+
+    def test_reserve_stock_decrements_all_products(self):
+        result = reserve_stock(self.positions)
+
+        self.assertTrue(result)
+        self.assertEqual(self.quantities(), [3, 3, 3, 3])
+
+    def test_reserve_stock_query_count_does_not_grow_with_positions(self):
+        with self.assertNumQueries(6):
+            reserve_stock(self.positions)
+
+        for i in range(10):
+            product = create_product(title=f'Extra {i}')
+            self.positions.append(
+                ProductPositionModel.objects.create(form=self.form, product=product, quantity=1)
+            )
+
+        with self.assertNumQueries(6):
+            reserve_stock(self.positions)
+
+    def test_reserve_stock_reports_failed_positions_and_keeps_stock(self):
+        ProductPositionModel.objects.filter(pk=self.positions[1].pk).update(quantity=6)
+
+        result = reserve_stock(TransactionModel.get_product_positions(self.transaction))
+
+        self.assertFalse(result)
+        self.assertEqual(result.failed_positions, [self.positions[1].pk])
+        self.assertEqual(self.quantities(), [5, 5, 5, 5])
+
+    def test_duplicate_products_are_checked_together(self):
+        ProductPositionModel.objects.create(form=self.form, product=self.products[0], quantity=4)
+
+        result = reserve_stock(TransactionModel.get_product_positions(self.transaction))
+
+        self.assertFalse(result)
+        self.assertEqual(len(result.failed_positions), 2)
+
+    def test_release_stock_restores_stock(self):
+        reserve_stock(self.positions)
+
+        self.assertTrue(release_stock(self.positions))
+        self.assertEqual(self.quantities(), [5, 5, 5, 5])
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        catalog_cache.invalidate()
+        catalog_cache.reset_stats()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = create_product(title='Cached')
+
+    def test_product_list_is_served_from_cache(self):
+        self.client.get(reverse('products'))
+
+        # Only the table version lookup used for the ETag remains.
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('products'))
+
+        self.assertEqual(response.json()[0]['title'], 'Cached')
+        self.assertEqual(catalog_cache.stats()['hits'], 1)
+        self.assertEqual(catalog_cache.stats()['misses'], 1)
+
+    def test_change_committed_by_another_worker_is_seen(self):
+        path = reverse('products-with-pk', kwargs={'pk': self.product.pk})
+        sync_view = ProductView.as_view()
+        self.client.get(path)
+        sync_view(RequestFactory().get(path), pk=self.product.pk)
+
+        # Another process wrote: the shared table version moved, but this
+        # process's cache generation did not.
+        ProductModel.objects.filter(pk=self.product.pk).update(title='Elsewhere')
+        TableVersionModel.bump(ProductModel)
+
+        self.assertEqual(self.client.get(path).json()['title'], 'Elsewhere')
+        response = sync_view(RequestFactory().get(path), pk=self.product.pk)
+        self.assertEqual(response.data['title'], 'Elsewhere')
+
+    def test_unrelated_query_params_share_cache_entry(self):
+        self.client.get(reverse('products'))
+        self.client.get(reverse('products'), {'_': '123'})
+        self.client.get(reverse('products'), {'title': 'Cached'})
+
+        self.assertEqual(catalog_cache.stats()['hits'], 1)
+        self.assertEqual(catalog_cache.stats()['misses'], 2)
+
+    def test_saving_product_invalidates_cache(self):
+        self.client.get(reverse('products-with-pk', kwargs={'pk': self.product.pk}))
+
+        self.product.title = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+
+        response = self.client.get(reverse('products-with-pk', kwargs={'pk': self.product.pk}))
+        self.assertEqual(response.json()['title'], 'Renamed')
+
+    def test_stock_update_invalidates_cache(self):
+        form = create_form()
+        ProductPositionModel.objects.create(form=form, product=self.product, quantity=4)
+        self.client.get(reverse('products'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_stock(ProductPositionModel.objects.filter(form=form))
+
+        self.assertEqual(self.client.get(reverse('products')).json()[0]['quantity'], 6)
+
+    def test_lru_backend_evicts_least_recently_used(self):
+        backend = LRUCacheBackend(max_entries=2)
+        backend.set('a', 1)
+        backend.set('b', 2)
+        backend.get('a')
+        backend.set('c', 3)
+
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(backend.get('a'), 1)
+        self.assertEqual(backend.evictions, 1)
+
+    def test_redis_backend_with_fake_client(self):
+        cache = ResponseCache(RedisCacheBackend(client=FakeRedis()), 'test')
+
+        self.assertEqual(cache.get_or_set(('key',), lambda: {'value': 1}), {'value': 1})
+        self.assertEqual(cache.get_or_set(('key',), lambda: {'value': 2}), {'value': 1})
+
+        cache.invalidate()
+        self.assertEqual(cache.get_or_set(('key',), lambda: {'value': 3}), {'value': 3})
+        self.assertEqual(cache.stats()['hits'], 1)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        catalog_cache.invalidate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = create_product()
+
+    def test_matching_etag_returns_not_modified(self):
+        response = self.client.get(reverse('products'))
+        etag = response.headers['ETag']
+
+        self.assertFalse(etag.startswith('W/'))
+        self.assertIn('Last-Modified', response.headers)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('products'), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_when_table_changes(self):
+        etag = self.client.get(reverse('products')).headers['ETag']
+
+        self.product.quantity = 1
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+
+        response = self.client.get(reverse('products'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_etag_and_body_come_from_the_same_version(self):
+        path = reverse('products-with-pk', kwargs={'pk': self.product.pk})
+        old = self.client.get(path)
+
+        # Written by another worker, whose cache invalidation this process
+        # never sees.
+        ProductModel.objects.filter(pk=self.product.pk).update(title='Renamed')
+        TableVersionModel.bump(ProductModel)
+
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=old.headers['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], 'Renamed')
+        version = TableVersionModel.get_for_model(ProductModel).version
+        self.assertIn(f'-{version}-', response.headers['ETag'])
+
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=response.headers['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_depends_on_query(self):
+        first = self.client.get(reverse('products')).headers['ETag']
+        second = self.client.get(reverse('products'), {'page_size': 1}).headers['ETag']
+
+        self.assertNotEqual(first, second)
+
+    def test_if_modified_since_returns_not_modified(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductImageModel.objects.create(title='Image', image='image.png')
+        last_modified = self.client.get(reverse('product-images')).headers['Last-Modified']
+
+        response = self.client.get(reverse('product-images'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_image_change_bumps_product_version(self):
+        before = TableVersionModel.get_for_model(ProductModel).version
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            ProductImageModel.objects.create(title='Image', image='image.png')
+            self.assertEqual(TableVersionModel.get_for_model(ProductModel).version, before)
+
+        self.assertTrue(callbacks)
+        self.assertEqual(TableVersionModel.get_for_model(ProductModel).version, before + 1)
+
+
+class FlakyPaymentGateway(FakePaymentGateway):
+    def __init__(self, failures, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+
+    async def send_create_payment(self, *args):
+        if self.failures:
+            self.failures -= 1
+            raise RetryablePaymentError('connection reset')
+
+        return await super().send_create_payment(*args)
+
+
+class PaymentGatewayTests(TestCase):
+    def setUp(self):
+        self.gateway = FakePaymentGateway()
+        set_payment_gateway(self.gateway)
+        self.form = create_form()
+        ProductPositionModel.objects.create(form=self.form, product=create_product(price=150), quantity=2)
+
+    def tearDown(self):
+        set_payment_gateway(None)
+
+    def pay(self, **data):
+        return self.client.post(
+            reverse('pay'),
+            {'form_id': self.form.pk, 'credentials': 'Order', **data},
+            content_type='application/json',
+        )
+
+    def test_pay_creates_payment_with_persisted_idempotency_key(self):
+        response = self.pay()
+
+        self.assertEqual(response.status_code, 200)
+        transaction = TransactionModel.objects.get(form=self.form)
+        self.assertEqual(response.json()['payment_id'], transaction.payment_id)
+        self.assertEqual(self.gateway.idempotency_keys[str(transaction.idempotency_key)], transaction.payment_id)
+
+    def test_repeated_pay_reuses_pending_transaction(self):
+        first = self.pay().json()
+        second = self.pay().json()
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.gateway.calls['create'], 1)
+        self.assertEqual(TransactionModel.objects.count(), 1)
+
+    def test_pay_rejects_a_body_that_is_not_an_object(self):
+        for body in ['[1, 2]', '"form"', '{']:
+            with self.subTest(body=body):
+                response = self.client.post(reverse('pay'), body, content_type='application/json')
+
+                self.assertEqual(response.status_code, 400)
+
+        self.assertEqual(self.gateway.calls['create'], 0)
+
+    def test_one_pending_transaction_per_form(self):
+        TransactionModel.objects.create(form=self.form)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TransactionModel.objects.create(form=self.form)
+
+        TransactionModel.objects.create(form=self.form, transaction_status='failed')
+
+    def test_checkout_that_loses_the_race_reuses_the_winner(self):
+        winner = TransactionModel.objects.create(form=self.form, amount=Money(300, 'RUB'))
+
+        # Both checkouts missed each other's pending row.
+        with mock.patch('django.db.models.QuerySet.afirst', mock.AsyncMock(return_value=None)):
+            response = self.pay()
+
+        self.assertEqual(response.status_code, 200)
+        winner.refresh_from_db()
+        self.assertEqual(response.json()['payment_id'], winner.payment_id)
+        self.assertEqual(list(self.gateway.idempotency_keys), [str(winner.idempotency_key)])
+        self.assertEqual(TransactionModel.objects.count(), 1)
+        self.assertEqual(StockHoldModel.objects.count(), 1)
+
+    def test_transient_errors_are_retried_with_same_key(self):
+        gateway = FlakyPaymentGateway(failures=2, backoff=0)
+        set_payment_gateway(gateway)
+
+        response = self.pay()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(gateway.calls['create'], 1)
+        self.assertEqual(len(gateway.idempotency_keys), 1)
+
+    def test_timeout_after_retries_keeps_key_for_next_attempt(self):
+        set_payment_gateway(FakePaymentGateway(latency=0.05, timeout=0.01, retries=1, backoff=0))
+
+        response = self.pay()
+
+        self.assertEqual(response.status_code, 502)
+        transaction = TransactionModel.objects.get(form=self.form)
+        self.assertEqual(transaction.payment_id, '')
+
+        set_payment_gateway(self.gateway)
+        self.pay()
+
+        transaction.refresh_from_db()
+        self.assertEqual(self.gateway.idempotency_keys[str(transaction.idempotency_key)], transaction.payment_id)
+
+    def test_out_of_stock_is_rejected(self):
+        ProductModel.objects.update(quantity=1)
+
+        self.assertEqual(self.pay().status_code, 409)
+        self.assertEqual(self.gateway.calls['create'], 0)
+
+    def test_concurrent_calls_overlap(self):
+        gateway = FakePaymentGateway(latency=0.05)
+
+        async def create_many():
+            await asyncio.gather(*[
+                gateway.create_payment(1, 'RUB', 'Order', 'url', key) for key in range(20)
+            ])
+
+        started = time.monotonic()
+        asyncio.run(create_many())
+
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(len(gateway.payments), 20)
+
+    def test_failed_call_raises_gateway_error(self):
+        gateway = FakePaymentGateway()
+
+        with self.assertRaises(PaymentGatewayError):
+            asyncio.run(gateway.get_payment('missing'))
+
+    def test_yookassa_client_is_closed_with_its_loop(self):
+        import httpx
+
+        payment = {'id': 'p1', 'status': 'pending', 'confirmation': {'confirmation_url': 'url'}}
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, json=payment))
+        gateway = YookassaGateway('shop', 'secret')
+        clients = []
+
+        async def get_payment():
+            await gateway.get_payment('p1')
+            clients.append(await gateway.get_client())
+
+        with mock.patch('httpx.AsyncClient', functools.partial(httpx.AsyncClient, transport=transport)):
+            asyncio.run(get_payment())
+            asyncio.run(get_payment())
+
+        self.assertEqual(len(clients), 2)
+        self.assertIsNot(clients[0], clients[1])
+        self.assertTrue(all(client.is_closed for client in clients))
+        self.assertEqual(gateway.clients, {})
+
+@override_settings(PAYMENT_WEBHOOK_SECRET='webhook-secret')
+class PaymentWebhookTests(TestCase):
+    def setUp(self):
+        self.gateway = FakePaymentGateway()
+        set_payment_gateway(self.gateway)
+        self.form = create_form()
+        self.product = create_product(quantity=5)
+        ProductPositionModel.objects.create(form=self.form, product=self.product, quantity=2)
+        self.transaction = TransactionModel.objects.create(
+            form=self.form, payment_id='payment-1', payment_url='url'
+        )
+
+    def tearDown(self):
+        set_payment_gateway(None)
+        set_status_cache(None)
+
+    def notify(self, status, event=None, signature=None, **headers):
+        body = json.dumps({
+            'type': 'notification',
+            'event': event or f'payment.{status}',
+            'object': {'id': 'payment-1', 'status': status},
+        }).encode()
+
+        return self.client.post(
+            reverse('payment-webhook'),
+            body,
+            content_type='application/json',
+            HTTP_X_WEBHOOK_SIGNATURE=sign_payload(body) if signature is None else signature,
+            **headers,
+        )
+
+    def test_notifications_are_refused_without_a_secret(self):
+        with override_settings(PAYMENT_WEBHOOK_SECRET=''):
+            response = self.notify('succeeded', signature=sign_payload(b'', secret='guess'))
+
+        self.assertEqual(response.status_code, 503)
+        self.transaction.refresh_from_db()
+        self.assertEqual(self.transaction.transaction_status, 'pending')
+
+    def test_notification_updates_transaction(self):
+        response = self.notify('succeeded')
+
+        self.assertEqual(response.json(), {'applied': True})
+        self.transaction.refresh_from_db()
+        self.assertEqual(self.transaction.transaction_status, 'paid')
+
+    def test_duplicate_notification_is_applied_once(self):
+        self.notify('succeeded')
+        response = self.notify('succeeded')
+        run_pending_jobs()
+
+        self.assertEqual(response.json(), {'applied': False})
+        self.assertEqual(PaymentEventModel.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 3)
+
+    def test_late_pending_does_not_reopen_a_paid_transaction(self):
+        self.notify('succeeded')
+        self.notify('waiting_for_capture', HTTP_X_WEBHOOK_EVENT_ID='late-1')
+        self.notify('pending', event='payment.pending', HTTP_X_WEBHOOK_EVENT_ID='late-2')
+
+        self.transaction.refresh_from_db()
+        self.assertEqual(self.transaction.transaction_status, 'paid')
+
+        self.notify('succeeded', HTTP_X_WEBHOOK_EVENT_ID='redelivered')
+        self.notify('canceled', HTTP_X_WEBHOOK_EVENT_ID='late-3')
+        run_pending_jobs()
+
+        self.transaction.refresh_from_db()
+        self.assertEqual(self.transaction.transaction_status, 'paid')
+        self.assertEqual(JobModel.objects.filter(name='send_order_email').count(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 3)
+
+    def test_invalid_signature_is_rejected(self):
+        response = self.notify('succeeded', signature='forged')
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(PaymentEventModel.objects.exists())
+
+    def test_unknown_payment_is_not_acknowledged(self):
+        TransactionModel.objects.all().delete()
+
+        self.assertEqual(self.notify('succeeded').status_code, 404)
+        self.assertFalse(PaymentEventModel.objects.exists())
+
+    def test_status_is_read_locally(self):
+        self.notify('canceled')
+
+        response = self.client.get(reverse('payment-status'), {'payment_id': 'payment-1'})
+
+        self.assertEqual(response.json(), {'status': 'failed'})
+        self.assertEqual(self.gateway.calls['get'], 0)
+
+
+class OrderJobTests(TestCase):
+    def setUp(self):
+        self.form = create_form()
+        self.product = create_product(quantity=5)
+        ProductPositionModel.objects.create(form=self.form, product=self.product, quantity=2)
+        self.transaction = TransactionModel.objects.create(
+            form=self.form, payment_id='payment-1', payment_url='url'
+        )
+
+    def test_paid_order_is_settled_in_background(self):
+        payment_status_handler('payment-1', 'succeeded')
+
+        self.transaction.refresh_from_db()
+        self.assertEqual(self.transaction.transaction_status, 'paid')
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(queue_stats()['queued'], 2)
+
+        self.assertEqual(run_pending_jobs(), 2)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 3)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(queue_stats()['done'], 2)
+
+    def test_repeated_success_enqueues_once(self):
+        payment_status_handler('payment-1', 'succeeded')
+        payment_status_handler('payment-1', 'succeeded')
+
+        self.assertEqual(JobModel.objects.count(), 2)
+
+    def test_mail_failure_is_retried_and_keeps_order_paid(self):
+        payment_status_handler('payment-1', 'succeeded')
+
+        with mock.patch('api.utils.send_mail', side_effect=OSError('smtp down')):
+            run_pending_jobs()
+
+        job = JobModel.objects.get(name='send_order_email')
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.run_at, job.finished_at)
+        self.transaction.refresh_from_db()
+        self.assertEqual(self.transaction.transaction_status, 'paid')
+
+        JobModel.objects.filter(pk=job.pk).update(run_at=job.finished_at)
+        run_pending_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_job_fails_after_max_attempts(self):
+        job = enqueue('send_order_email', {'transaction_id': self.transaction.pk}, max_attempts=1)
+
+        with mock.patch('api.utils.send_mail', side_effect=OSError('smtp down')):
+            run_pending_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('could not send confirmation', job.last_error)
+
+    def test_stock_is_settled_once(self):
+        settle_stock(self.transaction.pk)
+        settle_stock(self.transaction.pk)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 3)
+
+
+class FormCreateTests(TestCase):
+    def post_form(self, products):
+        data = {
+            'name': 'Name',
+            'email': 'buyer@example.com',
+            'phone_number': '+70000000000',
+            'city': 'City',
+            'street': 'Street',
+            'house': '1',
+            'products': products,
+        }
+        return self.client.post(reverse('forms'), data, content_type='application/json')
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        small = [{'product': create_product().pk, 'quantity': 1} for _ in range(2)]
+        large = [{'product': create_product().pk, 'quantity': 1} for _ in range(50)]
+
+        with self.assertNumQueries(6):
+            self.assertEqual(self.post_form(small).status_code, 201)
+
+        with self.assertNumQueries(6):
+            response = self.post_form(large)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['products']), 50)
+
+    def test_insufficient_stock_is_conflict(self):
+        product = create_product(quantity=3)
+
+        response = self.post_form([
+            {'product': product.pk, 'quantity': 2},
+            {'product': product.pk, 'quantity': 2},
+        ])
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(FormModel.objects.exists())
+
+    def test_unknown_product_is_rejected(self):
+        response = self.post_form([{'product': 999, 'quantity': 1}])
+
+        self.assertEqual(response.status_code, 400)
+
+
+class OrderPricingTests(TestCase):
+    def setUp(self):
+        self.form = create_form()
+
+    def add_position(self, quantity, **product):
+        ProductPositionModel.objects.create(form=self.form, product=create_product(**product), quantity=quantity)
+
+    def test_total_with_mixed_quantities(self):
+        self.add_position(3, price=Decimal('10.10'))
+        self.add_position(1, price=Decimal('0.99'))
+        self.add_position(7, price=Decimal('100.00'))
+
+        with self.assertNumQueries(1):
+            total = get_order_total(self.form)
+
+        self.assertEqual(total, Money('731.29', 'RUB'))
+
+    def test_subtotals_per_currency(self):
+        self.add_position(2, price=Money('10.00', 'RUB'))
+        self.add_position(3, price=Money('1.50', 'USD'))
+        self.add_position(1, price=Money('5.00', 'USD'))
+
+        self.assertEqual(get_subtotals(self.form), {'RUB': Decimal('20.00'), 'USD': Decimal('9.50')})
+
+        with self.assertRaises(MixedCurrencyError):
+            get_order_total(self.form)
+
+    def test_total_is_cached_on_pending_transaction(self):
+        self.add_position(2, price=Decimal('50.00'))
+        set_payment_gateway(FakePaymentGateway(latency=0.05, timeout=0.01, retries=0))
+        self.addCleanup(set_payment_gateway, None)
+        data = {'form_id': self.form.pk, 'credentials': 'Order'}
+
+        self.client.post(reverse('pay'), data, content_type='application/json')
+
+        transaction = TransactionModel.objects.get(form=self.form)
+        self.assertEqual(transaction.amount, Money('100.00', 'RUB'))
+
+        ProductModel.objects.update(price=Decimal('70.00'))
+        gateway = FakePaymentGateway()
+        set_payment_gateway(gateway)
+        self.client.post(reverse('pay'), data, content_type='application/json')
+
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.amount, Money('100.00', 'RUB'))
+        self.assertEqual(len(gateway.payments), 1)
+
+    def test_pay_rejects_mixed_currencies(self):
+        self.add_position(1, price=Money('10.00', 'RUB'))
+        self.add_position(1, price=Money('10.00', 'USD'))
+        set_payment_gateway(FakePaymentGateway())
+        self.addCleanup(set_payment_gateway, None)
+
+        response = self.client.post(
+            reverse('pay'),
+            {'form_id': self.form.pk, 'credentials': 'Order'},
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        catalog_cache.invalidate()
+        self.protein = create_product(
+            title='Whey Protein', brand='Optimum', description='Vanilla flavour', price=2500, quantity=3,
+        )
+        self.bar = create_product(
+            title='Protein Bar', brand='Bombbar', description='Chocolate snack', price=150, quantity=0,
+        )
+        self.gainer = create_product(
+            title='Mass Gainer', brand='Optimum', description='Chocolate', price=3500, quantity=5,
+        )
+        ProductDetailModel.objects.create(
+            product=self.gainer, description='', compound='maltodextrin, whey', expiration_date=12, quantity=1,
+        )
+
+    def search(self, **params):
+        return self.client.get(reverse('products-search'), params).json()
+
+    def ids(self, response):
+        return [product['id'] for product in response['results']]
+
+    def test_title_matches_rank_first(self):
+        response = self.search(q='whey')
+
+        self.assertEqual(self.ids(response), [self.protein.pk, self.gainer.pk])
+
+    def test_prefix_match(self):
+        self.assertEqual(self.ids(self.search(q='prot bar')), [self.bar.pk])
+
+    def test_typo_tolerance(self):
+        self.assertEqual(self.ids(self.search(q='protien')), self.ids(self.search(q='protein')))
+        self.assertEqual(set(self.ids(self.search(q='choclate'))), {self.bar.pk, self.gainer.pk})
+
+    def test_filters_and_facets(self):
+        response = self.search(q='chocolate', brand='Optimum', in_stock='1')
+
+        self.assertEqual(self.ids(response), [self.gainer.pk])
+        self.assertEqual(response['count'], 1)
+        self.assertEqual(
+            response['facets']['brand'],
+            [{'value': 'Bombbar', 'count': 1}, {'value': 'Optimum', 'count': 1}],
+        )
+        self.assertEqual(response['facets']['in_stock'], {'true': 1, 'false': 1})
+        self.assertEqual([bucket['count'] for bucket in response['facets']['price']], [1, 0, 1, 0])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.bar.title = 'Crispy Wafer'
+        self.bar.save()
+        self.assertEqual(self.ids(self.search(q='wafer')), [self.bar.pk])
+
+        self.bar.delete()
+        self.assertEqual(self.ids(self.search(q='wafer')), [])
+
+    def test_ids_missing_from_the_database_are_skipped(self):
+        missing = self.gainer.pk + 100
+        result = SearchResult(ids=[missing, self.protein.pk], count=2)
+
+        with mock.patch('api.views.get_search_backend') as get_backend:
+            get_backend.return_value.search.return_value = result
+            response = self.client.get(reverse('products-search'), {'q': 'whey'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.ids(response.json()), [self.protein.pk])
+
+    def test_invalid_price_is_rejected(self):
+        response = self.client.get(reverse('products-search'), {'q': 'whey', 'price_min': 'cheap'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class FilteredQueryTests(TestCase):
+    def setUp(self):
+        catalog_cache.invalidate()
+        self.cheap = create_product(title='Bar', brand='Bombbar', price=150, quantity=0)
+        self.expensive = create_product(title='Whey', brand='Optimum', price=2500, quantity=3)
+        self.form = create_form()
+        self.paid = TransactionModel.objects.create(form=self.form, transaction_status='paid')
+        self.pending = TransactionModel.objects.create(form=self.form)
+        self.client.force_login(User.objects.create_user('staff', password='password', is_staff=True))
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.order_by().explain()
+        self.assertIn('SEARCH', plan)
+        self.assertIn('USING', plan)
+
+    def test_filters_are_served_by_indexes(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("plan format is SQLite specific")
+
+        products = ProductModel.objects.all()
+        for query in ['brand=Optimum', 'brand=Optimum&price_min=100&price_max=200', 'price_min=100', 'price_max=200']:
+            with self.subTest(query=query):
+                self.assertUsesIndex(filter_products(products, QueryDict(query)))
+
+        plan = filter_products(products, QueryDict('in_stock=1')).order_by('title', 'id').explain()
+        self.assertIn('product_in_stock_title_idx', plan)
+
+        transactions = TransactionModel.objects.all()
+        for query in ['status=paid', 'status=paid&date_from=2024-01-01', 'date_from=2024-01-01&date_to=2024-01-31',
+                      'form_id=1', 'status=pending&form_id=1']:
+            with self.subTest(query=query):
+                self.assertUsesIndex(filter_transactions(transactions, QueryDict(query)))
+
+    def test_product_filters(self):
+        response = self.client.get(reverse('products'), {'brand': 'Optimum', 'in_stock': 'true'})
+        self.assertEqual([product['id'] for product in response.json()], [self.expensive.pk])
+
+        response = self.client.get(reverse('products'), {'price_max': '1000'})
+        self.assertEqual([product['id'] for product in response.json()], [self.cheap.pk])
+
+    def test_transaction_filters(self):
+        today = self.paid.timestamp.date().isoformat()
+        response = self.client.get(reverse('transactions'), {'status': 'paid', 'date_from': today, 'date_to': today})
+
+        data = response.json()
+        self.assertEqual([transaction['id'] for transaction in data], [self.paid.pk])
+        self.assertNotIn('secret_key', data[0])
+
+        response = self.client.get(reverse('transactions'), {'date_to': '2000-01-01'})
+        self.assertEqual(response.json(), [])
+
+    def test_invalid_parameters_are_rejected(self):
+        for params in ({'date_from': 'yesterday'}, {'form_id': 'abc'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(reverse('transactions'), params).status_code, 400)
+
+    def test_transactions_are_for_staff_only(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('transactions')).status_code, 403)
+
+        self.client.force_login(User.objects.create_user('buyer', password='password'))
+        self.assertEqual(self.client.get(reverse('transactions')).status_code, 403)
+
+
+def create_image_file(name='photo.png', size=(800, 600), color='red'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+        thumbnails = dict(settings.THUMBNAILS, ROOT=os.path.join(self.media_root, 'thumbnails'), EAGER=False)
+        overrides = override_settings(MEDIA_ROOT=self.media_root, THUMBNAILS=thumbnails)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.image = ProductImageModel.objects.create(title='Photo', image=create_image_file())
+
+    def test_checksum_follows_upload(self):
+        checksum = self.image.checksum
+        self.assertEqual(len(checksum), 64)
+
+        self.image.image = create_image_file(color='blue')
+        self.image.save()
+        self.assertNotEqual(self.image.checksum, checksum)
+
+    def test_checksum_back_fill_changes_the_etag(self):
+        ProductImageModel.objects.filter(pk=self.image.pk).update(checksum='')
+        detail = reverse('product-images-with-pk', kwargs={'pk': self.image.pk})
+        etag = self.client.get(detail)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('product-image-variant', kwargs={'pk': self.image.pk, 'variant': 'small'}))
+
+        response = self.client.get(detail, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'v={self.image.checksum[:16]}', response.json()['variants']['small'])
+
+    def test_serializer_lists_versioned_variant_urls(self):
+        data = self.client.get(reverse('product-images-with-pk', kwargs={'pk': self.image.pk})).json()
+
+        self.assertEqual(set(data['variants']), set(settings.THUMBNAILS['VARIANTS']))
+        self.assertIn(f'v={self.image.checksum[:16]}', data['variants']['small'])
+
+    def test_variant_is_rendered_once_and_cached(self):
+        url = reverse('product-image-variant', kwargs={'pk': self.image.pk, 'variant': 'small'})
+
+        with mock.patch('api.thumbnails.render_variant', wraps=render_variant) as render:
+            response = self.client.get(url, {'v': self.image.checksum[:16]})
+            self.client.get(url)
+
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as thumbnail:
+            self.assertEqual(thumbnail.size, (160, 120))
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_same_source_shares_cached_files(self):
+        copy = ProductImageModel.objects.create(title='Copy', image=create_image_file())
+
+        self.assertEqual(get_variant_file(copy, 'medium'), get_variant_file(self.image, 'medium'))
+
+    def test_eager_generation_job(self):
+        with self.settings(THUMBNAILS=dict(settings.THUMBNAILS, EAGER=True)):
+            with self.captureOnCommitCallbacks(execute=True):
+                image = ProductImageModel.objects.create(title='Eager', image=create_image_file(color='green'))
+
+        job = JobModel.objects.get(name='generate_thumbnails')
+        self.assertEqual(job.payload, {'image_id': image.pk})
+
+        generate_thumbnails(image.pk)
+        for name in settings.THUMBNAILS['VARIANTS']:
+            with mock.patch('api.thumbnails.render_variant') as render:
+                get_variant_file(image, name)
+            render.assert_not_called()
+
+    def test_unknown_variant(self):
+        url = reverse('product-image-variant', kwargs={'pk': self.image.pk, 'variant': 'huge'})
+
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class ImageUploadTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+        overrides = override_settings(
+            MEDIA_ROOT=self.media_root,
+            THUMBNAILS=dict(settings.THUMBNAILS, ROOT=os.path.join(self.media_root, 'thumbnails'), EAGER=False),
+            RESUMABLE_UPLOADS=dict(settings.RESUMABLE_UPLOADS, ROOT=os.path.join(self.media_root, 'uploads')),
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def send_chunk(self, url, offset, data):
+        return self.client.patch(
+            url, data, content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_multipart_upload_is_hashed_while_streaming(self):
+        response = self.client.post(reverse('product-images'), {'title': 'Photo', 'image': create_image_file()})
+
+        self.assertEqual(response.status_code, 201)
+        image = ProductImageModel.objects.get(pk=response.json()['id'])
+        self.assertEqual(image.checksum, file_checksum(image.image))
+
+    def test_identical_images_share_one_file(self):
+        first = ProductImageModel.objects.create(title='First', image=create_image_file())
+        second = ProductImageModel.objects.create(title='Second', image=create_image_file('other.png'))
+
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertEqual(len(os.listdir(os.path.join(self.media_root, 'profile_photos'))), 1)
+
+    def test_put_updates_title_and_keeps_image(self):
+        image = ProductImageModel.objects.create(title='Old', image=create_image_file())
+        url = reverse('product-images-with-pk', kwargs={'pk': image.pk})
+
+        response = self.client.put(url, encode_multipart(BOUNDARY, {'title': 'New'}), content_type=MULTIPART_CONTENT)
+
+        self.assertEqual(response.status_code, 200)
+        image.refresh_from_db()
+        self.assertEqual((image.title, image.checksum), ('New', response.json()['checksum']))
+
+    def test_resumable_upload(self):
+        content = create_image_file().read()
+        response = self.client.post(
+            reverse('product-image-uploads'), {'filename': 'big.png', 'size': len(content)}, format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        url = response.json()['url']
+
+        middle = len(content) // 2
+        self.assertEqual(self.send_chunk(url, 0, content[:middle])['Upload-Offset'], str(middle))
+        # A retried chunk with a stale offset is refused, not appended twice.
+        self.assertEqual(self.send_chunk(url, 0, content[:middle]).status_code, 409)
+        self.assertEqual(self.client.get(url).json()['offset'], middle)
+
+        self.send_chunk(url, middle, content[middle:])
+        response = self.client.post(f'{url}/complete', {'title': 'Big', 'checksum': hashlib.sha256(content).hexdigest()})
+
+        self.assertEqual(response.status_code, 201)
+        image = ProductImageModel.objects.get(pk=response.json()['id'])
+        with image.image.open('rb') as stored:
+            self.assertEqual(stored.read(), content)
+        self.assertFalse(UploadModel.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'uploads')), [])
+
+    def test_incomplete_upload_cannot_be_finished(self):
+        upload = start_upload('photo.png', 100)
+        url = reverse('product-image-upload-complete', kwargs={'upload_id': upload.pk})
+
+        self.assertEqual(self.client.post(url, {'title': 'Photo'}).status_code, 409)
+
+    def test_expired_uploads_are_pruned(self):
+        upload = start_upload('photo.png', 100)
+        UploadModel.objects.filter(pk=upload.pk).update(updated_at=timezone.now() - timedelta(days=2))
+
+        self.assertEqual(prune_uploads(), 1)
+        self.assertFalse(os.path.exists(get_partial_path(upload)))
+
+
+class CatalogImportExportTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.photo = ProductImageModel.objects.create(title='Photo', image='image.png')
+        self.product = create_product(title='Old title', quantity=1)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def test_csv_import_upserts_products_details_and_images(self):
+        path = self.write('catalog.csv', (
+            'id,title,brand,description,price,price_currency,weight,quantity,images,detail_compound,detail_expiration_date\n'
+            f'{self.product.pk},New title,Optimum,Whey,2500.00,RUB,1.5,7,{self.photo.pk},whey,12\n'
+            f',Protein Bar,,Snack,150,RUB,0.1,30,{self.photo.pk};999,,\n'
+        ))
+
+        call_command('import_catalog', path, '--batch-size', '1', stdout=io.StringIO(), stderr=io.StringIO())
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.title, self.product.quantity), ('New title', 7))
+        self.assertEqual(self.product.productdetailmodel.compound, 'whey')
+        self.assertEqual(list(self.product.images.values_list('pk', flat=True)), [self.photo.pk])
+
+        bar = ProductModel.objects.get(title='Protein Bar')
+        self.assertEqual(bar.price, Money(150, 'RUB'))
+        self.assertEqual(list(bar.images.values_list('pk', flat=True)), [self.photo.pk])
+        self.assertEqual(
+            self.client.get(reverse('products-search'), {'q': 'protein'}).json()['results'][0]['id'], bar.pk,
+        )
+
+    def test_export_round_trips_through_import(self):
+        self.product.images.add(self.photo)
+        ProductDetailModel.objects.create(
+            product=self.product, description='', compound='whey', expiration_date=12, quantity=1,
+        )
+        path = os.path.join(self.directory, 'catalog.jsonl')
+
+        call_command('export_catalog', path, '--chunk-size', '1', stderr=io.StringIO())
+        with open(path, encoding='utf-8') as file:
+            exported = file.read()
+
+        row = json.loads(exported)
+        self.assertEqual(row['images'], [self.photo.pk])
+        self.assertEqual(row['detail_compound'], 'whey')
+
+        ProductModel.objects.all().delete()
+        call_command('import_catalog', path, stdout=io.StringIO())
+        call_command('export_catalog', path, stderr=io.StringIO())
+        with open(path, encoding='utf-8') as file:
+            self.assertEqual(file.read(), exported)
+
+    def test_invalid_row_reports_its_line(self):
+        path = self.write('catalog.csv', (
+            'title,description,price,weight,quantity\n'
+            'Good,Description,100,1,1\n'
+            'Bad,Description,cheap,1,1\n'
+        ))
+
+        with self.assertRaisesMessage(CommandError, 'line 3: price must be a number'):
+            call_command('import_catalog', path, stdout=io.StringIO())
+
+    def test_non_finite_numbers_are_rejected(self):
+        for column, value in [('price', 'NaN'), ('weight', 'Infinity'), ('price', '-inf')]:
+            row = {'price': '100', 'weight': '1', column: value}
+            path = self.write('catalog.csv', (
+                'title,description,price,weight,quantity\n'
+                f"Bar,Description,{row['price']},{row['weight']},1\n"
+            ))
+
+            with self.subTest(column=column, value=value):
+                with self.assertRaisesMessage(CommandError, f'line 2: {column} must be a number'):
+                    call_command('import_catalog', path, stdout=io.StringIO())
+
+    def test_sequence_is_reset_after_explicit_ids_are_created(self):
+        created = self.write('created.csv', (
+            'id,title,description,price,weight,quantity\n'
+            f'{self.product.pk + 100},Imported,Description,100,1,1\n'
+        ))
+        updated = self.write('updated.csv', (
+            'id,title,description,price,weight,quantity\n'
+            f'{self.product.pk},Updated,Description,100,1,1\n'
+        ))
+
+        with mock.patch.object(connection.ops, 'sequence_reset_sql', return_value=[]) as reset:
+            call_command('import_catalog', updated, stdout=io.StringIO())
+            self.assertFalse(reset.called)
+
+            call_command('import_catalog', created, stdout=io.StringIO())
+            reset.assert_called_once_with(mock.ANY, [ProductModel])
+
+        self.assertGreater(create_product().pk, self.product.pk + 100)
+
+
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        catalog_cache.invalidate()
+        image = ProductImageModel.objects.create(title='Photo', image='image.png')
+        self.products = [create_product(title=f'Product {i}') for i in range(3)]
+        self.products[0].images.add(image)
+
+    def assertSameAsSync(self, view_class, path, **kwargs):
+        catalog_cache.invalidate()
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+
+        catalog_cache.invalidate()
+        sync_response = view_class.as_view()(RequestFactory().get(path), **kwargs)
+        sync_response.render()
+        self.assertEqual(response.content, sync_response.content)
+
+    def test_async_reads_match_drf_output(self):
+        self.assertSameAsSync(ProductView, reverse('products'))
+        self.assertSameAsSync(ProductView, reverse('products') + '?page_size=2')
+        self.assertSameAsSync(ProductView, reverse('products-with-pk', kwargs={'pk': self.products[0].pk}),
+                              pk=self.products[0].pk)
+        self.assertSameAsSync(ProductImageView, reverse('product-images'))
+
+    def test_list_prefetches_images(self):
+        with self.assertNumQueries(3):
+            self.client.get(reverse('products'))
+
+    def test_errors_use_drf_format(self):
+        response = self.client.get(reverse('products-with-pk', kwargs={'pk': 999}))
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('detail', response.json())
+
+        response = self.client.get(reverse('products'), {'cursor': 'broken'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_writes_go_through_drf(self):
+        response = self.client.post(reverse('products'), {
+            'title': 'New', 'description': 'Description', 'price': '10.00', 'weight': '1', 'quantity': 1,
+        })
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(ProductModel.objects.filter(title='New').exists())
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'])
+class ReplicaRoutingTests(TransactionTestCase):
+    # replica_0 is a separate SQLite database here, so rows written to it
+    # directly show which database served a read.
+    databases = {'default', 'replica_0'}
+
+    def setUp(self):
+        catalog_cache.invalidate()
+        self.product = create_product(title='Primary')
+        ProductModel.objects.using('replica_0').create(
+            pk=self.product.pk, title='Replica', description='Description', price=100, weight=1, quantity=10,
+        )
+
+    def test_catalog_reads_use_replica(self):
+        self.assertEqual(ProductModel.objects.get(pk=self.product.pk).title, 'Replica')
+        self.assertEqual(TransactionModel.objects.all().db, 'default')
+
+    def test_writes_and_locks_use_primary(self):
+        with transaction.atomic():
+            locked = ProductModel.objects.select_for_update().get(pk=self.product.pk)
+            self.assertEqual(locked.title, 'Primary')
+            self.assertEqual(ProductModel.objects.get(pk=self.product.pk).title, 'Primary')
+
+        create_product(title='New')
+        self.assertTrue(ProductModel.objects.using('default').filter(title='New').exists())
+        self.assertFalse(ProductModel.objects.using('replica_0').filter(title='New').exists())
+
+    def test_client_reads_own_writes_after_writing(self):
+        response = self.client.get(reverse('products-with-pk', kwargs={'pk': self.product.pk}))
+        self.assertEqual(response.json()['title'], 'Replica')
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+        response = self.client.post(reverse('products'), {
+            'title': 'New', 'description': 'Description', 'price': '10.00', 'weight': '1', 'quantity': 1,
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+        response = self.client.get(reverse('products-with-pk', kwargs={'pk': self.product.pk}))
+        self.assertEqual(response.json()['title'], 'Primary')
+
+
+@override_settings(METRICS=dict(settings.METRICS, SAMPLE_RATE=1.0, LOG_SQL=True, TOKEN='scraper-token'))
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        catalog_cache.invalidate()
+        registry.reset()
+        self.product = create_product()
+        self.staff = User.objects.create_user('staff', password='password', is_staff=True)
+
+    def test_records_route_latency_and_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('products'))
+
+        labels = (('method', 'GET'), ('route', 'api/products/'))
+        self.assertEqual(registry.histograms['http_request_duration_seconds'][labels].count, 1)
+        self.assertEqual(registry.histograms['http_request_db_queries'][labels].sum, len(queries))
+        self.assertGreater(registry.histograms['http_response_size_bytes'][labels].sum, 0)
+
+        body = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scraper-token').content.decode()
+        self.assertIn('http_requests_total{method="GET",route="api/products/",status="200"} 1', body)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+
+    def test_serializer_data_is_timed(self):
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        try:
+            ProductSerializer(ProductModel.objects.all(), many=True).data
+            FormSerializer(create_form()).data
+        finally:
+            current_request.reset(token)
+
+        self.assertGreater(metrics.serialization_time, 0)
+        self.assertFalse(metrics.serializing)
+
+    def test_metrics_and_stats_are_restricted(self):
+        urls = [reverse('metrics'), reverse('cache-stats'), reverse('job-stats')]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 403)
+                self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer guess').status_code, 403)
+                self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer scraper-token').status_code, 200)
+
+        self.client.force_login(self.staff)
+        for url in urls:
+            with self.subTest(url=url, user='staff'):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(METRICS=dict(settings.METRICS, SAMPLE_RATE=0))
+    def test_unsampled_requests_only_record_latency(self):
+        self.client.get(reverse('products'))
+
+        self.assertIn('http_request_duration_seconds', registry.histograms)
+        self.assertNotIn('http_request_db_queries', registry.histograms)
+
+    @override_settings(METRICS=dict(settings.METRICS, SAMPLE_RATE=1.0, LOG_SQL=True, SLOW_REQUEST_MS=0))
+    def test_slow_requests_are_logged_with_sql(self):
+        with self.assertLogs('api.metrics', 'WARNING') as logs:
+            self.client.get(reverse('products'))
+
+        self.assertIn('api/products/', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    def test_outbound_calls_are_timed(self):
+        with self.assertRaises(PaymentGatewayError):
+            with track_call('payment_provider', 'get_payment'):
+                raise PaymentGatewayError()
+
+        labels = (('service', 'payment_provider'), ('operation', 'get_payment'), ('outcome', 'error'))
+        self.assertEqual(registry.histograms['external_call_duration_seconds'][labels].count, 1)
+
+
+class BenchmarkSuiteTests(TestCase):
+    def setUp(self):
+        catalog_cache.invalidate()
+        self.gateway = FakePaymentGateway()
+        set_payment_gateway(self.gateway)
+        self.addCleanup(set_payment_gateway, None)
+
+    def test_scenarios_drive_endpoints_without_errors(self):
+        rng = random.Random(0)
+        product_ids = seed_catalog(20, rng)
+        form_ids = seed_forms(10, product_ids, rng)
+
+        results = run_scenarios(product_ids, form_ids, 5, rng)
+
+        self.assertEqual(
+            [result.name for result in results],
+            ['products', 'products-filtered', 'product', 'forms', 'pay', 'payment-status'],
+        )
+        self.assertTrue(all(result.errors == 0 and result.queries > 0 for result in results))
+        self.assertEqual(self.gateway.calls['create'], 5)
+
+    def test_regressions_against_baseline(self):
+        result = ScenarioResult('products', 10, 0, 100.0, 0.010, 0.020, 0.030, 3.0)
+        baseline = json.loads(dump_baseline([result], {'products': 10}))
+
+        self.assertEqual(find_regressions([result], baseline), [])
+
+        slower = ScenarioResult('products', 10, 0, 50.0, 0.020, 0.040, 0.060, 4.0)
+        self.assertEqual(len(find_regressions([slower], baseline, tolerance=0.5)), 2)
+
+    def test_percentile_uses_nearest_rank(self):
+        values = [float(value) for value in range(1, 101)]
+
+        self.assertEqual(percentile(values, 0.5), 50.0)
+        self.assertEqual(percentile(values, 0.99), 99.0)
+        self.assertEqual(percentile([], 0.95), 0.0)
+
+
+class StockHoldTests(TestCase):
+    def setUp(self):
+        self.gateway = FakePaymentGateway()
+        set_payment_gateway(self.gateway)
+        self.addCleanup(set_payment_gateway, None)
+
+        self.form = create_form()
+        self.product = create_product(quantity=5)
+        ProductPositionModel.objects.create(form=self.form, product=self.product, quantity=2)
+
+    def pay(self):
+        return self.client.post(
+            reverse('pay'), {'form_id': self.form.pk, 'credentials': 'Order'}, content_type='application/json',
+        )
+
+    def quantity(self):
+        self.product.refresh_from_db()
+        return self.product.quantity
+
+    def test_checkout_holds_stock_until_paid(self):
+        payment_id = self.pay().json()['payment_id']
+
+        self.assertEqual(self.quantity(), 3)
+        self.assertEqual(StockHoldModel.objects.get().status, 'held')
+
+        payment_status_handler(payment_id, 'succeeded')
+        run_pending_jobs()
+
+        self.assertEqual(self.quantity(), 3)
+        self.assertEqual(StockHoldModel.objects.get().status, 'committed')
+        self.assertTrue(TransactionModel.objects.get().stock_settled)
+
+    def test_failed_payment_releases_stock(self):
+        payment_id = self.pay().json()['payment_id']
+
+        payment_status_handler(payment_id, 'canceled')
+        run_pending_jobs()
+
+        self.assertEqual(self.quantity(), 5)
+        self.assertEqual(StockHoldModel.objects.get().status, 'released')
+
+    def test_expired_hold_is_swept_and_retaken_on_success(self):
+        payment_id = self.pay().json()['payment_id']
+        StockHoldModel.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(release_expired_holds(), 1)
+        self.assertEqual(release_expired_holds(), 0)
+        self.assertEqual(self.quantity(), 5)
+
+        payment_status_handler(payment_id, 'succeeded')
+        run_pending_jobs()
+
+        self.assertEqual(self.quantity(), 3)
+
+    def test_retried_checkout_extends_the_hold(self):
+        transaction = TransactionModel(form=self.form, amount=Money(200, 'RUB'))
+        self.assertTrue(hold_stock(transaction, ttl=10))
+        self.assertTrue(hold_stock(transaction, ttl=1000))
+
+        self.assertEqual(self.quantity(), 3)
+        self.assertGreater(StockHoldModel.objects.get().expires_at, timezone.now() + timedelta(seconds=900))
+
+    def test_expired_hold_is_retaken_when_stock_is_gone(self):
+        payment_id = self.pay().json()['payment_id']
+        StockHoldModel.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        release_expired_holds()
+        ProductModel.objects.filter(pk=self.product.pk).update(quantity=1)
+
+        payment_status_handler(payment_id, 'succeeded')
+        run_pending_jobs()
+
+        self.assertEqual(self.quantity(), 1)
+        self.assertEqual(StockHoldModel.objects.get().status, 'released')
+        self.assertFalse(TransactionModel.objects.get().stock_settled)
+
+    def test_repeated_checkout_retakes_an_expired_hold(self):
+        first = self.pay().json()
+        StockHoldModel.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        release_expired_holds()
+
+        self.assertEqual(self.pay().json(), first)
+        self.assertEqual(self.quantity(), 3)
+        self.assertEqual(StockHoldModel.objects.get().status, 'held')
+
+        StockHoldModel.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        release_expired_holds()
+        ProductModel.objects.filter(pk=self.product.pk).update(quantity=1)
+
+        self.assertEqual(self.pay().status_code, 409)
+        self.assertEqual(self.quantity(), 1)
+
+    def test_committed_hold_is_not_taken_again(self):
+        transaction = TransactionModel(form=self.form, amount=Money(200, 'RUB'))
+        hold_stock(transaction)
+        StockHoldModel.objects.update(status='committed')
+
+        self.assertTrue(hold_stock(transaction))
+        self.assertEqual(self.quantity(), 3)
+        self.assertEqual(StockHoldModel.objects.get().status, 'committed')
+
+    def test_hold_without_stock_leaves_nothing_behind(self):
+        ProductModel.objects.filter(pk=self.product.pk).update(quantity=1)
+
+        response = self.pay()
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(TransactionModel.objects.exists())
+        self.assertFalse(StockHoldModel.objects.exists())
+        self.assertEqual(self.quantity(), 1)
+
+
+class StockHoldConcurrencyTests(TransactionTestCase):
+    CHECKOUTS = 200
+    STOCK = 60
+
+    def test_concurrent_checkouts_on_one_product_never_oversell(self):
+        product = create_product(quantity=self.STOCK)
+        checkouts = []
+        for _ in range(self.CHECKOUTS):
+            form = create_form()
+            ProductPositionModel.objects.create(form=form, product=product, quantity=1)
+            checkouts.append(TransactionModel(form=form, amount=Money(100, 'RUB')))
+
+        start = threading.Barrier(self.CHECKOUTS)
+
+        def checkout(transaction):
+            try:
+                start.wait()
+                return bool(hold_stock(transaction))
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.CHECKOUTS) as executor:
+            results = list(executor.map(checkout, checkouts))
+
+        product.refresh_from_db()
+        self.assertEqual(results.count(True), self.STOCK)
+        self.assertEqual(product.quantity, 0)
+        self.assertEqual(StockHoldModel.objects.count(), self.STOCK)
+        self.assertEqual(TransactionModel.objects.count(), self.STOCK)
+
+
+class ProductCardTests(TestCase):
+    def setUp(self):
+        self.image = ProductImageModel.objects.create(title='Photo', image='image.png')
+        self.product = create_product(title='Tea', quantity=7)
+        self.product.images.add(self.image)
+        ProductDetailModel.objects.create(
+            product=self.product, description='Leaves', compound='Tea', expiration_date=12, quantity=1,
+        )
+
+    def get_card(self):
+        return self.client.get(reverse('product-cards-with-pk', kwargs={'pk': self.product.pk})).json()
+
+    def test_card_embeds_images_and_details(self):
+        card = self.get_card()
+
+        self.assertEqual(card['title'], 'Tea')
+        self.assertEqual(card['quantity'], 7)
+        self.assertEqual(card['images'][0]['title'], 'Photo')
+        self.assertEqual(card['images'][0]['image'], '/media/image.png')
+        self.assertIn('small', card['images'][0]['variants'])
+        self.assertEqual(card['detail']['compound'], 'Tea')
+
+    def test_page_is_read_with_one_card_query(self):
+        for i in range(5):
+            create_product(title=f'Product {i}').images.add(self.image)
+
+        # The table version stamp for the ETag, then the cards themselves.
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('product-cards'), {'page_size': 3})
+
+        self.assertEqual(len(response.json()['results']), 3)
+        self.assertIsNotNone(response.json()['next'])
+
+    def test_cards_follow_source_changes(self):
+        self.product.title = 'Green tea'
+        self.product.save()
+        self.image.title = 'Front'
+        self.image.save()
+        ProductModel.objects.filter(pk=self.product.pk).update(quantity=2)
+
+        card = self.get_card()
+        self.assertEqual(card['title'], 'Green tea')
+        self.assertEqual(card['images'][0]['title'], 'Front')
+        self.assertEqual(card['quantity'], 2)
+
+        self.product.images.remove(self.image)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.productdetailmodel.delete()
+
+        card = self.get_card()
+        self.assertEqual(card['images'], [])
+        self.assertIsNone(card['detail'])
+
+    def test_quantity_only_save_skips_the_rebuild(self):
+        self.product.quantity = 3
+
+        with mock.patch('api.signals.refresh_cards') as refresh:
+            self.product.save(update_fields=['quantity'])
+            self.assertFalse(refresh.called)
+
+            self.product.save(update_fields=['quantity', 'title'])
+            refresh.assert_called_once_with([self.product.pk])
+
+        self.assertEqual(self.get_card()['quantity'], 3)
+
+    def test_card_is_removed_with_its_product(self):
+        self.product.delete()
+
+        self.assertFalse(ProductCardModel.objects.exists())
+
+
+class FastSerializationTests(TestCase):
+    def setUp(self):
+        catalog_cache.invalidate()
+        images = [ProductImageModel.objects.create(title=f'Photo {i}', image='image.png') for i in range(3)]
+        self.products = [
+            create_product(
+                title='Чай', brand='Марка', description='Line\u2028break \u2029 "quoted" \\', price='10.5',
+            ),
+            create_product(title='Coffee', brand=None, price='0.01', weight='2.5', quantity=0),
+            create_product(title='Cocoa', price='12345.678'),
+        ]
+        self.products[0].images.add(images[2], images[0])
+        self.products[2].images.add(images[1])
+
+        form = create_form(name='Покупатель', comment=None)
+        ProductPositionModel.objects.create(form=form, product=self.products[1], quantity=2)
+        ProductPositionModel.objects.create(form=form, product=self.products[0], quantity=1)
+        create_form(comment='Call first')
+
+    def get_content(self, path, params, fast, view_class=None):
+        catalog_cache.invalidate()
+        with override_settings(FAST_SERIALIZATION=fast):
+            if view_class is None:
+                return self.client.get(path, params).content
+
+            response = view_class.as_view()(RequestFactory().get(path, params))
+            return response.render().content
+
+    def assertSameBytes(self, path, params=None, view_class=None):
+        expected = self.get_content(path, params or {}, False, view_class)
+        self.assertEqual(self.get_content(path, params or {}, True, view_class), expected)
+        return expected
+
+    def test_product_lists_match_serializers(self):
+        for params in ({}, {'page_size': 2}, {'brand': 'Марка'}, {'in_stock': '1'}):
+            self.assertSameBytes(reverse('products'), params)
+            self.assertSameBytes(reverse('products'), params, ProductView)
+
+        content = self.assertSameBytes(reverse('products'))
+        self.assertIn(b'\\u2028', content)
+        self.assertIn('"price":"10.50"'.encode(), content)
+
+    def test_cursor_pages_match_serializers(self):
+        first = json.loads(self.assertSameBytes(reverse('products'), {'page_size': 1}))
+        cursor = QueryDict(first['next'].split('?')[1])['cursor']
+
+        second = json.loads(self.assertSameBytes(reverse('products'), {'page_size': 1, 'cursor': cursor}))
+        self.assertEqual(second['results'][0]['title'], 'Coffee')
+
+    def test_form_lists_match_serializers(self):
+        content = self.assertSameBytes(reverse('forms'))
+        self.assertSameBytes(reverse('forms'), {'page_size': 1})
+
+        self.assertEqual(json.loads(content)[0]['products'], [
+            {'product': self.products[1].pk, 'quantity': 2},
+            {'product': self.products[0].pk, 'quantity': 1},
+        ])
+
+    def test_list_uses_two_row_queries(self):
+        catalog_cache.invalidate()
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse('forms'))
+
+        self.assertEqual(len(context.captured_queries), 2)
+
+    def test_encoder_fallback_matches(self):
+        data = [{'title': 'Чай\u2028', 'brand': None, 'images': [1, 2], 'price': '10.50', 'weight': '\x00\ud7ff'}]
+
+        with mock.patch('api.fastjson.orjson', None):
+            fallback = dumps(data)
+
+        self.assertEqual(dumps(data), fallback)
+
+    def test_indented_output_is_still_honoured(self):
+        response = self.client.get(reverse('forms'), HTTP_ACCEPT='application/json; indent=2')
+
+        self.assertTrue(response.content.startswith(b'[\n  {'))
+
+
+class BatchLookupTests(TestCase):
+    def setUp(self):
+        catalog_cache.invalidate()
+        self.images = [ProductImageModel.objects.create(title=f'Photo {i}', image='image.png') for i in range(2)]
+        self.products = [create_product(title=f'Product {i}') for i in range(3)]
+        self.products[0].images.add(*self.images)
+
+    def test_ids_query_returns_results_keyed_by_id(self):
+        ids = [self.products[2].pk, 999, self.products[0].pk]
+
+        with self.assertNumQueries(3):
+            data = self.client.get(reverse('products'), {'ids': ','.join(map(str, ids))}).json()
+
+        self.assertEqual(list(data['results']), [str(pk) for pk in ids])
+        self.assertEqual(data['results'][str(self.products[0].pk)]['images'], [image.pk for image in self.images])
+        self.assertIsNone(data['results']['999'])
+        self.assertEqual(data['not_found'], [999])
+
+    def test_post_batch_matches_get(self):
+        ids = [image.pk for image in self.images] + [999]
+
+        response = self.client.post(reverse('product-images-batch'), {'ids': ids}, content_type='application/json')
+        sync_response = ProductImageView.as_view()(
+            RequestFactory().get(reverse('product-images'), {'ids': ','.join(map(str, ids))}),
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), sync_response.render().data)
+        self.assertEqual(response.json()['results'][str(self.images[1].pk)]['title'], 'Photo 1')
+
+        response = self.client.post(reverse('products-batch'), {'ids': [self.products[1].pk]},
+                                    content_type='application/json')
+        self.assertEqual(response.json()['results'][str(self.products[1].pk)]['title'], 'Product 1')
+
+    def test_invalid_and_oversized_batches_are_rejected(self):
+        for ids in ('1,x', ','.join(str(pk) for pk in range(1, 102))):
+            response = self.client.get(reverse('products'), {'ids': ids})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('ids', response.json())
+
+        response = self.client.post(reverse('products-batch'), {'ids': 'nope'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        for body in [{'ids': [1.9]}, {'ids': [True]}, {'ids': ['-1']}, {'ids': ['1e3']}, [1, 2]]:
+            with self.subTest(body=body):
+                response = self.client.post(reverse('products-batch'), body, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('ids', response.json())
+
+    def test_id_filter_returns_a_list(self):
+        response = self.client.get(reverse('products'), {'id': self.products[1].pk})
+        self.assertEqual([product['title'] for product in response.json()], ['Product 1'])
+
+        response = self.client.get(reverse('forms'), {'form_id': create_form().pk})
+        self.assertEqual(len(response.json()), 1)
+
+
+class OrderExportTests(TestCase):
+    def setUp(self):
+        self.product = create_product()
+        self.form = create_form(name='Покупатель', comment='Позвонить, "до" обеда')
+        ProductPositionModel.objects.create(form=self.form, product=self.product, quantity=2)
+        self.paid = TransactionModel.objects.create(form=self.form, transaction_status='paid', amount=Money(200, 'RUB'))
+        self.pending = TransactionModel.objects.create(form=create_form())
+        self.old = TransactionModel.objects.create(
+            form=self.form, transaction_status='paid', timestamp=timezone.now() - timedelta(days=400),
+        )
+        self.buyer = User.objects.create_user('buyer', password='password')
+        self.async_client.force_login(User.objects.create_user('staff', password='password', is_staff=True))
+
+    async def export(self, **params):
+        response = await self.async_client.get(reverse('orders-export'), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+    async def test_jsonl_export_joins_orders(self):
+        rows = [json.loads(line) for line in (await self.export()).splitlines()]
+
+        self.assertEqual([row['transaction_id'] for row in rows], [self.paid.pk, self.pending.pk, self.old.pk])
+        self.assertEqual(rows[0]['name'], 'Покупатель')
+        self.assertEqual(rows[0]['amount'], '200.00')
+        self.assertEqual(rows[0]['items'], [{'product': self.product.pk, 'quantity': 2}])
+        self.assertEqual(rows[1]['items'], [])
+
+    async def test_csv_export_filters_and_resumes(self):
+        since = (timezone.now() - timedelta(days=30)).date().isoformat()
+        lines = (await self.export(format='csv', status='paid', date_from=since)).splitlines()
+
+        self.assertEqual(lines[0].split(',')[:3], ['transaction_id', 'timestamp', 'status'])
+        self.assertEqual(len(lines), 2)
+        self.assertIn(f'{self.product.pk}:2', lines[1])
+        self.assertIn('"Позвонить, ""до"" обеда"', lines[1])
+
+        lines = (await self.export(format='csv', after=self.pending.pk)).splitlines()
+        self.assertEqual([line.split(',')[0] for line in lines[1:]], [str(self.old.pk)])
+
+    async def test_export_is_for_staff_only(self):
+        await self.async_client.alogout()
+        self.assertEqual((await self.async_client.get(reverse('orders-export'))).status_code, 403)
+
+        await self.async_client.aforce_login(self.buyer)
+        self.assertEqual((await self.async_client.get(reverse('orders-export'))).status_code, 403)
+
+    async def test_invalid_parameters_are_rejected_before_streaming(self):
+        for params in ({'format': 'xml'}, {'after': 'x'}, {'date_from': 'yesterday'}, {'form_id': 'abc'}):
+            response = await self.async_client.get(reverse('orders-export'), params)
+            self.assertEqual(response.status_code, 400)
+
+    def test_command_resumes_from_watermark(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'orders.csv')
+        watermark = os.path.join(directory, 'orders.watermark')
+
+        call_command('export_orders', path, '--watermark-file', watermark, '--chunk-size', '2', stderr=io.StringIO())
+        with open(watermark) as file:
+            self.assertEqual(int(file.read()), self.old.pk)
+
+        newer = TransactionModel.objects.create(form=self.form)
+        call_command('export_orders', path, '--watermark-file', watermark, stderr=io.StringIO())
+
+        with open(path, encoding='utf-8') as file:
+            lines = file.read().splitlines()
+        self.assertEqual(
+            [line.split(',')[0] for line in lines],
+            ['transaction_id', str(self.paid.pk), str(self.pending.pk), str(self.old.pk), str(newer.pk)],
+        )
+
+
+class PaymentStatusPollingTests(TestCase):
+    def setUp(self):
+        self.gateway = FakePaymentGateway(latency=0.05)
+        self.gateway.payments['payment-1'] = PaymentResult(id='payment-1', status='pending', confirmation_url='url')
+        set_payment_gateway(self.gateway)
+        self.now = 0.0
+        set_status_cache(PaymentStatusCache(ttl=5, max_entries=100, clock=lambda: self.now))
+        self.transaction = TransactionModel.objects.create(form=create_form(), payment_id='payment-1')
+        self.other_form = create_form()
+
+    def tearDown(self):
+        set_payment_gateway(None)
+        set_status_cache(None)
+
+    async def poll(self, payment_id='payment-1'):
+        response = await self.async_client.get(reverse('payment-status'), {'payment_id': payment_id})
+        return response.json()
+
+    async def test_concurrent_polls_share_one_provider_call(self):
+        self.gateway.set_status('payment-1', 'succeeded')
+
+        results = await asyncio.gather(*[self.poll() for _ in range(20)])
+
+        self.assertEqual(results, [{'status': 'paid'}] * 20)
+        self.assertEqual(self.gateway.calls['get'], 1)
+        self.assertEqual(await JobModel.objects.filter(name='settle_stock').acount(), 1)
+
+        # Terminal statuses are answered from memory from then on.
+        self.now += 3600
+        self.assertEqual(await self.poll(), {'status': 'paid'})
+        self.assertEqual(self.gateway.calls['get'], 1)
+
+    async def test_pending_status_is_rechecked_after_ttl(self):
+        self.assertEqual(await self.poll(), {'status': 'pending'})
+        self.assertEqual(await self.poll(), {'status': 'pending'})
+        self.assertEqual(self.gateway.calls['get'], 1)
+
+        self.now += 6
+        self.gateway.set_status('payment-1', 'canceled')
+        self.assertEqual(await self.poll(), {'status': 'failed'})
+        self.assertEqual(self.gateway.calls['get'], 2)
+
+    async def test_payment_id_is_read_from_the_body(self):
+        url = reverse('payment-status')
+
+        response = await self.async_client.generic(
+            'GET', url, json.dumps({'payment_id': 'payment-1'}), content_type='application/json',
+        )
+        self.assertEqual(response.json(), {'status': 'pending'})
+
+        response = await self.async_client.generic(
+            'GET', url, 'payment_id=payment-1', content_type='application/x-www-form-urlencoded',
+        )
+        self.assertEqual(response.json(), {'status': 'pending'})
+
+        response = await self.async_client.generic('GET', url, '["payment-1"]', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    async def test_blank_payment_id_is_rejected(self):
+        await TransactionModel.objects.acreate(form=self.other_form)
+        await TransactionModel.objects.acreate(form=self.other_form, transaction_status='failed')
+
+        for params in ({}, {'payment_id': ''}):
+            with self.subTest(params=params):
+                response = await self.async_client.get(reverse('payment-status'), params)
+                self.assertEqual(response.status_code, 400)
+
+        self.assertEqual(self.gateway.calls['get'], 0)
+
+    async def test_provider_errors_fall_back_to_local_status(self):
+        await TransactionModel.objects.acreate(form=self.other_form, payment_id='payment-2')
+
+        self.assertEqual(await self.poll('payment-2'), {'status': 'pending'})
+
+        response = await self.async_client.get(reverse('payment-status'), {'payment_id': 'missing'})
+        self.assertEqual(response.status_code, 404)
+
+
+class PaymentTransitionConcurrencyTests(TransactionTestCase):
+    HANDLERS = 20
+
+    def test_concurrent_handlers_apply_a_transition_once(self):
+        form = create_form()
+        TransactionModel.objects.create(form=form, payment_id='payment-1')
+        start = threading.Barrier(self.HANDLERS)
+
+        def apply(status):
+            try:
+                start.wait()
+                return payment_status_handler('payment-1', status)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.HANDLERS) as executor:
+            results = list(executor.map(apply, ['succeeded'] * self.HANDLERS))
+
+        self.assertEqual(results, ['paid'] * self.HANDLERS)
+        self.assertEqual(JobModel.objects.filter(name='settle_stock').count(), 1)
+        self.assertEqual(JobModel.objects.filter(name='send_order_email').count(), 1)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        catalog_cache.invalidate()
+        # Repeated titles, so pages have to break ties on the id.
+        self.products = [create_product(title=f'Product {i // 3}') for i in range(7)]
+        self.expected = [
+            product.pk for product in sorted(self.products, key=lambda product: (product.title, product.pk))
+        ]
+
+    def get_page(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def encode_cursor(self, payload):
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    def test_pages_walk_forward_and_back_without_gaps(self):
+        page = self.get_page(reverse('products'), {'page_size': 2})
+        self.assertIsNone(page['previous'])
+
+        pages = [page]
+        while page['next']:
+            page = self.get_page(page['next'])
+            pages.append(page)
+
+        self.assertEqual([product['id'] for page in pages for product in page['results']], self.expected)
+        self.assertEqual([len(page['results']) for page in pages], [2, 2, 2, 1])
+
+        previous = self.get_page(pages[-1]['previous'])
+        self.assertEqual(previous['results'], pages[-2]['results'])
+        self.assertIsNotNone(previous['next'])
+
+    def test_cursor_keeps_page_size(self):
+        page = self.get_page(reverse('products'), {'page_size': 3})
+
+        self.assertEqual(QueryDict(page['next'].split('?')[1])['page_size'], '3')
+        self.assertEqual(len(self.get_page(page['next'])['results']), 3)
+
+    def test_page_size_is_bounded(self):
+        for page_size, expected in (('0', 7), ('-1', 7), ('x', 7), ('1000', 7), ('5', 5)):
+            with self.subTest(page_size=page_size):
+                page = self.get_page(reverse('products'), {'page_size': page_size})
+                self.assertEqual(len(page['results']), expected)
+
+        request = RequestFactory().get('/', {'page_size': '1000'})
+        self.assertEqual(KeysetPagination().get_page_size(Request(request)), MAX_PAGE_SIZE)
+
+    def test_tampered_cursors_are_rejected(self):
+        cursors = [
+            'broken',
+            self.encode_cursor({'p': ['Product 0'], 'r': 0}),
+            self.encode_cursor({'p': 'Product 0', 'r': 0}),
+            self.encode_cursor({'position': ['Product 0', 1]}),
+            base64.urlsafe_b64encode(b'not json').decode(),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('products'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+    def test_unpaginated_request_returns_plain_list(self):
+        data = self.get_page(reverse('products'))
+
+        self.assertEqual([product['id'] for product in data], self.expected)
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import tempfile
+from typing import Dict, Final, List
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.urls import reverse
+from django.utils.http import quote_etag
+from PIL import Image, ImageOps
+
+from .files import file_checksum
+from .models import ProductImageModel
+
+
+CONTENT_TYPES: Final[Dict[str, str]] = {
+    'WEBP': 'image/webp',
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+}
+EXTENSIONS: Final[Dict[str, str]] = {
+    'WEBP': 'webp',
+    'JPEG': 'jpg',
+    'PNG': 'png',
+}
+# Length of the checksum prefix used as a cache-busting URL parameter.
+VERSION_LENGTH: Final[int] = 16
+
+
+class UnknownVariant(KeyError):
+    pass
+
+
+def get_variant(name: str) -> dict:
+    try:
+        return settings.THUMBNAILS['VARIANTS'][name]
+    except KeyError:
+        raise UnknownVariant(name)
+
+
+def get_checksum(image: ProductImageModel) -> str:
+    """
+    Returns the source checksum, filling it in for rows stored before
+    checksums were recorded.
+    """
+    if not image.checksum:
+        image.checksum = file_checksum(image.image)
+        # Saved through the model so the signals bump the table versions and
+        # rebuild the cards: the variant URLs change with the checksum.
+        image.save(update_fields=['checksum'])
+
+    return image.checksum
+
+
+def variant_key(checksum: str, name: str) -> str:
+    """
+    Content address of a derivative: the same source rendered with the same
+    spec always maps to the same file, whichever row it belongs to.
+    """
+    spec = json.dumps(get_variant(name), sort_keys=True)
+    return hashlib.sha256(f'{checksum}:{spec}'.encode()).hexdigest()
+
+
+def variant_path(checksum: str, name: str) -> str:
+    key = variant_key(checksum, name)
+    extension = EXTENSIONS[get_variant(name)['format']]
+    return f'{key[:2]}/{key}.{extension}'
+
+
+def render_variant(source, spec: dict, destination: str) -> None:
+    """
+    Writes the derivative to a temporary file next to `destination` and
+    renames it into place, so concurrent renders of the same variant never
+    expose a partial file.
+    """
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        image.thumbnail((spec['width'], spec['height']), Image.Resampling.LANCZOS)
+
+        if spec['format'] == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(destination), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as output:
+                image.save(output, spec['format'], quality=spec.get('quality', 85))
+
+            os.replace(temporary, destination)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+            raise
+
+
+def get_variant_file(image: ProductImageModel, name: str) -> str:
+    """
+    Returns the absolute path of the derivative, rendering it on a miss.
+    """
+    spec = get_variant(name)
+    path = os.path.join(settings.THUMBNAILS['ROOT'], variant_path(get_checksum(image), name))
+
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with image.image.open('rb') as source:
+            render_variant(source, spec, path)
+
+    return path
+
+
+def generate_variants(image: ProductImageModel) -> List[str]:
+    return [get_variant_file(image, name) for name in settings.THUMBNAILS['VARIANTS']]
+
+
+def variant_urls(image: ProductImageModel, request=None) -> Dict[str, str]:
+    version = image.checksum[:VERSION_LENGTH]
+    urls = {}
+
+    for name in settings.THUMBNAILS['VARIANTS']:
+        url = reverse('product-image-variant', kwargs={'pk': image.pk, 'variant': name})
+        if version:
+            url = f'{url}?v={version}'
+
+        urls[name] = request.build_absolute_uri(url) if request is not None else url
+
+    return urls
+
+
+def variant_response(request, image: ProductImageModel, name: str, path: str) -> HttpResponse:
+    """
+    Serves a derivative. Versioned URLs are immutable and cached for
+    THUMBNAILS['MAX_AGE']; the file itself goes out through the server's
+    sendfile support, either FileResponse's `wsgi.file_wrapper` or an
+    X-Accel-Redirect to the proxy when configured.
+    """
+    etag = quote_etag(os.path.basename(path).split('.')[0])
+    versioned = request.GET.get('v') == image.checksum[:VERSION_LENGTH]
+    cache_control = (
+        f"public, max-age={settings.THUMBNAILS['MAX_AGE']}, immutable"
+        if versioned else 'public, max-age=0, must-revalidate'
+    )
+
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    elif settings.THUMBNAILS['ACCEL_REDIRECT']:
+        response = HttpResponse(content_type=CONTENT_TYPES[get_variant(name)['format']])
+        relative = os.path.relpath(path, settings.THUMBNAILS['ROOT'])
+        response['X-Accel-Redirect'] = f"{settings.THUMBNAILS['ACCEL_REDIRECT'].rstrip('/')}/{relative}"
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=CONTENT_TYPES[get_variant(name)['format']])
+
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    return response
@@ -0,0 +1,145 @@
+import os
+from datetime import timedelta
+from typing import Final
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.utils import timezone
+
+from .files import file_checksum
+from .models import UploadModel
+from .serializers import ProductImageSerializer
+
+
+READ_CHUNK_SIZE: Final[int] = 64 * 1024
+
+
+class UploadError(Exception):
+    status_code = 400
+
+
+class UploadTooLarge(UploadError):
+    status_code = 413
+
+
+class OffsetMismatch(UploadError):
+    status_code = 409
+
+
+class UploadIncomplete(UploadError):
+    status_code = 409
+
+
+class PartialUpload(UploadedFile):
+    """
+    A finished partial file handed to the serializer. Exposing
+    `temporary_file_path` lets Pillow verify it from disk and lets the
+    storage move it into MEDIA_ROOT instead of copying it.
+    """
+
+    def __init__(self, file, name, size, path):
+        super().__init__(file, name, None, size)
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def get_partial_path(upload: UploadModel) -> str:
+    return os.path.join(settings.RESUMABLE_UPLOADS['ROOT'], f'{upload.pk}.part')
+
+
+def start_upload(filename: str, size: int) -> UploadModel:
+    if size <= 0:
+        raise UploadError("size must be positive")
+    if size > settings.RESUMABLE_UPLOADS['MAX_SIZE']:
+        raise UploadTooLarge(f"uploads are limited to {settings.RESUMABLE_UPLOADS['MAX_SIZE']} bytes")
+
+    os.makedirs(settings.RESUMABLE_UPLOADS['ROOT'], exist_ok=True)
+    upload = UploadModel.objects.create(filename=os.path.basename(filename), size=size)
+    open(get_partial_path(upload), 'wb').close()
+    return upload
+
+
+def append_chunk(upload_id, offset: int, stream, length: int) -> UploadModel:
+    """
+    Copies `length` bytes from `stream` to the partial file at `offset`,
+    READ_CHUNK_SIZE at a time. The session row is locked for the write and
+    `offset` must match what the server has, so a retried or concurrent
+    chunk can never leave a gap or overlap. A body cut short still counts
+    for the bytes that arrived; the client resumes from the new offset.
+    """
+    with transaction.atomic():
+        upload = UploadModel.objects.select_for_update().get(pk=upload_id)
+
+        if offset != upload.offset:
+            raise OffsetMismatch(f"expected offset {upload.offset}")
+        if offset + length > upload.size:
+            raise UploadTooLarge("chunk goes past the declared size")
+
+        written = 0
+        with open(get_partial_path(upload), 'r+b') as output:
+            output.seek(offset)
+            output.truncate()
+
+            while written < length:
+                chunk = stream.read(min(READ_CHUNK_SIZE, length - written))
+                if not chunk:
+                    break
+
+                output.write(chunk)
+                written += len(chunk)
+
+        upload.offset = offset + written
+        upload.updated_at = timezone.now()
+        upload.save(update_fields=['offset', 'updated_at'])
+
+    return upload
+
+
+def complete_upload(upload_id, title: str, checksum: str = None):
+    """
+    Turns a finished upload into a ProductImageModel row and returns its
+    serializer. `checksum`, when given, must match the received bytes.
+    """
+    upload = UploadModel.objects.get(pk=upload_id)
+    if upload.offset != upload.size:
+        raise UploadIncomplete(f"received {upload.offset} of {upload.size} bytes")
+
+    path = get_partial_path(upload)
+    with open(path, 'rb') as source:
+        image = PartialUpload(source, upload.filename, upload.size, path)
+        image.checksum = file_checksum(image)
+
+        if checksum and checksum.lower() != image.checksum:
+            raise UploadError("checksum does not match the uploaded data")
+
+        serializer = ProductImageSerializer(data={'title': title, 'image': image})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+    discard_upload(upload)
+    return serializer
+
+
+def discard_upload(upload: UploadModel) -> None:
+    path = get_partial_path(upload)
+    if os.path.exists(path):
+        os.remove(path)
+
+    upload.delete()
+
+
+def prune_uploads(expire_after: int = None) -> int:
+    """
+    Removes sessions without a chunk for `expire_after` seconds.
+    """
+    expire_after = expire_after or settings.RESUMABLE_UPLOADS['EXPIRE_AFTER']
+    deadline = timezone.now() - timedelta(seconds=expire_after)
+
+    expired = list(UploadModel.objects.filter(updated_at__lt=deadline))
+    for upload in expired:
+        discard_upload(upload)
+
+    return len(expired)
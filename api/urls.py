@@ -1,22 +1,58 @@
 from django.urls import path
 from .views import (
     ProductView,
+    product_read,
+    product_search,
+    product_batch,
     ProductImageView,
+    product_image_read,
+    product_image_batch,
+    product_image_variant,
+    product_image_upload_start,
+    product_image_upload,
+    product_image_upload_complete,
+    ProductCardView,
     FormView,
+    TransactionView,
+    orders_export,
     pay,
     payment_status,
+    payment_webhook,
     payment_succeed,
+    cache_stats,
+    job_stats,
+    metrics,
+    read_write_view,
 )
 
 
+product_view = read_write_view(product_read, ProductView)
+product_image_view = read_write_view(product_image_read, ProductImageView)
+
+
 urlpatterns = [
-    path('products/', ProductView.as_view() , name="products"),
-    path('products/<int:pk>', ProductView.as_view(), name="products-with-pk"),
-    path('product-images/', ProductImageView.as_view(), name="product-images"),
-    path('product-images/<int:pk>', ProductImageView.as_view(), name="product-images-with-pk"),
+    path('products/', product_view, name="products"),
+    path('products/<int:pk>', product_view, name="products-with-pk"),
+    path('products/search/', product_search, name="products-search"),
+    path('products/batch/', product_batch, name="products-batch"),
+    path('product-images/', product_image_view, name="product-images"),
+    path('product-images/<int:pk>', product_image_view, name="product-images-with-pk"),
+    path('product-images/batch/', product_image_batch, name="product-images-batch"),
+    path('product-images/uploads/', product_image_upload_start, name="product-image-uploads"),
+    path('product-images/uploads/<uuid:upload_id>', product_image_upload, name="product-image-upload"),
+    path('product-images/uploads/<uuid:upload_id>/complete', product_image_upload_complete, name="product-image-upload-complete"),
+    path('product-images/<int:pk>/<slug:variant>', product_image_variant, name="product-image-variant"),
+    path('product-cards/', ProductCardView.as_view(), name="product-cards"),
+    path('product-cards/<int:pk>', ProductCardView.as_view(), name="product-cards-with-pk"),
     path('forms/', FormView.as_view(), name="forms"),
     path('forms/<int:pk>', FormView.as_view(), name="forms-with-pk"),
+    path('transactions/', TransactionView.as_view(), name="transactions"),
+    path('orders/export/', orders_export, name="orders-export"),
     path('pay/', pay, name='pay'),
     path('payment/status/', payment_status, name='payment-status'),
-    path('payment/succeed/', payment_succeed, name="payment-succeed")
+    path('payment/webhook/', payment_webhook, name='payment-webhook'),
+    path('payment/succeed/', payment_succeed, name="payment-succeed"),
+    path('cache/stats/', cache_stats, name="cache-stats"),
+    path('jobs/stats/', job_stats, name="job-stats"),
+    path('metrics/', metrics, name="metrics"),
 ]
\ No newline at end of file
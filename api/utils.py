@@ -1,53 +1,103 @@
-import uuid
 import typing
-from yookassa import Payment
-from .models import TransactionModel, ProductModel, ProductPositionModel 
+from asgiref.sync import sync_to_async
+from .models import TransactionModel, ProductModel
+from .jobs import enqueue
+from .metrics import track_call
+from .payments import PaymentResult, get_payment_gateway
+from .pricing import aget_subtotals, get_total
+from .stock import hold_stock
 from django.core.mail import send_mail
+from django.db import IntegrityError
+from django.db.transaction import atomic
 
 import logging
 
 logger = logging.getLogger(__name__)
 
+RETURN_URL: typing.Final[str] = "127.0.0.0:8000/api/payment_succeed"
 
-def create_payment(product_positions: typing.List[ProductPositionModel], form, credentials):
-    transactions = TransactionModel.objects.filter(form=form, transaction_status='pending')
-    if transactions.exists():
-        return Payment.find_one(transactions.first().payment_id)
-    
-    amount = 0
-    for product_position in product_positions:
-        amount += product_position.product.price * product_position.quantity
-        if product_position.quantity > product_position.product.quantity:
-            raise Exception("less product")
-
-    payment = Payment.create({
-        "amount": {
-            "value": amount.amount,
-            "currency": amount.currency
-        },
-        "confirmation": {
-            "type": "redirect",
-            "return_url": "127.0.0.0:8000/api/payment_succeed"
-        },
-        "capture": True,
-        "description": credentials
-    }, uuid.uuid4())
-
-    transaction = TransactionModel.objects.get_or_create(
-        form=form,
-        payment_id=payment.id,
-        payment_url=payment.confirmation.confirmation_url,
-        transaction_status='pending'
-    )[0]
-
-    transaction.save()
-    
+
+class EmptyOrderError(Exception):
+    pass
+
+
+class OutOfStockError(Exception):
+    pass
+
+
+async def create_payment(form, credentials) -> PaymentResult:
+    """
+    Creates a provider payment for the form, reusing its pending transaction.
+
+    The transaction row, with its idempotency key, is stored before the
+    provider is called, so a retried `/api/pay/` after a timeout resends the
+    same key and gets the same payment back instead of a second charge.
+    The form's stock is held together with that row (`stock.hold_stock`),
+    so concurrent checkouts cannot sell the same units twice.
+    """
+    transaction = await TransactionModel.objects.filter(form=form, transaction_status='pending').afirst()
+    if transaction is not None and transaction.payment_id:
+        return await aget_pending_payment(transaction)
+
+    if transaction is not None and transaction.amount is not None:
+        amount = transaction.amount
+    else:
+        subtotals = await aget_subtotals(form)
+        if not subtotals:
+            raise EmptyOrderError("no products were selected")
+
+        amount = get_total(subtotals)
+
+    if transaction is None:
+        transaction = TransactionModel(form=form, transaction_status='pending', amount=amount)
+
+    try:
+        held = await sync_to_async(hold_stock)(transaction)
+    except IntegrityError:
+        # A concurrent checkout of the form stored its pending transaction
+        # first; carry on with that one, so the provider sees its key.
+        transaction = await TransactionModel.objects.aget(form=form, transaction_status='pending')
+        if transaction.payment_id:
+            return await aget_pending_payment(transaction)
+
+        held = await sync_to_async(hold_stock)(transaction)
+
+    if not held:
+        raise OutOfStockError("less product")
+
+    with track_call('payment_provider', 'create_payment'):
+        payment = await get_payment_gateway().create_payment(
+            amount=amount.amount,
+            currency=str(amount.currency),
+            description=credentials,
+            return_url=RETURN_URL,
+            idempotency_key=transaction.idempotency_key,
+        )
+
+    transaction.payment_id = payment.id
+    transaction.payment_url = payment.confirmation_url or ''
+    await transaction.asave(update_fields=['payment_id', 'payment_url'])
 
     return payment
 
 
+async def aget_pending_payment(transaction) -> PaymentResult:
+    """
+    The transaction's open payment, with its stock held again: the hold is
+    extended, or taken anew if it expired while the payment was open.
+    """
+    if not await sync_to_async(hold_stock)(transaction):
+        raise OutOfStockError("less product")
+
+    return PaymentResult(
+        id=transaction.payment_id,
+        status='pending',
+        confirmation_url=transaction.payment_url,
+    )
+
+
 def get_payment_link(payment):
-    confirmation_url = payment.confirmation.confirmation_url
+    confirmation_url = payment.confirmation_url
     return confirmation_url
 
 
@@ -55,31 +105,49 @@ def get_payment_id(payment):
     return payment.id
 
 
-def get_payment_status(payment_id):
-    payment = Payment.find_one(payment_id)
-    return payment.status
+# Local transaction status for each provider payment status.
+PROVIDER_STATUSES: typing.Final[typing.Dict[str, str]] = {
+    'pending': 'pending',
+    'waiting_for_capture': 'pending',
+    'succeeded': 'paid',
+    'canceled': 'failed',
+}
 
 
 def payment_status_handler(payment_id, payment_status):
-    transaction = TransactionModel.objects.get(payment_id=payment_id)
-
-    if payment_status == 'pending':
-        transaction.transaction_status = 'pending'
-    elif payment_status == 'waiting_for_capture':
-        transaction.transaction_status = 'pending'
-    elif payment_status == 'succeeded':
-        if send_email(transaction.form.email):
-            transaction.transaction_status = 'paid'
-            TransactionModel.reduce_quantity(transaction)
-        else:
-            transaction.transaction_status = 'failed'
-            TransactionModel.revert_quantity(transaction)
-    elif payment_status == 'canceled':
-        transaction.transaction_status = 'failed'
-
-
-    logger.info(f"Transaction {transaction.id} has status {transaction.transaction_status}")
-    transaction.save()
+    """
+    Applies a provider status to the transaction and returns its local
+    status. Only a pending transaction moves; paid, failed and refunded are
+    final, so a late or reordered notification cannot take them back. The
+    change is a conditional UPDATE on the pending status, so when a webhook
+    and a status poll deliver the same news at once only the one that moves
+    the row enqueues settling, the order email or the stock release; the
+    transaction row itself is never re-saved.
+    """
+    transaction = TransactionModel.objects.only('transaction_status').get(payment_id=payment_id)
+    previous_status = transaction.transaction_status
+    new_status = PROVIDER_STATUSES.get(payment_status, previous_status)
+
+    if previous_status != 'pending' or new_status == previous_status:
+        return previous_status
+
+    with atomic():
+        updated = (
+            TransactionModel.objects
+            .filter(pk=transaction.pk, transaction_status='pending')
+            .update(transaction_status=new_status)
+        )
+        if not updated:
+            return TransactionModel.objects.values_list('transaction_status', flat=True).get(pk=transaction.pk)
+
+        if new_status == 'paid':
+            enqueue('settle_stock', {'transaction_id': transaction.id})
+            enqueue('send_order_email', {'transaction_id': transaction.id})
+        elif new_status == 'failed':
+            enqueue('release_stock_hold', {'transaction_id': transaction.id})
+
+    logger.info(f"Transaction {transaction.id} has status {new_status}")
+    return new_status
 
 
 def send_email(recipient_mail: str) -> bool:
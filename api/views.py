@@ -1,58 +1,261 @@
-from django.shortcuts import get_object_or_404
-
-from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView
-from rest_framework.decorators import api_view
+import json
+from decimal import Decimal, InvalidOperation
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Prefetch
+from django.http import Http404, HttpResponse, JsonResponse, QueryDict, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from rest_framework.generics import ListAPIView, ListCreateAPIView, RetrieveUpdateDestroyAPIView
+from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework.decorators import api_view
+from rest_framework.permissions import IsAdminUser
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.request import Request
+from rest_framework.views import exception_handler
+
+from .cache import catalog_cache
+from .cards import card_data, get_cards
+from .catalog import aget_image_ids, get_image_ids
+from .conditional import aget_table_version, async_table_condition, get_table_version, table_condition
+from .exports import (
+    CONTENT_TYPES,
+    aexport_orders,
+    encode_header,
+    encode_rows,
+    get_cart_items,
+    get_export_queryset,
+)
+from .fastjson import FastListSerializer, RawJSON
+from .filters import filter_products, filter_transactions
+from .jobs import queue_stats
+from .metrics import CanReadMetrics, TimedJSONRenderer, can_read_metrics, registry, track_serialization
+from .pagination import KeysetPagination
+from .polling import get_status_cache
 
 from .serializers import (
     ProductSerializer,
     ProductImageSerializer,
     FormSerializer,
-    ProductDetailSerializer
+    ProductDetailSerializer,
+    TransactionSerializer,
 )
 
+from .payments import PaymentGatewayError
+from .pricing import MixedCurrencyError
+from .search import SearchFilters, get_search_backend
+from .thumbnails import UnknownVariant, get_variant_file, variant_response
+from .files import HashingUploadHandler
+from .uploads import UploadError, append_chunk, complete_upload, discard_upload, start_upload
+
 from .utils import (
-    payment_status_handler,
-    get_payment_status,
     get_payment_id,
     get_payment_link,
-    create_payment
+    create_payment,
+    EmptyOrderError,
+    OutOfStockError,
+)
+
+from .webhooks import (
+    EVENT_ID_HEADER,
+    SIGNATURE_HEADER,
+    InvalidNotification,
+    WebhookNotConfigured,
+    ingest_notification,
+    verify_signature,
 )
 
 from .models import (
     ProductModel,
     ProductImageModel,
     ProductPositionModel,
-    FormModel
+    FormModel,
+    TransactionModel,
+    UploadModel,
 )
 
-class ProductView(ListCreateAPIView, RetrieveUpdateDestroyAPIView):
+MAX_BATCH_SIZE = 100
+
+
+def parse_id(value) -> int:
+    # Exactly integers: no booleans, floats or signs that int() would take.
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+
+    if isinstance(value, str):
+        value = value.strip()
+        if value.isascii() and value.isdigit():
+            return int(value)
+
+    raise ValidationError({'ids': 'ids must be integers'})
+
+
+def parse_ids(value):
+    """
+    Ids from `?ids=1,2,3` or a JSON list, deduplicated in request order.
+    """
+    if isinstance(value, str):
+        value = [part for part in value.split(',') if part.strip()]
+
+    if not isinstance(value, list) or not value:
+        raise ValidationError({'ids': 'expected a non-empty list of ids'})
+
+    ids = list(dict.fromkeys(parse_id(pk) for pk in value))
+
+    if len(ids) > MAX_BATCH_SIZE:
+        raise ValidationError({'ids': f'at most {MAX_BATCH_SIZE} ids per request'})
+
+    return ids
+
+
+class BatchLookupMixin:
+    """
+    Resolves up to MAX_BATCH_SIZE ids with one `in_bulk` query, for
+    `?ids=1,2,3` on the list and POST {"ids": [...]} on the batch route.
+    Results are keyed by id, with null and an entry in `not_found` for ids
+    that do not exist.
+    """
+
+    def get_batch_queryset(self):
+        return self.get_serializer_class().Meta.model.objects.all()
+
+    def get_batch_data(self, ids):
+        return self.batch_data(ids, self.get_batch_queryset().in_bulk(ids))
+
+    async def aget_batch_data(self, ids):
+        return self.batch_data(ids, await self.get_batch_queryset().ain_bulk(ids))
+
+    def batch_data(self, ids, found):
+        serialized = dict(zip(
+            [pk for pk in ids if pk in found],
+            self.get_serializer([found[pk] for pk in ids if pk in found], many=True).data,
+        ))
+        return {
+            'results': {str(pk): serialized.get(pk) for pk in ids},
+            'not_found': [pk for pk in ids if pk not in found],
+        }
+
+
+def prefetch_images():
+    return Prefetch('images', queryset=ProductImageModel.objects.order_by('pk'))
+
+
+class ProductView(BatchLookupMixin, ListCreateAPIView, RetrieveUpdateDestroyAPIView):
     serializer_class = ProductSerializer
+    pagination_class = KeysetPagination
+    cursor_ordering = ('title', 'id')
+    cached_query_params = (
+        'id', 'ids', 'title', 'brand', 'price_min', 'price_max', 'in_stock', 'cursor', 'page_size',
+    )
+    fast_serializer = FastListSerializer(ProductSerializer, related=['images'])
 
     def get_queryset(self):
         product_id = self.request.query_params.get('id')
         title = self.request.query_params.get('title')
 
+        queryset = filter_products(ProductModel.objects.prefetch_related(prefetch_images()), self.request.query_params)
+
         if product_id:
-            return ProductModel.objects.filter(id=product_id).first()
-        
+            return queryset.filter(id=product_id)
+
         if title:
-            return ProductModel.objects.filter(title=title)
+            return queryset.filter(title=title)
 
-        return ProductModel.objects.all()
+        return queryset
     
+    def get_batch_queryset(self):
+        return ProductModel.objects.prefetch_related(prefetch_images())
+
+    def get_cache_key(self, request, kwargs, version):
+        # Keyed on the table version in the database rather than only on the
+        # cache's own generation, which with the in-process backend moves
+        # just in the worker that wrote: every worker misses once any of
+        # them commits a catalog change.
+        params = [(param, request.query_params.get(param)) for param in self.cached_query_params]
+        return ('products', version.version, request.get_host(), kwargs.get('pk'), params)
+
+    @table_condition(ProductModel)
     def get(self, request, *args, **kwargs):
+        data = catalog_cache.get_or_set(
+            self.get_cache_key(request, kwargs, get_table_version(request, ProductModel)),
+            lambda: self.get_data(request, *args, **kwargs),
+        )
+        return Response(data, status=status.HTTP_200_OK)
+
+    def get_data(self, request, *args, **kwargs):
         if 'pk' in kwargs:
             product = get_object_or_404(ProductModel, id=kwargs['pk'])
             serializer = self.get_serializer(product)
-            return Response(serializer.data, status=status.HTTP_200_OK) 
+            return serializer.data
+
+        if 'ids' in request.query_params:
+            return self.get_batch_data(parse_ids(request.query_params['ids']))
 
         queryset = self.get_queryset()
+        if settings.FAST_SERIALIZATION:
+            return self.get_fast_data(queryset)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data).data
+
         serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return serializer.data
+
+    def get_fast_data(self, queryset):
+        """
+        The list as RawJSON, encoded from `values()` rows with the image ids
+        of the page fetched in one query.
+        """
+        queryset = queryset.prefetch_related(None).values(*self.fast_serializer.columns)
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else list(queryset)
+
+        images = get_image_ids([row['id'] for row in rows])
+        with track_serialization():
+            content = self.fast_serializer.encode(rows, {'images': images})
+        return RawJSON(self.paginator.get_paginated_content(content) if page is not None else content)
+
+    async def aget_fast_data(self, queryset):
+        queryset = queryset.prefetch_related(None).values(*self.fast_serializer.columns)
+        page = await self.paginator.apaginate_queryset(queryset, self.request, view=self)
+        rows = page if page is not None else [row async for row in queryset]
+
+        images = await aget_image_ids([row['id'] for row in rows])
+        with track_serialization():
+            content = self.fast_serializer.encode(rows, {'images': images})
+        return RawJSON(self.paginator.get_paginated_content(content) if page is not None else content)
+
+    async def aget_data(self, request, *args, **kwargs):
+        """
+        `get_data` on the async ORM. Images are prefetched, so serializing
+        needs no further queries from the event loop.
+        """
+        if 'pk' in kwargs:
+            product = await aget_object_or_404(ProductModel.objects.prefetch_related('images'), id=kwargs['pk'])
+            return self.get_serializer(product).data
+
+        if 'ids' in request.query_params:
+            return await self.aget_batch_data(parse_ids(request.query_params['ids']))
+
+        queryset = self.get_queryset()
+        if settings.FAST_SERIALIZATION:
+            return await self.aget_fast_data(queryset)
+
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data).data
+
+        serializer = self.get_serializer([product async for product in queryset], many=True)
+        return serializer.data
 
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -79,31 +282,68 @@ class ProductView(ListCreateAPIView, RetrieveUpdateDestroyAPIView):
         return Response({"message": "product was deleted successfully"}, status=status.HTTP_204_NO_CONTENT)
 
 
-class ProductImageView(ListCreateAPIView, RetrieveUpdateDestroyAPIView):
+class ProductImageView(BatchLookupMixin, ListCreateAPIView, RetrieveUpdateDestroyAPIView):
     serializer_class = ProductImageSerializer
     parser_classes = [MultiPartParser, FormParser]
+    pagination_class = KeysetPagination
+    cursor_ordering = ('title', 'id')
+
+    def initialize_request(self, request, *args, **kwargs):
+        # Spool uploads to disk while hashing them, instead of holding
+        # small files in memory and re-reading them for the checksum.
+        request.upload_handlers = [HashingUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
     
     def get_queryset(self):
         product_image_id = self.request.query_params.get('id')
         title = self.request.query_params.get('title')
 
         if product_image_id:
-            return ProductImageModel.objects.filter(id=product_image_id).first()
+            return ProductImageModel.objects.filter(id=product_image_id)
         
         if title:
             return ProductImageModel.objects.filter(title=title)
         
         return ProductImageModel.objects.all()
     
+    @table_condition(ProductImageModel)
     def get(self, request, *args, **kwargs):
+        return Response(self.get_data(request, *args, **kwargs), status=status.HTTP_200_OK)
+
+    def get_data(self, request, *args, **kwargs):
         if 'pk' in kwargs:
             product_image = get_object_or_404(ProductImageModel, id=kwargs['pk'])
             serializer = self.get_serializer(product_image)
-            return Response(serializer.data, status=status.HTTP_200_OK) 
+            return serializer.data
+
+        if 'ids' in request.query_params:
+            return self.get_batch_data(parse_ids(request.query_params['ids']))
 
         queryset = self.get_queryset()
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data).data
+
         serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return serializer.data
+
+    async def aget_data(self, request, *args, **kwargs):
+        if 'pk' in kwargs:
+            product_image = await aget_object_or_404(ProductImageModel, id=kwargs['pk'])
+            return self.get_serializer(product_image).data
+
+        if 'ids' in request.query_params:
+            return await self.aget_batch_data(parse_ids(request.query_params['ids']))
+
+        queryset = self.get_queryset()
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data).data
+
+        serializer = self.get_serializer([image async for image in queryset], many=True)
+        return serializer.data
 
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -112,19 +352,9 @@ class ProductImageView(ListCreateAPIView, RetrieveUpdateDestroyAPIView):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def put(self, request, *args, **kwargs):
-        product_image_id = kwargs.get('pk')
-        instance = ProductImageModel.objects.get(id=product_image_id)
-
-        excluded_fields  = None
-        if not('image' in request.data):
-            excluded_fields = ['image']
-
-        serializer = ProductImageSerializer(instance, excluded_fields=excluded_fields, partial=True)
-
-        serializer_data = serializer.data
-        serializer_data.update(request.data)
+        instance = get_object_or_404(ProductImageModel, id=kwargs.get('pk'))
 
-        serializer = ProductImageSerializer(instance, data=serializer_data, excluded_fields=excluded_fields, partial=True)
+        serializer = self.get_serializer(instance, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
         serializer.save()
         
@@ -136,37 +366,230 @@ class ProductImageView(ListCreateAPIView, RetrieveUpdateDestroyAPIView):
         return Response({"message": "contact was deleted successfully"}, status=status.HTTP_204_NO_CONTENT)
 
 
+def init_api_view(view_class, request, kwargs):
+    """
+    Builds a DRF view instance for its query and serializer helpers without
+    running the (synchronous) DRF dispatch.
+    """
+    view = view_class(args=(), kwargs=kwargs, format_kwarg=None)
+    view.request = Request(request)
+    return view
+
+
+def render_json(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(TimedJSONRenderer().render(data), content_type='application/json', status=status_code)
+
+
+def render_exception(ex, view):
+    response = exception_handler(ex, {'view': view, 'request': view.request})
+    if response is None:
+        raise ex
+
+    return render_json(response.data, response.status_code)
+
+
+@async_table_condition(ProductModel)
+async def product_read(request, *args, **kwargs):
+    view = init_api_view(ProductView, request, kwargs)
+    version = await aget_table_version(request, ProductModel)
+
+    try:
+        data = await catalog_cache.aget_or_set(
+            view.get_cache_key(view.request, kwargs, version),
+            lambda: view.aget_data(view.request, *args, **kwargs),
+        )
+    except (APIException, Http404) as ex:
+        return render_exception(ex, view)
+
+    return render_json(data)
+
+
+@async_table_condition(ProductImageModel)
+async def product_image_read(request, *args, **kwargs):
+    view = init_api_view(ProductImageView, request, kwargs)
+
+    try:
+        data = await view.aget_data(view.request, *args, **kwargs)
+    except (APIException, Http404) as ex:
+        return render_exception(ex, view)
+
+    return render_json(data)
+
+
+def batch_lookup(view_class, request, kwargs):
+    view = view_class(args=(), kwargs=kwargs, format_kwarg=None)
+    view.request = request
+    if not isinstance(request.data, dict):
+        raise ValidationError({'ids': 'expected a JSON object with an ids list'})
+
+    return Response(view.get_batch_data(parse_ids(request.data.get('ids'))))
+
+
+@api_view(['POST'])
+def product_batch(request, *args, **kwargs):
+    return batch_lookup(ProductView, request, kwargs)
+
+
+@api_view(['POST'])
+def product_image_batch(request, *args, **kwargs):
+    return batch_lookup(ProductImageView, request, kwargs)
+
+
+def read_write_view(read_view, view_class):
+    """
+    With ASYNC_READ_VIEWS, GET and HEAD are served by the native async
+    `read_view` and other methods by the DRF view in a worker thread;
+    otherwise the DRF view serves everything.
+    """
+    write_view = view_class.as_view()
+    if not settings.ASYNC_READ_VIEWS:
+        return write_view
+
+    write_view_async = sync_to_async(write_view)
+
+    @csrf_exempt
+    async def view(request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            return await read_view(request, *args, **kwargs)
+
+        return await write_view_async(request, *args, **kwargs)
+
+    return view
+
+
+def get_upload_state(request, upload):
+    return {
+        'id': upload.pk,
+        'filename': upload.filename,
+        'size': upload.size,
+        'offset': upload.offset,
+        'url': request.build_absolute_uri(reverse('product-image-upload', kwargs={'upload_id': upload.pk})),
+    }
+
+
+def upload_error_response(ex):
+    return Response({"error": str(ex)}, status=ex.status_code)
+
+
+@api_view(['POST'])
+def product_image_upload_start(request, *args, **kwargs):
+    """
+    Opens a resumable upload for `filename` of `size` bytes. Chunks are sent
+    with PATCH to the returned url, raw in the body, with `Upload-Offset`.
+    """
+    try:
+        upload = start_upload(request.data.get('filename') or 'image', int(request.data.get('size')))
+    except (TypeError, ValueError):
+        return Response({"error": "size must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+    except UploadError as ex:
+        return upload_error_response(ex)
+
+    return Response(get_upload_state(request, upload), status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET', 'PATCH', 'DELETE'])
+def product_image_upload(request, upload_id, *args, **kwargs):
+    if request.method == 'GET':
+        upload = get_object_or_404(UploadModel, pk=upload_id)
+    elif request.method == 'DELETE':
+        discard_upload(get_object_or_404(UploadModel, pk=upload_id))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    else:
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers.get('Content-Length') or 0)
+        except (KeyError, ValueError):
+            return Response({"error": "Upload-Offset header is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            upload = append_chunk(upload_id, offset, request.stream, length)
+        except UploadModel.DoesNotExist:
+            raise Http404("unknown upload")
+        except UploadError as ex:
+            return upload_error_response(ex)
+
+    response = Response(get_upload_state(request, upload))
+    response['Upload-Offset'] = upload.offset
+    return response
+
+
+@api_view(['POST'])
+def product_image_upload_complete(request, upload_id, *args, **kwargs):
+    title = request.data.get('title')
+    if not title:
+        return Response({"error": "title is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        serializer = complete_upload(upload_id, title, request.data.get('checksum'))
+    except UploadModel.DoesNotExist:
+        raise Http404("unknown upload")
+    except UploadError as ex:
+        return upload_error_response(ex)
+
+    return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+@require_GET
+def product_image_variant(request, pk, variant):
+    image = get_object_or_404(ProductImageModel.objects.only('image', 'checksum'), pk=pk)
+
+    try:
+        path = get_variant_file(image, variant)
+    except UnknownVariant:
+        raise Http404(f"unknown variant {variant}")
+
+    return variant_response(request, image, variant, path)
+
+
 class FormView(ListCreateAPIView, RetrieveUpdateDestroyAPIView):
     serializer_class = FormSerializer
+    pagination_class = KeysetPagination
+    cursor_ordering = ('id',)
+    fast_serializer = FastListSerializer(FormSerializer, related=['products'])
 
     def get_queryset(self):
         form_id = self.request.query_params.get('form_id')
+        queryset = FormModel.objects.prefetch_related(
+            Prefetch(
+                'productpositionmodel_set',
+                queryset=ProductPositionModel.objects.select_related('product').order_by('pk'),
+            )
+        )
 
         if form_id:
-            return FormModel.objects.filter(id=form_id).first()
+            return queryset.filter(id=form_id)
 
-        return FormModel.objects.all()
+        return queryset
     
     def get(self, request, *args, **kwargs):
         if 'pk' in kwargs:
-            product = get_object_or_404(FormModel, id=kwargs['pk'])
+            product = get_object_or_404(self.get_queryset(), id=kwargs['pk'])
             serializer = self.get_serializer(product)
             return Response(serializer.data, status=status.HTTP_200_OK) 
 
         queryset = self.get_queryset()
+        if settings.FAST_SERIALIZATION:
+            return Response(self.get_fast_data(queryset), status=status.HTTP_200_OK)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
-    
-    def post(self, request, *args, **kwargs):
-        form_id = request.data.get('form_id')    
-        form = get_object_or_404(FormModel, id=form_id)
 
-        product_positions = ProductPositionModel.objects.filter(form=form)
-
-        for product_position in product_positions:
-            if product_position.product.quantity < product_position.quantity:
-                return Response(data="less product in stock than requested", status=status.HTTP_409_CONFLICT)
+    def get_fast_data(self, queryset):
+        queryset = queryset.prefetch_related(None).values(*self.fast_serializer.columns)
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else list(queryset)
 
+        products = get_cart_items([row['id'] for row in rows])
+        with track_serialization():
+            content = self.fast_serializer.encode(rows, {'products': products})
+        return RawJSON(self.paginator.get_paginated_content(content) if page is not None else content)
+    
+    def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         serializer.save()
@@ -193,53 +616,264 @@ class FormView(ListCreateAPIView, RetrieveUpdateDestroyAPIView):
         return Response({"message": "form was deleted successfully"}, status=status.HTTP_204_NO_CONTENT)
 
 
+class TransactionView(ListAPIView):
+    # Same audience as orders_export: the list exposes every customer's payments.
+    permission_classes = [IsAdminUser]
+    serializer_class = TransactionSerializer
+    pagination_class = KeysetPagination
+    cursor_ordering = ('id',)
+
+    def get_queryset(self):
+        return filter_transactions(TransactionModel.objects.all(), self.request.query_params)
+
+
+@require_GET
+async def orders_export(request, *args, **kwargs):
+    """
+    Streams transactions joined with their orders as CSV or JSON lines
+    (`format`), one chunk of rows at a time, so memory stays flat however
+    long the range. Takes the transaction list filters; an interrupted
+    export resumes with `after` set to the last `transaction_id` received.
+    The rows carry customers' contact details, so it is for staff only.
+    """
+    user = await request.auser()
+    if not user.is_staff:
+        return JsonResponse({
+            "error": "staff only"
+        }, status=status.HTTP_403_FORBIDDEN)
+
+    fmt = request.GET.get('format', 'jsonl')
+    if fmt not in CONTENT_TYPES:
+        return JsonResponse({
+            "error": f"format must be one of {', '.join(CONTENT_TYPES)}"
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        after = int(request.GET['after']) if request.GET.get('after') else None
+    except ValueError:
+        return JsonResponse({
+            "error": "after must be a transaction id"
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        queryset = get_export_queryset(request.GET)
+    except ValidationError as ex:
+        return JsonResponse(ex.detail, status=status.HTTP_400_BAD_REQUEST)
+
+    async def stream():
+        yield encode_header(fmt)
+        async for rows in aexport_orders(queryset, after):
+            yield encode_rows(rows, fmt)
+
+    response = StreamingHttpResponse(stream(), content_type=CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="orders.{fmt}"'
+    return response
+
+
+class ProductCardView(ListAPIView):
+    """
+    Product cards with images and details embedded (api.cards), so a whole
+    catalog page comes from one query instead of a request per image.
+    """
+    pagination_class = KeysetPagination
+    cursor_ordering = ('title', 'product_id')
+
+    def get_queryset(self):
+        return get_cards().order_by(*self.cursor_ordering)
+
+    @table_condition(ProductModel)
+    def get(self, request, *args, **kwargs):
+        if 'pk' in kwargs:
+            card = get_object_or_404(self.get_queryset(), pk=kwargs['pk'])
+            return Response(card_data(card))
+
+        queryset = self.get_queryset()
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response([card_data(card) for card in page])
+
+        return Response([card_data(card) for card in queryset])
+
+
 class ProductDetailSerializer(ListCreateAPIView, RetrieveUpdateDestroyAPIView):
     serializer_class = ProductDetailSerializer
     
 
-@api_view(['POST'])
-def pay(request, *args, **kwargs):
-    form_id = request.data.get('form_id')
+def get_request_data(request):
+    """
+    The JSON object or form body of a plain Django request, as DRF's
+    `request.data` reads it. Raises ValueError for any other JSON.
+    """
+    if request.content_type == 'application/json':
+        data = json.loads(request.body or b'{}')
+        if not isinstance(data, dict):
+            raise ValueError("expected a JSON object")
+        return data
+
+    if request.method == 'POST':
+        return request.POST
+
+    if request.content_type == 'application/x-www-form-urlencoded':
+        return QueryDict(request.body)
+
+    return {}
+
+
+@csrf_exempt
+@require_POST
+async def pay(request, *args, **kwargs):
+    """
+    Async so that waiting on the payment provider does not hold a worker:
+    under ASGI many checkouts share one event loop.
+    """
+    try:
+        data = get_request_data(request)
+    except ValueError:
+        return JsonResponse({
+            "error": "expected a JSON object"
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    form_id = data.get('form_id')
     
-    form = get_object_or_404(FormModel, id=form_id)
+    form = await aget_object_or_404(FormModel, id=form_id)
 
-    product_positions = ProductPositionModel.objects.filter(form=form)
-    credentials = request.data.get('credentials')
+    credentials = data.get('credentials')
 
     if credentials is None:
-        return Response({
+        return JsonResponse({
             "error": "no credentials"
         })
 
-    if product_positions is None:
-        return Response({
+    try:
+        payment = await create_payment(form, credentials)
+    except EmptyOrderError:
+        return JsonResponse({
             "error": "no products were selected"
         })
-
-    payment = create_payment(product_positions, form, credentials)
-
-    return Response({
+    except OutOfStockError:
+        return JsonResponse({
+            "error": "less product in stock than requested"
+        }, status=status.HTTP_409_CONFLICT)
+    except MixedCurrencyError:
+        return JsonResponse({
+            "error": "products have different currencies"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except PaymentGatewayError:
+        return JsonResponse({
+            "error": "payment provider is unavailable"
+        }, status=status.HTTP_502_BAD_GATEWAY)
+
+    return JsonResponse({
         "payment_link": get_payment_link(payment),
         "payment_id": get_payment_id(payment)
     })
 
 
-@api_view(['GET'])
-def payment_status(request, *args, **kwargs):
-    payment_id = request.data.get('payment_id')
+@require_GET
+async def payment_status(request, *args, **kwargs):
+    payment_id = request.GET.get('payment_id')
     if payment_id is None:
-        return Response({
+        # Older clients send it in the body, which the view used to read.
+        try:
+            payment_id = get_request_data(request).get('payment_id')
+        except ValueError:
+            return JsonResponse({
+                "error": "expected a JSON object"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+    # Checkouts whose provider call failed keep a blank payment_id.
+    if not payment_id:
+        return JsonResponse({
             "error": "no payment_id"
-        })
+        }, status=status.HTTP_400_BAD_REQUEST)
 
-    pay_status = get_payment_status(payment_id)
-    payment_status_handler(payment_id, pay_status)
+    try:
+        pay_status = await get_status_cache().aget_status(payment_id)
+    except TransactionModel.DoesNotExist:
+        return JsonResponse({
+            "error": "unknown payment_id"
+        }, status=status.HTTP_404_NOT_FOUND)
 
-    return Response({
+    return JsonResponse({
         "status": pay_status
     })
 
 
+@csrf_exempt
+@require_POST
+def payment_webhook(request, *args, **kwargs):
+    try:
+        verified = verify_signature(request.body, request.META.get(SIGNATURE_HEADER, ''))
+    except WebhookNotConfigured:
+        # Not acknowledged, so the provider redelivers once the secret is set.
+        return JsonResponse({"error": "webhooks are not configured"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    if not verified:
+        return JsonResponse({"error": "invalid signature"}, status=status.HTTP_403_FORBIDDEN)
+
+    try:
+        payload = json.loads(request.body)
+        applied = ingest_notification(payload, request.META.get(EVENT_ID_HEADER))
+    except (ValueError, InvalidNotification):
+        return JsonResponse({"error": "malformed notification"}, status=status.HTTP_400_BAD_REQUEST)
+    except TransactionModel.DoesNotExist:
+        # Not acknowledged, so the provider redelivers once the transaction exists.
+        return JsonResponse({"error": "unknown payment"}, status=status.HTTP_404_NOT_FOUND)
+
+    return JsonResponse({"applied": applied})
+
+
 @api_view(['GET'])
 def payment_succeed(request, *args, **kwargs):
-    return Response()
\ No newline at end of file
+    return Response()
+
+
+MAX_SEARCH_LIMIT = 100
+
+
+@api_view(['GET'])
+def product_search(request, *args, **kwargs):
+    params = request.query_params
+
+    try:
+        filters = SearchFilters(
+            brand=params.get('brand') or None,
+            price_min=Decimal(params['price_min']) if params.get('price_min') else None,
+            price_max=Decimal(params['price_max']) if params.get('price_max') else None,
+            in_stock=params.get('in_stock') in ('1', 'true'),
+        )
+        limit = min(int(params.get('limit', 20)), MAX_SEARCH_LIMIT)
+        offset = int(params.get('offset', 0))
+    except (InvalidOperation, ValueError):
+        return Response({
+            "error": "invalid search parameters"
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    result = get_search_backend().search(params.get('q', ''), filters, limit=limit, offset=offset)
+    products = ProductModel.objects.in_bulk(result.ids)
+
+    return Response({
+        "count": result.count,
+        "results": ProductSerializer([products[pk] for pk in result.ids if pk in products], many=True).data,
+        "facets": result.facets,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([CanReadMetrics])
+def cache_stats(request, *args, **kwargs):
+    return Response(catalog_cache.stats())
+
+
+@api_view(['GET'])
+@permission_classes([CanReadMetrics])
+def job_stats(request, *args, **kwargs):
+    return Response(queue_stats())
+
+
+@require_GET
+def metrics(request, *args, **kwargs):
+    if not can_read_metrics(request):
+        return JsonResponse({"error": "forbidden"}, status=status.HTTP_403_FORBIDDEN)
+
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
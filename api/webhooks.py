@@ -0,0 +1,81 @@
+import hashlib
+import hmac
+import logging
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .models import PaymentEventModel
+from .utils import payment_status_handler
+
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = 'HTTP_X_WEBHOOK_SIGNATURE'
+EVENT_ID_HEADER = 'HTTP_X_WEBHOOK_EVENT_ID'
+
+
+class InvalidNotification(Exception):
+    pass
+
+
+class WebhookNotConfigured(Exception):
+    pass
+
+
+def sign_payload(body: bytes, secret: str = None) -> str:
+    secret = settings.PAYMENT_WEBHOOK_SECRET if secret is None else secret
+    if not secret:
+        raise WebhookNotConfigured("PAYMENT_WEBHOOK_SECRET is not set")
+
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(body: bytes, signature: str) -> bool:
+    expected = sign_payload(body)
+    if not signature:
+        return False
+
+    return hmac.compare_digest(expected, signature)
+
+
+def get_event_id(payload: dict, header_event_id: str = None) -> str:
+    if header_event_id:
+        return header_event_id
+
+    return f"{payload['object']['id']}:{payload['event']}"
+
+
+def ingest_notification(payload: dict, event_id: str = None) -> bool:
+    """
+    Records the notification and applies its payment status in one
+    transaction. Returns False for an already ingested event.
+    """
+    try:
+        event = payload['event']
+        payment = payload['object']
+        payment_id = payment['id']
+        payment_status = payment['status']
+    except (KeyError, TypeError):
+        raise InvalidNotification("malformed notification")
+
+    if not event.startswith('payment.'):
+        logger.info("Ignoring %s notification", event)
+        return False
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                PaymentEventModel.objects.create(
+                    event_id=get_event_id(payload, event_id),
+                    event=event,
+                    payment_id=payment_id,
+                    payload=payload,
+                )
+        except IntegrityError:
+            logger.info("Duplicate notification %s for payment %s", event, payment_id)
+            return False
+
+        payment_status_handler(payment_id, payment_status)
+
+    return True
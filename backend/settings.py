@@ -49,6 +49,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     "corsheaders.middleware.CorsMiddleware",
@@ -57,6 +58,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.ReplicaStickinessMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -83,21 +85,100 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 Configuration.account_id = 935732
 Configuration.secret_key = 'test_i5jIAtDyEPfGHl9aeabipourQnERBufwP7dUwoRu9cw'
 
+# Async payment provider client (api.payments). Use
+# 'api.payments.FakePaymentGateway' for offline runs and load tests.
+
+PAYMENT_GATEWAY = {
+    'BACKEND': os.environ.get('PAYMENT_GATEWAY', 'api.payments.YookassaGateway'),
+    'OPTIONS': {
+        'account_id': Configuration.account_id,
+        'secret_key': Configuration.secret_key,
+        'timeout': float(os.environ.get('PAYMENT_TIMEOUT', 10)),
+        'retries': int(os.environ.get('PAYMENT_RETRIES', 2)),
+    },
+}
+
+# Seconds stock stays held for an unpaid checkout before
+# `run_jobs` puts it back (api.stock.release_expired_holds)
+
+STOCK_HOLD_TTL = int(os.environ.get('STOCK_HOLD_TTL', 900))
+
+# HMAC-SHA256 key for /api/payment/webhook/ notifications (api.webhooks),
+# shared with the payment provider only. Notifications are refused while
+# it is unset.
+
+PAYMENT_WEBHOOK_SECRET = os.environ.get('PAYMENT_WEBHOOK_SECRET', '')
+
+# Status polls (api.polling): a pending payment is re-checked with the
+# provider at most once per TTL seconds per worker; paid, failed and
+# refunded ones are answered from memory.
+
+PAYMENT_STATUS_CACHE = {
+    'TTL': int(os.environ.get('PAYMENT_STATUS_TTL', 5)),
+    'MAX_ENTRIES': int(os.environ.get('PAYMENT_STATUS_MAX_ENTRIES', 10000)),
+}
+
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        # 'ENGINE': 'django.db.backends.postgresql',
-        # 'NAME': os.environ.get('POSTGRES_NAME'),
-        # 'USER': os.environ.get('POSTGRES_USER'),
-        # 'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
-        # 'HOST': 'db',
-        # 'PORT': 5432,
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Postgres when POSTGRES_NAME is set, SQLite otherwise. Each host in
+# POSTGRES_REPLICA_HOSTS becomes a `replica_<n>` alias that catalog reads are
+# routed to (api.routers.ReplicaRouter). Django 5.0 has no built-in pool:
+# connections persist per worker for CONN_MAX_AGE seconds, and with
+# POSTGRES_POOLER=pgbouncer (transaction pooling, see docker-compose.yaml)
+# server-side cursors are disabled as PgBouncer requires.
+
+def postgres_database(host, replica=False):
+    database = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('POSTGRES_NAME'),
+        'USER': os.environ.get('POSTGRES_USER'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
+        'HOST': host,
+        'PORT': int(os.environ.get('POSTGRES_PORT', 5432)),
+        'CONN_MAX_AGE': int(os.environ.get('CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('POSTGRES_POOLER') == 'pgbouncer',
+        'OPTIONS': {
+            'connect_timeout': int(os.environ.get('POSTGRES_CONNECT_TIMEOUT', 5)),
+        },
     }
-}
+    if replica:
+        database['TEST'] = {'MIRROR': 'default'}
+
+    return database
+
+
+if os.environ.get('POSTGRES_NAME'):
+    DATABASES = {
+        'default': postgres_database(os.environ.get('POSTGRES_HOST', 'db')),
+    }
+    replica_hosts = [host for host in os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(',') if host]
+    for index, host in enumerate(replica_hosts):
+        DATABASES[f'replica_{index}'] = postgres_database(host, replica=True)
+
+    DATABASE_REPLICAS = [f'replica_{index}' for index in range(len(replica_hosts))]
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            # A file rather than the shared-cache in-memory database, which
+            # fails concurrent writers at once instead of letting them wait
+            # for the lock; the stock hold stress test needs the latter.
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+            # Seconds a writer waits for the database lock.
+            'OPTIONS': {'timeout': 30},
+        },
+    }
+    DATABASE_REPLICAS = []
+
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+
+# Seconds a client keeps reading from the primary after it wrote something,
+# e.g. after checkout, so it sees its own changes despite replication lag.
+
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
 
 
 # Password validation
@@ -132,6 +213,28 @@ LOGGING = {
     },
 }
 
+# Request metrics served at /api/metrics/ (api.middleware.MetricsMiddleware).
+# Latency is recorded for every request; query counts and times,
+# serialization time and response sizes only for a SAMPLE_RATE share of
+# them, and slow requests are logged with their SQL only with LOG_SQL. Both
+# are off unless enabled. The metrics and stats endpoints are for staff
+# users, or for a scraper sending `Authorization: Bearer <TOKEN>`.
+
+METRICS = {
+    'ENABLED': os.environ.get('METRICS_ENABLED', '1') == '1',
+    'SAMPLE_RATE': float(os.environ.get('METRICS_SAMPLE_RATE', 0)),
+    'SLOW_REQUEST_MS': int(os.environ.get('METRICS_SLOW_REQUEST_MS', 500)),
+    'LOG_SQL': os.environ.get('METRICS_LOG_SQL', '0') == '1',
+    'TOKEN': os.environ.get('METRICS_TOKEN', ''),
+}
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.metrics.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
 
@@ -147,6 +250,32 @@ USE_TZ = True
 
 CORS_ALLOW_ALL_ORIGINS = True
 
+# Serve catalog GET requests with native async views (api.views.read_write_view);
+# writes keep going through DRF.
+
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS', '1') == '1'
+
+# Keyset pagination for list endpoints (api.pagination.KeysetPagination)
+
+PAGINATION_PAGE_SIZE = int(os.environ.get('PAGINATION_PAGE_SIZE', 50))
+
+# Encode product and order lists from values() rows (api.fastjson) instead of
+# running the DRF serializers per object; the output is the same bytes.
+
+FAST_SERIALIZATION = os.environ.get('FAST_SERIALIZATION', '1') == '1'
+
+# Catalog response cache (api.cache). Switch BACKEND to
+# 'api.cache.RedisCacheBackend' with OPTIONS {'url': 'redis://...'} to share it
+# between workers.
+
+CATALOG_CACHE = {
+    'BACKEND': 'api.cache.LRUCacheBackend',
+    'OPTIONS': {
+        'max_entries': int(os.environ.get('CATALOG_CACHE_MAX_ENTRIES', 1024)),
+    },
+    'TIMEOUT': int(os.environ.get('CATALOG_CACHE_TIMEOUT', 300)),
+}
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/3.2/howto/static-files/
 
@@ -154,6 +283,32 @@ STATIC_URL = '/gstatic/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Product image derivatives (api.thumbnails), cached on disk under a key
+# derived from the source checksum and the variant spec. Set
+# THUMBNAIL_ACCEL_REDIRECT to an nginx `internal` location mapped to ROOT to
+# let the proxy send cache hits itself.
+
+THUMBNAILS = {
+    'ROOT': os.environ.get('THUMBNAIL_ROOT', os.path.join(MEDIA_ROOT, 'thumbnails')),
+    'ACCEL_REDIRECT': os.environ.get('THUMBNAIL_ACCEL_REDIRECT'),
+    'EAGER': os.environ.get('THUMBNAIL_EAGER', '1') == '1',
+    'MAX_AGE': 365 * 24 * 60 * 60,
+    'VARIANTS': {
+        'small': {'width': 160, 'height': 160, 'format': 'WEBP', 'quality': 80},
+        'medium': {'width': 480, 'height': 480, 'format': 'WEBP', 'quality': 80},
+        'large': {'width': 1200, 'height': 1200, 'format': 'JPEG', 'quality': 85},
+    },
+}
+
+# Resumable product image uploads (api.uploads): partial files live in ROOT
+# until completed; sessions idle for EXPIRE_AFTER seconds are pruned.
+
+RESUMABLE_UPLOADS = {
+    'ROOT': os.environ.get('UPLOAD_ROOT', os.path.join(MEDIA_ROOT, 'uploads')),
+    'MAX_SIZE': int(os.environ.get('UPLOAD_MAX_SIZE', 50 * 1024 * 1024)),
+    'EXPIRE_AFTER': int(os.environ.get('UPLOAD_EXPIRE_AFTER', 24 * 60 * 60)),
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,50 @@
+"""
+Production profile, selected with
+DJANGO_SETTINGS_MODULE=backend.settings_production and served by
+`manage.py serve` (multi-process ASGI).
+"""
+
+import os
+
+from .settings import *  # noqa: F401,F403
+
+
+DEBUG = False
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', SECRET_KEY)
+
+ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', '*').split(',')
+
+ASYNC_READ_VIEWS = True
+
+# Keep connections open between requests and check them before reuse.
+# `manage.py serve` lowers CONN_MAX_AGE to 0 for ASGI workers, where Django
+# runs each request's queries on a fresh thread and a kept connection would
+# never be reused.
+
+for database in DATABASES.values():
+    database['CONN_MAX_AGE'] = int(os.environ.get('CONN_MAX_AGE', 60))
+    database['CONN_HEALTH_CHECKS'] = True
+
+# No per-query debug logging; warnings and errors only.
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': os.environ.get('DJANGO_LOG_LEVEL', 'WARNING'),
+    },
+    'loggers': {
+        'django.db.backends': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,16 @@
+"""
+Test profile, selected by `manage.py test` unless DJANGO_SETTINGS_MODULE
+says otherwise.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+
+# Separate file used as a replica stand-in by the router tests; it is not
+# replicated, so it is not listed in DATABASE_REPLICAS.
+
+if 'replica_0' not in DATABASES:
+    DATABASES['replica_0'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.replica.sqlite3',
+    }